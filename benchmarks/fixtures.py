@@ -0,0 +1,11 @@
+"""Synthetic Piazza data sized like a real class
+
+The generators live in :mod:`piazza_api.synthetic`, which the simulator
+shares; the benchmarks always use the default seed.
+"""
+from piazza_api.synthetic import (NUM_NETWORKS, NUM_POSTS, NUM_USERS,
+                                  feed_item, make_feed, make_post,
+                                  make_status, make_users, post_id)
+
+__all__ = ["NUM_NETWORKS", "NUM_POSTS", "NUM_USERS", "feed_item",
+           "make_feed", "make_post", "make_status", "make_users", "post_id"]
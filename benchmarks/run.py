@@ -0,0 +1,295 @@
+"""Client-side CPU benchmarks
+
+Measures the hot paths of the client on their own: nothing leaves the
+process, as requests are answered by :class:`FakeAdapter` from synthetic
+data sized like a real class (10k posts, 5k users).
+
+Usage::
+
+    python -m benchmarks.run                        # print results
+    python -m benchmarks.run --json results.json    # also save them
+    python -m benchmarks.run --compare baseline.json --threshold 0.10
+
+With ``--compare``, the exit status is 1 if any benchmark got slower than
+in the baseline by more than ``--threshold`` (a fraction), so it can gate
+a release. Compare runs made on the same machine with the same Python.
+
+Measurements are made to be comparable on a shared machine:
+
+- Rounds are timed in CPU time of this process, which leaves out the
+  time other processes (or, on a virtual machine, other guests) hold
+  the CPU.
+- Each round makes enough calls to take at least ``--min-time`` seconds,
+  so that short benchmarks are not timed at the clock's resolution.
+- A CPU busy with other work still runs this process more slowly, and
+  that changes over seconds. So a fixed reference workload is timed
+  before every round, and benchmarks are compared by their fastest round
+  relative to the fastest round of the reference.
+
+Benchmarks that seem slower are run again (``--reruns``) before being
+reported.
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+
+import piazza_api
+from piazza_api import Piazza
+from piazza_api.exceptions import RequestError
+from piazza_api.nonce import _int2base, nonce
+from piazza_api.rpc import PiazzaRPC
+from piazza_api.session import make_session
+from piazza_api.stream import iter_json_array
+
+from benchmarks import fixtures
+from benchmarks.transport import FakeAdapter
+
+NID = "nbenchmark"
+
+#: Default shortest duration of a round, in seconds
+MIN_TIME = 0.02
+
+
+def _client(adapter):
+    rpc = PiazzaRPC(network_id=NID, session=make_session(adapter=adapter))
+    rpc.set_cookies({"session_id": "benchmark"})
+    return rpc
+
+
+def benchmarks(adapter):
+    """Return ``{name: (function, least number of calls per round)}``"""
+    rpc = _client(adapter)
+    network = Piazza(rpc).network(NID)
+    feed_body = json.dumps({"result": adapter.feed,
+                            "error": None}).encode("utf-8")
+    users_body = adapter.bodies["network.get_all_users"]
+    ok = {"result": {"id": "p1"}, "error": None}
+    error = {"result": None, "error": "The post you are looking for "
+                                      "cannot be found"}
+    status = fixtures.make_status()
+    timestamp = int(time.time() * 1000)
+
+    def stream_feed():
+        chunks = (feed_body[i:i + 65536]
+                  for i in range(0, len(feed_body), 65536))
+        for _ in iter_json_array(chunks, ("result", "feed")):
+            pass
+
+    def feed_to_cids():
+        for _ in (item["id"] for item in network.iter_feed(page_size=1000)):
+            pass
+
+    def handle_error_raise():
+        try:
+            rpc._handle_error(error, "Could not get post")
+        except RequestError:
+            pass
+
+    def iter_all_posts():
+        for _ in network.iter_all_posts(limit=500, page_size=500):
+            pass
+
+    return {
+        "nonce": (nonce, 10000),
+        "int2base": (lambda: _int2base(timestamp, 36), 10000),
+        "prepare_request": (
+            lambda: rpc._prepare_request("content.get", {"cid": "p1"}, None,
+                                         "nid", "logic", "benchmark"),
+            10000),
+        "handle_error": (lambda: rpc._handle_error(ok, "Could not get post"),
+                         100000),
+        "handle_error_raise": (handle_error_raise, 10000),
+        "decode_feed": (lambda: rpc.json_backend.loads(feed_body), 5),
+        "decode_users": (lambda: rpc.json_backend.loads(users_body), 10),
+        "stream_feed": (stream_feed, 2),
+        "user_classes": (lambda: Piazza._classes_from_status(status), 1000),
+        "request_content_get": (lambda: rpc.content_get("p1"), 1000),
+        "feed_to_cids": (feed_to_cids, 2),
+        "iter_all_posts_500": (iter_all_posts, 1),
+    }
+
+
+def reference_workload():
+    """Return the workload the benchmarks are timed relative to
+
+    It decodes and encodes a few synthetic posts with the standard
+    library, so a busy machine slows it down much like the benchmarks,
+    but changes to the client do not.
+    """
+    body = json.dumps([fixtures.make_post(nr) for nr in range(1, 11)])
+
+    def reference():
+        json.dumps(json.loads(body), sort_keys=True)
+    return reference
+
+
+def autorange(func, number, min_time=MIN_TIME):
+    """Number of calls of ``func``, from ``number`` on and doubling, that
+    take at least ``min_time`` seconds of CPU time
+    """
+    while _time(func, number) * number < min_time:
+        number *= 2
+    return number
+
+
+def measure(func, number, rounds, reference=None):
+    """Time ``rounds`` rounds of ``number`` calls of ``func`` in CPU time
+
+    :type reference: tuple|None
+    :param reference: ``(function, number of calls)`` timed in a round of
+        its own before each round of ``func``
+    :returns: Tuple of the seconds per call of ``func`` in each round and
+        of the reference in each round
+    """
+    func()  # Warm up caches
+    times = []
+    reference_times = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            if reference is not None:
+                reference_times.append(_time(*reference))
+            times.append(_time(func, number))
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return times, reference_times
+
+
+def _time(func, number):
+    """CPU seconds per call of ``number`` calls of ``func``"""
+    start = time.process_time()
+    for _ in range(number):
+        func()
+    return (time.process_time() - start) / number
+
+
+def run(rounds=15, only=None, min_time=MIN_TIME):
+    """Run the benchmarks and return the results as a JSON-able dict"""
+    adapter = FakeAdapter()
+    reference = reference_workload()
+    reference = (reference, autorange(reference, 1, min_time))
+    results = {}
+    for name, (func, number) in sorted(benchmarks(adapter).items()):
+        if only and name not in only:
+            continue
+        number = autorange(func, number, min_time)
+        times, reference_times = measure(func, number, rounds, reference)
+        results[name] = {
+            "median": statistics.median(times),
+            "min": min(times),
+            "relative": min(times) / min(reference_times),
+            "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+            "rounds": rounds,
+            "number": number,
+        }
+    rpc = _client(adapter)
+    return {
+        "meta": {
+            "piazza_api": piazza_api.__version__,
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "json_backend": rpc.json_backend.name,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold, verbose=True):
+    """Compare the fastest rounds, relative to the reference workload,
+    with those of ``baseline``
+
+    :returns: Names of the benchmarks slower than the baseline by more
+        than ``threshold``
+    """
+    regressions = []
+    for name, result in sorted(results["results"].items()):
+        base = baseline["results"].get(name)
+        if base is None or "relative" not in base:
+            continue
+        change = result["relative"] / base["relative"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        if verbose:
+            print("{:<22} {:>+8.1%}{}".format(name, change, flag))
+    return regressions
+
+
+def confirm(results, baseline, threshold, rounds, reruns,
+            min_time=MIN_TIME):
+    """Run the benchmarks that seem slower than ``baseline`` again,
+    keeping the fastest result of each, to rule out noise
+
+    :returns: Names of the benchmarks still slower than the baseline by
+        more than ``threshold``
+    """
+    regressions = compare(results, baseline, threshold, verbose=False)
+    for _ in range(reruns):
+        if not regressions:
+            break
+        rerun = run(rounds, regressions, min_time)
+        for name, result in rerun["results"].items():
+            if result["relative"] < results["results"][name]["relative"]:
+                results["results"][name] = result
+        regressions = compare(results, baseline, threshold, verbose=False)
+    return regressions
+
+
+def _format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return "{:.3g} {}".format(seconds / scale, unit)
+    return "{:.3g} ns".format(seconds / 1e-9)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=15)
+    parser.add_argument("--only", nargs="*", metavar="NAME",
+                        help="Only run these benchmarks")
+    parser.add_argument("--json", metavar="PATH",
+                        help="Write the results to this file")
+    parser.add_argument("--compare", metavar="PATH",
+                        help="Baseline results to compare with")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME,
+                        help="Shortest duration of a round, in seconds")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Allowed slowdown relative to the baseline")
+    parser.add_argument("--reruns", type=int, default=3,
+                        help="Times a benchmark that seems slower than the "
+                             "baseline is run again before it is reported")
+    args = parser.parse_args(argv)
+
+    results = run(args.rounds, args.only, args.min_time)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        confirm(results, baseline, args.threshold, args.rounds,
+                args.reruns, args.min_time)
+    for name, result in sorted(results["results"].items()):
+        print("{:<22} {:>10} per call (+/- {})".format(
+            name, _format_time(result["median"]),
+            _format_time(result["stdev"])))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        print()
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""In-process stand-in for piazza.com used by the benchmarks
+
+:class:`FakeAdapter` is mounted on the client's session in place of the
+real HTTP adapter, so requests go through all of the client's own code but
+never touch a socket.
+"""
+import json
+
+import requests
+from requests.adapters import BaseAdapter
+from six.moves.urllib.parse import parse_qs, urlparse
+
+from benchmarks import fixtures
+
+
+class FakeAdapter(BaseAdapter):
+    """Answer API requests from synthetic class data
+
+    Response bodies are encoded once and reused, so that the benchmarks
+    measure the client and not the encoding of its responses;
+    :attr:`bodies` maps method names to the bodies of the methods that
+    take no parameters.
+
+    :type num_posts: int
+    :param num_posts: Number of posts in the fake class
+    :type num_users: int
+    :param num_users: Number of users in the fake class
+    """
+    def __init__(self, num_posts=fixtures.NUM_POSTS,
+                 num_users=fixtures.NUM_USERS):
+        super(FakeAdapter, self).__init__()
+        self.num_posts = num_posts
+        self.num_users = num_users
+        self.feed = fixtures.make_feed(num_posts)
+        self._posts = {}
+        # (offset, limit) -> body
+        self._pages = {}
+        self.bodies = {
+            "network.get_all_users": _ok(fixtures.make_users(num_users)),
+            "user.status": _ok(fixtures.make_status()),
+        }
+
+    def send(self, request, **kwargs):
+        method = parse_qs(urlparse(request.url).query)["method"][0]
+        params = json.loads(request.body or "{}").get("params", {})
+        if method == "content.get":
+            body = self._post(params["cid"])
+        elif method == "network.get_my_feed":
+            body = self._page(params.get("offset", 0),
+                              params.get("limit", 100))
+        elif method in self.bodies:
+            body = self.bodies[method]
+        else:
+            body = _ok({})
+        return _response(request, body)
+
+    def close(self):
+        pass
+
+    def _post(self, cid):
+        body = self._posts.get(cid)
+        if body is None:
+            cid = str(cid)
+            nr = int(cid[1:]) if cid.startswith("p") else int(cid)
+            body = self._posts[cid] = _ok(fixtures.make_post(nr))
+        return body
+
+    def _page(self, offset, limit):
+        body = self._pages.get((offset, limit))
+        if body is None:
+            body = self._pages[offset, limit] = _ok(dict(
+                self.feed, feed=self.feed["feed"][offset:offset + limit]))
+        return body
+
+
+def _ok(result):
+    return json.dumps({"result": result, "error": None}).encode("utf-8")
+
+
+def _response(request, body):
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["Content-Type"] = "application/json"
+    response._content = body
+    response._content_consumed = True
+    response.url = request.url
+    response.request = request
+    response.encoding = "utf-8"
+    return response
@@ -1,3 +1,4 @@
 from piazza_api.piazza import Piazza
+from piazza_api.aio import AsyncPiazza
 
 __version__ = "0.14.1"
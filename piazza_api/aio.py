@@ -0,0 +1,918 @@
+"""asyncio flavour of the Piazza client
+
+Requires ``aiohttp`` (``pip install piazza-api[async]``). Every method that
+talks to Piazza is a coroutine; nonce generation, login/CSRF parsing and
+error handling are shared with the synchronous :class:`PiazzaRPC`.
+"""
+import asyncio
+import functools
+import getpass
+import warnings
+
+import six.moves
+
+try:
+    import aiohttp
+    from yarl import URL
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+from piazza_api.coalesce import AsyncSingleFlight
+from piazza_api.exceptions import NotAuthenticatedError, RequestError
+from piazza_api.models import FeedItem, Post, User
+from piazza_api.network import (FEED_FIELDS, Network, SyncResult,
+                                 _diff_feed, _markers, _merge_feed_item)
+from piazza_api.piazza import Piazza
+from piazza_api.pool import aimap
+from piazza_api.projection import project
+from piazza_api.retry import RetryPolicy
+from piazza_api.serialization import get_backend
+from piazza_api.rpc import (_CID_PARAMS, _STREAM_CHUNK_SIZE, PiazzaRPC,
+                            _is_error)
+from piazza_api.stream import JSONArrayStream
+from piazza_api.tracing import traced
+
+
+class AsyncPiazzaRPC(PiazzaRPC):
+    """asyncio version of :class:`PiazzaRPC`
+
+    Example:
+        >>> p = AsyncPiazzaRPC("hl5qm84dl4t3x2")
+        >>> await p.user_login()
+        Email: ...
+        Password: ...
+        >>> await p.content_get(181)
+        ...
+
+    :type  network_id: str|None
+    :param network_id: This is the ID of the network (or class) from which
+        to query posts
+    :type  session: aiohttp.ClientSession|None
+    :param session: Session to use; one is created lazily on first use if
+        not given
+    :type  pool_maxsize: int
+    :param pool_maxsize: Maximum number of simultaneous connections for the
+        session created by this client (0 for no limit); further requests
+        wait for a free connection
+    :type  keep_alive: int
+    :param keep_alive: Seconds an idle connection is kept open for reuse
+    :type  rate_limiter: :class:`RateLimiter`|None
+    :param rate_limiter: If given, every request waits for a slot from this
+        limiter before being sent
+    :type  retry_policy: :class:`RetryPolicy`|None
+    :param retry_policy: When to retry requests that failed for transient
+        reasons; defaults to ``RetryPolicy()``
+    :type  post_cache: :class:`PostCache`|None
+    :param post_cache: Cache for ``content_get`` results; a cache with a
+        disk tier is called from the default executor, so that its SQLite
+        reads and writes do not block the event loop
+    :type  json_backend: str|:class:`JSONBackend`|None
+    :param json_backend: JSON implementation to use; defaults to the
+        fastest one installed
+    :type  single_flight: :class:`AsyncSingleFlight`|bool|None
+    :param single_flight: Coalesces identical concurrent read requests;
+        defaults to a new :class:`AsyncSingleFlight`, ``False`` disables it
+    :type  metrics: :class:`Metrics`|None
+    :param metrics: If given, request metrics are recorded in it
+    :type  tracer: :class:`Tracer`|None
+    :param tracer: If given, every request is traced
+    :type  base_url: str|None
+    :param base_url: Where Piazza is served from; see :class:`PiazzaRPC`
+    """
+    _single_flight_cls = AsyncSingleFlight
+    # A plain attribute here: one aiohttp session serves the whole loop
+    session = None
+
+    def __init__(self, network_id=None, session=None, pool_maxsize=100,
+                 keep_alive=60, rate_limiter=None, retry_policy=None,
+                 post_cache=None, json_backend=None, single_flight=None,
+                 metrics=None, tracer=None, base_url=None):
+        self._nid = network_id
+        self.base_url = base_url
+        self._pool_maxsize = pool_maxsize
+        self._keep_alive = keep_alive
+        self.session = session
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.post_cache = post_cache
+        self.json_backend = get_backend(json_backend)
+        self.single_flight = self._single_flight(single_flight)
+        self.metrics = metrics
+        self.tracer = tracer
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Close the underlying ``aiohttp`` session"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def get_cookies(self):
+        """Export the session cookies.
+
+        :returns: Dictionary containing all session cookies associated with current login.
+        :rtype: dict
+        """
+        if self.session is None:
+            return {}
+        return {c.key: c.value for c in self.session.cookie_jar}
+
+    def set_cookies(self, cookies):
+        """Import the session cookies.
+
+        :type  cookies: dict
+        :param cookies: The session cookies (obtained using get_cookies or from a browser)
+        """
+        self._get_session().cookie_jar.update_cookies(
+            cookies, response_url=URL(self.base_url))
+
+    async def user_login(self, email=None, password=None):
+        """Coroutine version of :meth:`PiazzaRPC.user_login`"""
+        session = self._get_session()
+
+        async with session.get(self.base_url + '/main/csrf_token') as response:
+            csrf_token = self._parse_csrf_token(await response.text())
+
+        email = six.moves.input("Email: ") if email is None else email
+        password = getpass.getpass() if password is None else password
+
+        async with session.post(
+            self.base_url + '/class',
+            data=self._login_data(email, password, csrf_token),
+            skip_auto_headers=("Content-Type",)
+        ) as response:
+            self._check_login_response(response.status, await response.text())
+
+    async def demo_login(self, auth=None, url=None):
+        """Coroutine version of :meth:`PiazzaRPC.demo_login`"""
+        assert all([
+            auth or url,  # Must provide at least one
+            not (auth and url)  # Cannot provide more than one
+        ])
+        session = self._get_session()
+        if url is None:
+            url = self.base_url + "/demo_login"
+            params = dict(nid=self._nid, auth=auth)
+            async with session.get(url, params=params) as res:
+                await res.read()
+        else:
+            async with session.get(url) as res:
+                await res.read()
+
+    async def content_get(self, cid, nid=None, cached=True):
+        """Coroutine version of :meth:`PiazzaRPC.content_get`"""
+        if cached and self.post_cache is not None:
+            post = await self._call_cache(self.post_cache.get,
+                                          nid if nid else self._nid, cid)
+            if post is not None:
+                return post
+
+        r = await self.request(
+            method="content.get",
+            data={"cid": cid, "student_view": None},
+            nid=nid
+        )
+        post = self._handle_error(r, "Could not get post {}.".format(cid))
+        if self.post_cache is not None:
+            await self._call_cache(self.post_cache.put,
+                                   nid if nid else self._nid, cid, post)
+        return post
+
+    async def content_create(self, params):
+        """Coroutine version of :meth:`PiazzaRPC.content_create`"""
+        r = await self.request(
+            method="content.create",
+            data=params
+        )
+        return self._handle_error(
+            r,
+            "Could not create object {}.".format(repr(params))
+        )
+
+    async def content_update(self, params):
+        """Coroutine version of :meth:`PiazzaRPC.content_update`"""
+        r = await self.request(
+            method="content.update",
+            data=params
+        )
+        return self._handle_error(
+            r,
+            "Could not create object {}.".format(repr(params))
+        )
+
+    async def content_instructor_answer(self, params):
+        """Coroutine version of :meth:`PiazzaRPC.content_instructor_answer`"""
+        r = await self.request(
+            method="content.answer",
+            data=params
+        )
+        return self._handle_error(r, "Could not create object {}.".format(
+                                     repr(params)))
+
+    async def content_student_answer(self, cid, content, revision=1,
+                                     anon=False):
+        """Coroutine version of :meth:`PiazzaRPC.content_student_answer`"""
+        r = await self.request(
+            method="content.answer",
+            data={
+                "content": content,
+                "type": "s_answer",
+                "anonymous": "stud" if anon else "no",
+                "revision": revision,
+                "cid": cid
+                }
+            )
+        return self._handle_error(r, "Could not update answer {}.".format(cid))
+
+    async def content_mark_duplicate(self, params):
+        """Coroutine version of :meth:`PiazzaRPC.content_mark_duplicate`"""
+        r = await self.request(
+            method="content.duplicate",
+            data=params
+        )
+        return self._handle_error(r, "Could not create object {}.".format(
+                                     repr(params)))
+
+    async def content_mark_resolved(self, params):
+        """Coroutine version of :meth:`PiazzaRPC.content_mark_resolved`"""
+        r = await self.request(
+            method="content.mark_resolved",
+            data=params
+        )
+        return self._handle_error(r, "Could not create object {}.".format(
+                                     repr(params)))
+
+    async def content_pin(self, params, unpin=False):
+        """Coroutine version of :meth:`PiazzaRPC.content_pin`"""
+        method = "content.unpin" if unpin else "content.pin"
+        r = await self.request(
+            method=method,
+            data=params
+        )
+        return self._handle_error(r, "Could not create object {}.".format(
+                                     repr(params)))
+
+    async def content_delete(self, params):
+        """Coroutine version of :meth:`PiazzaRPC.content_delete`"""
+        r = await self.request(
+            method="content.delete",
+            data=params
+        )
+        return self._handle_error(r, "Could not create object {}.".format(
+            repr(params)))
+
+    async def content_add_feedback(self, params):
+        """Coroutine version of :meth:`PiazzaRPC.content_add_feedback`"""
+        r = await self.request(
+            method="content.add_feedback",
+            data=params
+        )
+        return self._handle_error(r, "Could not create object {}.".format(
+            repr(params)))
+
+    async def content_remove_feedback(self, params):
+        """Coroutine version of :meth:`PiazzaRPC.content_remove_feedback`"""
+        r = await self.request(
+            method="content.remove_feedback",
+            data=params
+        )
+        return self._handle_error(r, "Could not create object {}.".format(
+            repr(params)))
+
+    async def add_students(self, student_emails, nid=None):
+        """Coroutine version of :meth:`PiazzaRPC.add_students`"""
+        r = await self.request(
+            method="network.update",
+            data={
+                "from": "ClassSettingsPage",
+                "add_students": student_emails
+            },
+            nid=nid,
+            nid_key="id"
+        )
+        return self._handle_error(r, "Could not add users.")
+
+    async def get_all_users(self, nid=None):
+        """Coroutine version of :meth:`PiazzaRPC.get_all_users`"""
+        r = await self.request(
+            method="network.get_all_users",
+            nid=nid
+        )
+        return self._handle_error(r, "Could not get users.")
+
+    async def iter_all_users(self, nid=None):
+        """Asynchronous version of :meth:`PiazzaRPC.iter_all_users`"""
+        async for user in self.request_stream(
+            method="network.get_all_users",
+            nid=nid,
+            path=("result",),
+            err_msg="Could not get users."
+        ):
+            yield user
+
+    async def get_users(self, user_ids, nid=None):
+        """Coroutine version of :meth:`PiazzaRPC.get_users`"""
+        r = await self.request(
+            method="network.get_users",
+            data={"ids": user_ids},
+            nid=nid
+        )
+        return self._handle_error(r, "Could not get users.")
+
+    async def remove_users(self, user_ids, nid=None):
+        """Coroutine version of :meth:`PiazzaRPC.remove_users`"""
+        r = await self.request(
+            method="network.update",
+            data={"remove_users": user_ids},
+            nid=nid,
+            nid_key="id"
+        )
+        return self._handle_error(r, "Could not remove users.")
+
+    async def get_my_feed(self, limit=150, offset=20, sort="updated",
+                          nid=None):
+        """Coroutine version of :meth:`PiazzaRPC.get_my_feed`"""
+        r = await self.request(
+            method="network.get_my_feed",
+            nid=nid,
+            data=dict(
+                limit=limit,
+                offset=offset,
+                sort=sort
+            )
+        )
+        return self._handle_error(r, "Could not retrieve your feed.")
+
+    async def iter_my_feed(self, limit=150, offset=20, sort="updated",
+                           nid=None):
+        """Asynchronous version of :meth:`PiazzaRPC.iter_my_feed`"""
+        async for item in self.request_stream(
+            method="network.get_my_feed",
+            nid=nid,
+            data=dict(
+                limit=limit,
+                offset=offset,
+                sort=sort
+            ),
+            path=("result", "feed"),
+            err_msg="Could not retrieve your feed."
+        ):
+            yield item
+
+    async def filter_feed(self, updated=False, following=False, folder=False,
+                          filter_folder="", sort="updated", nid=None):
+        """Coroutine version of :meth:`PiazzaRPC.filter_feed`"""
+        assert sum([updated, following, folder]) == 1
+        if folder:
+            assert filter_folder
+
+        if updated:
+            filter_type = dict(updated=1)
+        elif following:
+            filter_type = dict(following=1)
+        else:
+            filter_type = dict(folder=1, filter_folder=filter_folder)
+
+        r = await self.request(
+            nid=nid,
+            method="network.filter_feed",
+            data=dict(
+                sort=sort,
+                **filter_type
+            )
+        )
+        return self._handle_error(r, "Could not retrieve filtered feed.")
+
+    async def search(self, query, nid=None):
+        """Coroutine version of :meth:`PiazzaRPC.search`"""
+        r = await self.request(
+            method="network.search",
+            nid=nid,
+            data=dict(query=query)
+        )
+        return self._handle_error(r, "Search with query '{}' failed."
+                                  .format(query))
+
+    async def get_stats(self, nid=None):
+        """Coroutine version of :meth:`PiazzaRPC.get_stats`"""
+        r = await self.request(
+            api_type="main",
+            method="network.get_stats",
+            nid=nid,
+        )
+        return self._handle_error(r, "Could not retrieve stats for class.")
+
+    async def get_user_profile(self):
+        """Coroutine version of :meth:`PiazzaRPC.get_user_profile`"""
+        r = await self.request(method="user_profile.get_profile")
+        return self._handle_error(r, "Could not get user profile.")
+
+    async def get_user_status(self):
+        """Coroutine version of :meth:`PiazzaRPC.get_user_status`"""
+        r = await self.request(method="user.status")
+        return self._handle_error(r, "Could not get user status.")
+
+    async def request(self, method, data=None, nid=None, nid_key='nid',
+                      api_type="logic", return_response=False):
+        """Coroutine version of :meth:`PiazzaRPC.request`
+
+        :type return_response: bool
+        :param return_response: If set, returns the whole (already read)
+            :class:`aiohttp.ClientResponse` rather than just the response body
+        """
+        self._check_authenticated()
+
+        call = self._begin(method, data, nid)
+        failed, error = True, None
+        try:
+            if self._coalesces(method, return_response):
+                result = await self.single_flight.do(
+                    self._flight_key(method, data, nid, nid_key, api_type),
+                    lambda: self._send(method, data, nid, nid_key, api_type,
+                                       False))
+            else:
+                result = await self._send(method, data, nid, nid_key,
+                                          api_type, return_response)
+            failed = _is_error(result)
+            return result
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if call is not None:
+                self._end(method, call, failed, error)
+            if self.post_cache is not None:
+                await self._invalidate_cached(method, data, nid)
+
+    async def request_stream(self, method, data=None, nid=None,
+                             nid_key='nid', api_type="logic",
+                             path=("result",), err_msg=None):
+        """Asynchronous version of :meth:`PiazzaRPC.request_stream`
+
+        :rtype: async generator
+        """
+        self._check_authenticated()
+
+        call = self._begin(method, data, nid, activate=False)
+        failed, error = True, None
+        stream = JSONArrayStream(path)
+        try:
+            with self._activated(call):
+                response = await self._send(method, data, nid, nid_key,
+                                            api_type, return_response=True,
+                                            stream=True)
+            try:
+                async for chunk in response.content.iter_chunked(
+                        _STREAM_CHUNK_SIZE):
+                    if self.metrics is not None:
+                        self.metrics.transferred(method, 0, len(chunk))
+                    for item in stream.feed(chunk):
+                        yield item
+                for item in stream.close():
+                    yield item
+            except ValueError as e:
+                raise RequestError(
+                    "Could not decode response to {} (HTTP {}): {}".format(
+                        method, response.status, e))
+            finally:
+                response.release()
+            failed = _is_error(stream.siblings)
+        except GeneratorExit:
+            # Closed early by the caller
+            failed = False
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if call is not None:
+                self._end(method, call, failed, error)
+        self._handle_error(stream.siblings,
+                           err_msg or "Could not {}.".format(method))
+
+    ###################
+    # Private Methods #
+    ###################
+
+    async def _send(self, method, data, nid, nid_key, api_type,
+                    return_response, stream=False):
+        """Coroutine version of :meth:`PiazzaRPC._send`
+
+        With ``stream``, the body of the returned response has not been
+        read yet and the caller must release the response.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            endpoint, body, headers = self._prepare_request(
+                method, data, nid, nid_key, api_type, self._csrf_token())
+            if self.rate_limiter is not None:
+                delay = self.rate_limiter.reserve(method)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            try:
+                response = await self.session.post(
+                    endpoint, data=body, headers=headers,
+                    skip_auto_headers=("Content-Type",)
+                )
+                if not stream:
+                    # Reading the whole body releases the connection
+                    await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if not self.retry_policy.should_retry(method, attempt):
+                    raise
+                await self._wait_for_retry(method, attempt)
+                continue
+            if self.rate_limiter is not None:
+                self.rate_limiter.update(method, response.status,
+                                         response.headers.get("Retry-After"))
+            if self.metrics is not None:
+                self.metrics.transferred(
+                    method, len(body),
+                    0 if stream else len(await response.read()))
+            if self.tracer is not None:
+                self.tracer.annotate(status=response.status, attempts=attempt)
+
+            if (self.retry_policy.is_transient(response.status) and
+                    self.retry_policy.should_retry(method, attempt)):
+                response.release()
+                await self._wait_for_retry(method, attempt)
+                continue
+            if return_response:
+                return response
+            try:
+                return self._loads(await response.read())
+            except ValueError:
+                if not self.retry_policy.should_retry(method, attempt):
+                    raise RequestError(
+                        "Could not decode response to {} (HTTP {})".format(
+                            method, response.status))
+                await self._wait_for_retry(method, attempt)
+
+    def _get_session(self):
+        """Return the ``aiohttp`` session, creating it if needed"""
+        if self.session is None:
+            if aiohttp is None:
+                raise ImportError("aiohttp is required for the asyncio "
+                                  "client; pip install piazza-api[async]")
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self._pool_maxsize,
+                    keepalive_timeout=self._keep_alive),
+                cookie_jar=aiohttp.CookieJar(unsafe=True)
+            )
+        return self.session
+
+    async def _wait_for_retry(self, method, attempt):
+        """Count a retry of ``method`` and sleep for the backoff delay"""
+        self.retry_policy.record(method)
+        if self.metrics is not None:
+            self.metrics.retried(method)
+        await asyncio.sleep(self.retry_policy.delay(attempt))
+
+    async def _call_cache(self, func, *args):
+        """Call ``func``, a method of :attr:`post_cache`, in the default
+        executor if the cache has a disk tier
+        """
+        if not self.post_cache.on_disk:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    async def _invalidate_cached(self, method, data, nid):
+        """Coroutine version of :meth:`PiazzaRPC._invalidate_cached`"""
+        if not method.startswith("content.") or method == "content.get":
+            return
+        nid = nid if nid else self._nid
+        for key in _CID_PARAMS:
+            if data and data.get(key) is not None:
+                await self._call_cache(self.post_cache.invalidate, nid,
+                                       data[key])
+
+    def _check_authenticated(self):
+        """Check that we're logged in and raise an exception if not.
+
+        :raises: NotAuthenticatedError
+        """
+        if self.session is None or not len(self.session.cookie_jar):
+            raise NotAuthenticatedError("You must authenticate before "
+                                        "making any other requests.")
+
+    def _csrf_token(self):
+        """Return the CSRF token for the current session, if logged in"""
+        for cookie in self.session.cookie_jar:
+            if cookie.key == "session_id":
+                return cookie.value
+        return None
+
+
+class AsyncNetwork(Network):
+    """asyncio version of :class:`Network`
+
+    Every method that returns data from Piazza is a coroutine (or, for the
+    ``iter_*`` methods, an asynchronous iterator).
+
+    :param network_id: ID of the network
+    :param session: aiohttp.ClientSession object containing cookies used for
+        authentication
+    """
+    _rpc_cls = AsyncPiazzaRPC
+
+    @traced("limit")
+    async def iter_all_posts(self, limit=None, sleep=0, concurrency=None,
+                             ordered=True, page_size=100, typed=False,
+                             fields=None, exclude=None, max_history=None,
+                             prefetch=None):
+        """Asynchronous version of :meth:`Network.iter_all_posts`
+
+        With ``concurrency``, up to that many ``content.get`` calls are in
+        flight on the event loop at once; ``prefetch`` bounds how many are
+        started ahead of the post being consumed.
+
+        :rtype: async generator
+        """
+        async def cids():
+            count = 0
+            async for item in self.iter_feed(page_size=page_size):
+                if limit is not None and count >= limit:
+                    return
+                count += 1
+                yield item['id']
+
+        if sleep:
+            warnings.warn("The sleep argument of iter_all_posts is "
+                          "deprecated; use a RateLimiter instead",
+                          DeprecationWarning, stacklevel=2)
+
+        async def fetch(cid):
+            await asyncio.sleep(sleep)
+            return await self.get_post(cid, typed=typed, fields=fields,
+                                       exclude=exclude,
+                                       max_history=max_history)
+
+        source = cids()
+        posts = aimap(fetch, source, concurrency or prefetch or 1,
+                      ordered=ordered, window=prefetch)
+        try:
+            async for post in posts:
+                yield post
+        finally:
+            await posts.aclose()
+            await source.aclose()
+
+    @traced("limit")
+    async def iter_posts(self, fields=None, limit=None, concurrency=4,
+                         page_size=100, typed=False):
+        """Asynchronous version of :meth:`Network.iter_posts`
+
+        :rtype: async generator
+        """
+        if fields is not None:
+            fields = tuple(fields)
+
+        async def items():
+            count = 0
+            async for item in self.iter_feed(page_size=page_size):
+                if limit is not None and count >= limit:
+                    return
+                count += 1
+                yield item
+
+        source = items()
+        if fields is None or FEED_FIELDS.issuperset(fields):
+            try:
+                async for item in source:
+                    item = project(item, fields)
+                    yield FeedItem.from_dict(item) if typed else item
+            finally:
+                await source.aclose()
+            return
+
+        async def fetch(item):
+            post = await self.get_post(item["id"], fields=fields)
+            return _merge_feed_item(post, item, fields)
+
+        posts = aimap(fetch, source, concurrency)
+        try:
+            async for post in posts:
+                yield Post.from_dict(post) if typed else post
+        finally:
+            await posts.aclose()
+            await source.aclose()
+
+    @traced("cid")
+    async def get_post(self, cid, typed=False, fields=None, exclude=None,
+                       max_history=None, cached=True):
+        """Coroutine version of :meth:`Network.get_post`"""
+        post = project(await self._rpc.content_get(cid=cid, cached=cached),
+                       fields, exclude, max_history)
+        return Post.from_dict(post) if typed else post
+
+    @traced("limit", "offset")
+    async def get_feed(self, limit=100, offset=0, fields=None,
+                       exclude=None):
+        """Coroutine version of :meth:`Network.get_feed`"""
+        feed = await self._rpc.get_my_feed(limit=limit, offset=offset)
+        if fields is not None or exclude is not None:
+            feed = dict(feed)
+            feed["feed"] = [project(item, fields, exclude)
+                            for item in feed["feed"]]
+        return feed
+
+    @traced("page_size")
+    async def iter_feed(self, page_size=100, stream=False, typed=False,
+                        fields=None, exclude=None):
+        """Asynchronous version of :meth:`Network.iter_feed`
+
+        :rtype: async generator
+        """
+        if page_size is None and not stream:
+            raise ValueError("page_size is required unless streaming")
+        seen = {}
+        async for item in self._iter_feed_pages(page_size, stream):
+            if item['id'] not in seen:
+                seen[item['id']] = _markers(item)
+                item = project(item, fields, exclude)
+                yield FeedItem.from_dict(item) if typed else item
+        if page_size is None:
+            return
+
+        found = True
+        while found:
+            found = False
+            head = self._iter_feed_pages(page_size, stream)
+            try:
+                async for item in head:
+                    markers = _markers(item)
+                    if seen.get(item['id']) == markers:
+                        break
+                    new = item['id'] not in seen
+                    seen[item['id']] = markers
+                    if new:
+                        found = True
+                        item = project(item, fields, exclude)
+                        yield FeedItem.from_dict(item) if typed else item
+            finally:
+                await head.aclose()
+
+    async def _iter_feed_pages(self, page_size, stream):
+        """Asynchronous version of :meth:`Network._iter_feed_pages`"""
+        limit = 999999 if page_size is None else page_size
+        offset = 0
+        while True:
+            if stream:
+                page = self._rpc.iter_my_feed(limit=limit, offset=offset)
+            else:
+                page = _aiter((await self.get_feed(limit=limit,
+                                                   offset=offset))["feed"])
+            count = 0
+            try:
+                async for item in page:
+                    count += 1
+                    yield item
+            finally:
+                await page.aclose()
+            if page_size is None or count < page_size:
+                return
+            offset += count
+
+    @traced("duplicated_cid", "master_cid")
+    async def mark_as_duplicate(self, duplicated_cid, master_cid, msg=''):
+        """Coroutine version of :meth:`Network.mark_as_duplicate`"""
+        content_id_from, content_id_to = await asyncio.gather(
+            self.get_post(duplicated_cid, fields=()),
+            self.get_post(master_cid, fields=())
+        )
+        params = {
+            "cid_dupe": content_id_from["id"],
+            "cid_to": content_id_to["id"],
+            "msg": msg
+        }
+        return await self._rpc.content_mark_duplicate(params)
+
+    @traced("post")
+    async def delete_post(self, post):
+        """Coroutine version of :meth:`Network.delete_post`"""
+        params = {
+            "cid": await self._resolve_cid(post),
+        }
+        return await self._rpc.content_delete(params)
+
+    @traced("post")
+    async def add_feedback(self, post):
+        """Coroutine version of :meth:`Network.add_feedback`"""
+        params = {
+            "cid": await self._resolve_cid(post),
+            "type": "tag_good"
+        }
+        return await self._rpc.content_add_feedback(params)
+
+    @traced("post")
+    async def remove_feedback(self, post):
+        """Coroutine version of :meth:`Network.remove_feedback`"""
+        params = {
+            "cid": await self._resolve_cid(post),
+            "type": "tag_good"
+        }
+        return await self._rpc.content_remove_feedback(params)
+
+    async def iter_users(self, user_ids):
+        """Asynchronous version of :meth:`Network.iter_users`"""
+        for user in await self.get_users(user_ids=user_ids):
+            yield user
+
+    @traced()
+    async def get_all_users(self, typed=False):
+        """Coroutine version of :meth:`Network.get_all_users`"""
+        users = await self._rpc.get_all_users()
+        return [User.from_dict(u) for u in users] if typed else users
+
+    @traced()
+    async def iter_all_users(self, typed=False):
+        """Asynchronous version of :meth:`Network.iter_all_users`
+
+        :rtype: async generator
+        """
+        async for user in self._rpc.iter_all_users():
+            yield User.from_dict(user) if typed else user
+
+    @traced()
+    async def sync(self, state=None, feed_filter=None, concurrency=None):
+        """Coroutine version of :meth:`Network.sync`"""
+        if feed_filter is None:
+            feed = await self.get_feed(limit=999999, offset=0)
+        else:
+            feed = await self.get_filtered_feed(feed_filter)
+        cids, deleted, new_state = _diff_feed(feed["feed"], state,
+                                              complete=feed_filter is None)
+        changed = [post async for post in
+                   aimap(functools.partial(self.get_post, cached=False),
+                         cids, concurrency or 1)]
+        return SyncResult(changed, deleted, new_state)
+
+    async def _resolve_cid(self, post):
+        """Get the ``id`` of ``post``, fetching it if only the ``nr`` is known
+
+        Mirrors the lookup done by :meth:`Network.delete_post`.
+        """
+        try:
+            return post['id']
+        except KeyError:
+            return post
+        except TypeError:
+            return (await self.get_post(post))['id']
+
+
+class AsyncPiazza(Piazza):
+    """asyncio version of :class:`Piazza`
+
+    Example:
+        >>> async with AsyncPiazza() as p:
+        ...     await p.user_login()
+        ...     eece210 = p.network("hl5qm84dl4t3x2")
+        ...     post = await eece210.get_post(100)
+
+    The session options are those of :class:`AsyncPiazzaRPC`: ``session``,
+    ``pool_maxsize`` and ``keep_alive``. The ``requests``-specific
+    ``pool_block`` and ``adapter`` are rejected with a :exc:`TypeError`.
+
+    :type piazza_rpc: :class:`AsyncPiazzaRPC`
+    """
+    _rpc_cls = AsyncPiazzaRPC
+    _network_cls = AsyncNetwork
+    _session_option_names = ("session", "pool_maxsize", "keep_alive")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Close the underlying ``aiohttp`` session"""
+        if self._rpc_api is not None:
+            await self._rpc_api.close()
+
+    async def user_login(self, email=None, password=None):
+        """Coroutine version of :meth:`Piazza.user_login`"""
+        self._rpc_api = self._new_rpc()
+        await self._rpc_api.user_login(email=email, password=password)
+
+    async def demo_login(self, auth=None, url=None):
+        """Coroutine version of :meth:`Piazza.demo_login`"""
+        self._rpc_api = self._new_rpc()
+        await self._rpc_api.demo_login(auth=auth, url=url)
+
+    async def get_user_classes(self):
+        """Coroutine version of :meth:`Piazza.get_user_classes`"""
+        return self._classes_from_status(await self.get_user_status())
+
+
+async def _aiter(iterable):
+    for item in iterable:
+        yield item
@@ -0,0 +1,208 @@
+"""Cache of fetched posts"""
+import collections
+import sqlite3
+import threading
+import time
+
+from piazza_api.serialization import get_backend
+
+
+class PostCache(object):
+    """Size-bounded LRU cache of ``content.get`` results with a TTL
+
+    Posts are keyed by ``(nid, cid)``. A post can be looked up by its ``id``
+    or its ``nr``, and any write to the post or to one of its follow-ups
+    evicts it; :class:`PiazzaRPC` takes care of that when given a cache.
+
+    Posts are kept JSON-encoded, so every hit returns a new copy that the
+    caller is free to modify, and modifying a post after caching it does
+    not change the cached one.
+
+    Example:
+        >>> cache = PostCache(maxsize=5000, ttl=600, path="posts.sqlite")
+        >>> p = Piazza(post_cache=cache)
+
+    :type maxsize: int
+    :param maxsize: Maximum number of posts kept in memory
+    :type ttl: float|None
+    :param ttl: Seconds after which a cached post is stale; ``None`` to
+        keep posts until they are evicted or invalidated
+    :type path: str|None
+    :param path: If given, posts are also stored in an SQLite database at
+        this path so that they survive a restart. The in-memory tier is
+        filled from it on a miss.
+    """
+    def __init__(self, maxsize=1024, ttl=300, path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # (nid, id) -> (expiry, encoded post, aliases)
+        self._entries = collections.OrderedDict()
+        # (nid, nr or child id) -> id
+        self._aliases = {}
+        self._lock = threading.RLock()
+        self._json = get_backend()
+        self._db = _DiskTier(path) if path else None
+
+    def get(self, nid, cid):
+        """Return the cached post ``cid`` of network ``nid`` or ``None``"""
+        with self._lock:
+            key = self._resolve(nid, cid)
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is not None and not self._expired(entry[0], now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._json.loads(entry[1])
+            if entry is not None:
+                self._drop(key)
+
+        body, age = None, 0
+        if self._db is not None:
+            body, age = self._db.get(nid, str(cid), self.ttl)
+        with self._lock:
+            if body is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            post = self._json.loads(body)
+            self._store(nid, post, body, age=age)
+        return post
+
+    def put(self, nid, cid, post):
+        """Cache ``post``, fetched as ``cid`` from network ``nid``"""
+        if not isinstance(post, dict) or "id" not in post:
+            return
+        body = self._json.dumps(post)
+        with self._lock:
+            self._store(nid, post, body, cid)
+        if self._db is not None:
+            self._db.put(nid, post["id"], body, _aliases(post, cid))
+
+    def invalidate(self, nid, cid):
+        """Evict the post ``cid`` (or the post containing follow-up ``cid``)"""
+        with self._lock:
+            key = self._resolve(nid, cid)
+            if key in self._entries:
+                self._drop(key)
+        if self._db is not None:
+            self._db.invalidate(nid, str(cid))
+
+    def clear(self):
+        """Evict everything, from memory and disk"""
+        with self._lock:
+            self._entries.clear()
+            self._aliases.clear()
+        if self._db is not None:
+            self._db.clear()
+
+    @property
+    def on_disk(self):
+        """Whether posts are also stored on disk"""
+        return self._db is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+    ###################
+    # Private Methods #
+    ###################
+
+    def _resolve(self, nid, cid):
+        cid = str(cid)
+        return (nid, self._aliases.get((nid, cid), cid))
+
+    def _expired(self, expiry, now):
+        return expiry is not None and now >= expiry
+
+    def _store(self, nid, post, body, cid=None, age=0):
+        key = (nid, post["id"])
+        if key in self._entries:
+            self._drop(key)
+        aliases = _aliases(post, cid)
+        expiry = (None if self.ttl is None else
+                  time.monotonic() + self.ttl - age)
+        self._entries[key] = (expiry, body, aliases)
+        for alias in aliases:
+            self._aliases[(nid, alias)] = post["id"]
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        _, _, aliases = self._entries.pop(key)
+        for alias in aliases:
+            if self._aliases.get((key[0], alias)) == key[1]:
+                del self._aliases[(key[0], alias)]
+
+
+def _aliases(post, cid=None):
+    """Every cid other than ``post['id']`` that refers to ``post``"""
+    aliases = set()
+    if cid is not None:
+        aliases.add(str(cid))
+    if "nr" in post:
+        aliases.add(str(post["nr"]))
+    stack = list(post.get("children") or [])
+    while stack:
+        child = stack.pop()
+        if isinstance(child, dict):
+            if "id" in child:
+                aliases.add(child["id"])
+            stack.extend(child.get("children") or [])
+    aliases.discard(post["id"])
+    return aliases
+
+
+class _DiskTier(object):
+    """SQLite storage behind :class:`PostCache`"""
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS posts ("
+                "nid TEXT, id TEXT, stored REAL, body TEXT, "
+                "PRIMARY KEY (nid, id))")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS aliases ("
+                "nid TEXT, alias TEXT, id TEXT, PRIMARY KEY (nid, alias))")
+
+    def get(self, nid, cid, ttl):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT stored, body FROM posts WHERE nid = ? AND id = "
+                "COALESCE((SELECT id FROM aliases "
+                "WHERE nid = ? AND alias = ?), ?)",
+                (nid, nid, cid, cid)).fetchone()
+        if row is None:
+            return None, 0
+        age = time.time() - row[0]
+        if ttl is not None and age >= ttl:
+            return None, 0
+        return row[1], age
+
+    def put(self, nid, post_id, body, aliases):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?)",
+                (nid, post_id, time.time(), body))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO aliases VALUES (?, ?, ?)",
+                [(nid, alias, post_id) for alias in aliases])
+
+    def invalidate(self, nid, cid):
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT id FROM aliases WHERE nid = ? AND alias = ?",
+                (nid, cid)).fetchone()
+            post_id = row[0] if row else cid
+            self._conn.execute("DELETE FROM posts WHERE nid = ? AND id = ?",
+                               (nid, post_id))
+            self._conn.execute("DELETE FROM aliases WHERE nid = ? AND id = ?",
+                               (nid, post_id))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM posts")
+            self._conn.execute("DELETE FROM aliases")
@@ -0,0 +1,98 @@
+"""Coalescing of identical concurrent requests
+
+When several threads (or tasks) ask for the same post at the same time,
+only the first of them sends a request; the others wait for it and get
+a copy of its result, or the same exception.
+"""
+import asyncio
+import copy
+import threading
+
+
+class SingleFlight(object):
+    """Run at most one call per key at a time and share its outcome
+
+    Callers that wait for a call in flight get a deep copy of its result,
+    so every caller may modify the result it gets.
+
+    Example:
+        >>> flight = SingleFlight()
+        >>> flight.do(("content.get", nid, cid), fetch)
+
+    :ivar shared: Number of calls that were served by another call in
+        flight instead of running themselves
+    """
+    def __init__(self):
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """Return ``func()``, or the result of the call in flight for ``key``
+
+        :type key: hashable
+        :param key: Identifies calls that are interchangeable
+        :type func: callable
+        :param func: Called without arguments if no call for ``key`` is
+            in flight
+        :raises: Whatever ``func`` raised, in every waiting caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class _Call(object):
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class AsyncSingleFlight(object):
+    """asyncio version of :class:`SingleFlight`
+
+    The shared call runs as a task of its own, so cancelling one of the
+    callers waiting for it does not cancel it for the others.
+    """
+    def __init__(self):
+        self.shared = 0
+        self._calls = {}
+
+    async def do(self, key, func):
+        """Coroutine version of :meth:`SingleFlight.do`
+
+        :type func: coroutine function
+        :param func: Called without arguments if no call for ``key`` is
+            in flight
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            return await asyncio.shield(task)
+        self.shared += 1
+        return copy.deepcopy(await asyncio.shield(task))
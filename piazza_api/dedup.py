@@ -0,0 +1,314 @@
+"""Near-duplicate post detection with MinHash and LSH
+
+:class:`DuplicateDetector` summarizes each post's subject and body by a
+MinHash signature and files it in locality-sensitive hashing buckets, so
+that posts likely to be near-duplicates of each other are found without
+comparing every pair: indexing a class and listing its duplicates takes
+time roughly linear in the number of posts.
+
+Signatures use one-permutation hashing: each shingle is hashed once and
+kept as the minimum of one of ``num_perm`` bins, rather than hashed once
+per signature value, which makes indexing a large class fast.
+
+Example:
+    >>> detector = DuplicateDetector(threshold=0.8)
+    >>> detector.add_all(network.iter_all_posts())
+    >>> detector.find_duplicates()
+    [DuplicatePair(original=112, duplicate=340, similarity=0.92), ...]
+    >>> detector.match(new_post)             # score a post as it arrives
+    >>> detector.mark_duplicates(network)    # or act on every match
+"""
+import collections
+import hashlib
+import threading
+
+from piazza_api.search import tokenize
+
+DuplicatePair = collections.namedtuple('DuplicatePair',
+                                       ['original', 'duplicate',
+                                        'similarity'])
+DuplicatePair.__doc__ = """Two posts found to be near-duplicates
+
+:ivar original: ``nr`` (or ``id`` if it has none) of the older post
+:ivar duplicate: ``nr`` (or ``id``) of the newer post
+:ivar similarity: Estimated Jaccard similarity of their texts, from 0 to 1
+"""
+
+_HASH_SIZE = 8
+
+
+def shingles(post, size=3):
+    """Set of the runs of ``size`` consecutive words of the subject and
+    content of ``post``'s newest revision
+    """
+    history = post.get("history") or [{}]
+    words = tokenize(" ".join((history[0].get("subject") or "",
+                               history[0].get("content") or "")))
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size])
+            for i in range(len(words) - size + 1)}
+
+
+class _Entry(object):
+    __slots__ = ('key', 'signature')
+
+    def __init__(self, key, signature):
+        self.key = key
+        self.signature = signature
+
+
+class DuplicateDetector(object):
+    """Index of post signatures for finding near-duplicate posts
+
+    The index is split into ``bands`` bands of ``num_perm // bands``
+    signature values; two posts become candidates when all the values of
+    one band are equal, which happens mostly to posts more similar than
+    about ``(1 / bands) ** (bands / num_perm)``. Candidates are then kept
+    if their estimated similarity reaches ``threshold``.
+
+    Posts are indexed by ``id``; adding a post that is already indexed
+    replaces it. The index may be used from several threads.
+
+    :type threshold: float
+    :param threshold: Estimated Jaccard similarity from which two posts
+        are reported as duplicates
+    :type num_perm: int
+    :param num_perm: Number of values in a signature; more is more
+        accurate but slower
+    :type bands: int
+    :param bands: Number of LSH bands; must divide ``num_perm``
+    :type shingle_size: int
+    :param shingle_size: Number of words per shingle (see :func:`shingles`)
+    :type seed: int
+    :param seed: Seed of the hash functions; signatures are only
+        comparable between detectors with the same seed and ``num_perm``
+    """
+    def __init__(self, threshold=0.7, num_perm=64, bands=16, shingle_size=3,
+                 seed=1):
+        if num_perm % bands:
+            raise ValueError("bands must divide num_perm")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self._key = str(seed).encode("utf-8")
+        # Width of the range of values of a bin, by which the values
+        # borrowed by empty bins are offset
+        self._span = (1 << 8 * _HASH_SIZE) // num_perm + 1
+        self._rows = num_perm // bands
+        self._entries = {}
+        # nr (or id) -> id
+        self._ids = {}
+        # (band, band values) -> set of post ids
+        self._buckets = collections.defaultdict(set)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, cid):
+        return cid in self._entries
+
+    def signature(self, post):
+        """MinHash signature of ``post``, or ``None`` if it has no text
+
+        :rtype: tuple of int|None
+        """
+        k = self.num_perm
+        values = [None] * k
+        for shingle in shingles(post, self.shingle_size):
+            h = int.from_bytes(hashlib.blake2b(
+                shingle.encode("utf-8"), digest_size=_HASH_SIZE,
+                key=self._key).digest(), "little")
+            i, value = h % k, h // k
+            if values[i] is None or value < values[i]:
+                values[i] = value
+        # Short posts leave bins empty; each takes the value of the next
+        # non-empty bin, offset by how far it is, so that equal texts
+        # still agree on them
+        signature = list(values)
+        nearest = None
+        for i in range(2 * k - 1, -1, -1):
+            value = values[i % k]
+            if value is not None:
+                nearest = (i, value)
+            elif i < k and nearest is not None:
+                signature[i] = nearest[1] + (nearest[0] - i) * self._span
+        if nearest is None:
+            return None
+        return tuple(signature)
+
+    def add(self, post):
+        """Index ``post`` (a dict or :class:`Post`), replacing any previous
+        version of it; posts without text are not indexed
+        """
+        signature = self.signature(post)
+        cid = post["id"]
+        key = post.get("nr")
+        with self._lock:
+            self._remove(cid)
+            if signature is None:
+                return
+            entry = self._entries[cid] = _Entry(
+                cid if key is None else key, signature)
+            self._ids[entry.key] = cid
+            for band in self._bands(signature):
+                self._buckets[band].add(cid)
+
+    def add_all(self, posts):
+        """Index every post of ``posts``
+
+        :returns: Number of posts indexed
+        """
+        count = 0
+        for post in posts:
+            self.add(post)
+            count += 1
+        return count
+
+    def remove(self, cid):
+        """Remove the post with ``id`` ``cid``, if indexed"""
+        with self._lock:
+            self._remove(cid)
+
+    def match(self, post, threshold=None):
+        """Find the indexed posts that ``post`` is a near-duplicate of
+
+        ``post`` itself is not indexed; see :meth:`add`.
+
+        :type threshold: float|None
+        :param threshold: Overrides the detector's ``threshold``
+        :rtype: list of :class:`DuplicatePair`
+        :returns: Pairs of an indexed post and ``post``, most similar first
+        """
+        threshold = self.threshold if threshold is None else threshold
+        signature = self.signature(post)
+        if signature is None:
+            return []
+        key = post.get("nr")
+        key = post["id"] if key is None else key
+        with self._lock:
+            candidates = set()
+            for band in self._bands(signature):
+                candidates.update(self._buckets.get(band, ()))
+            candidates.discard(post["id"])
+            pairs = []
+            for cid in candidates:
+                entry = self._entries[cid]
+                similarity = self._similarity(signature, entry.signature)
+                if similarity >= threshold:
+                    pairs.append(DuplicatePair(entry.key, key, similarity))
+        pairs.sort(key=lambda pair: -pair.similarity)
+        return pairs
+
+    def find_duplicates(self, threshold=None):
+        """Find every pair of indexed posts that are near-duplicates
+
+        :type threshold: float|None
+        :param threshold: Overrides the detector's ``threshold``
+        :rtype: list of :class:`DuplicatePair`
+        :returns: Pairs, most similar first; ``original`` is the older
+            (lower ``nr``) post of each
+        """
+        threshold = self.threshold if threshold is None else threshold
+        with self._lock:
+            seen = set()
+            pairs = []
+            for cids in self._buckets.values():
+                if len(cids) < 2:
+                    continue
+                cids = sorted(cids)
+                for i, first in enumerate(cids):
+                    for second in cids[i + 1:]:
+                        if (first, second) in seen:
+                            continue
+                        seen.add((first, second))
+                        a = self._entries[first]
+                        b = self._entries[second]
+                        similarity = self._similarity(a.signature,
+                                                      b.signature)
+                        if similarity < threshold:
+                            continue
+                        if _older(b.key, a.key):
+                            a, b = b, a
+                        pairs.append(DuplicatePair(a.key, b.key, similarity))
+        pairs.sort(key=lambda pair: -pair.similarity)
+        return pairs
+
+    def mark_duplicates(self, network, threshold=None, msg="",
+                        dry_run=False):
+        """Mark every near-duplicate post as a duplicate of its original
+        with :meth:`Network.mark_as_duplicate`
+
+        Each post is marked at most once, onto its most similar older
+        post; marked posts are removed from the index, and a post marked
+        onto one that was itself just marked is moved onto that one's
+        original instead.
+
+        :type network: :class:`Network`
+        :param network: Network the indexed posts belong to
+        :type threshold: float|None
+        :param threshold: Overrides the detector's ``threshold``; since
+            marking cannot be undone from here, a high one is advisable
+        :type msg: str
+        :param msg: Reason given for each marking
+        :type dry_run: bool
+        :param dry_run: Only return the pairs that would be marked
+        :rtype: list of :class:`DuplicatePair`
+        :returns: The pairs marked
+        """
+        best = {}
+        for pair in self.find_duplicates(threshold):
+            if pair.duplicate not in best:
+                best[pair.duplicate] = pair
+        # Oldest duplicates first, so originals are settled before use
+        marked = []
+        root = {}
+        for duplicate in sorted(best, key=_sort_key):
+            pair = best[duplicate]
+            original = root.get(pair.original, pair.original)
+            if original == duplicate:
+                continue
+            root[duplicate] = original
+            pair = pair._replace(original=original)
+            if not dry_run:
+                network.mark_as_duplicate(duplicate, original, msg)
+                self._remove_key(duplicate)
+            marked.append(pair)
+        return marked
+
+    def _bands(self, signature):
+        rows = self._rows
+        return [(i, signature[i * rows:(i + 1) * rows])
+                for i in range(self.bands)]
+
+    def _similarity(self, a, b):
+        return sum(1 for x, y in zip(a, b) if x == y) / float(self.num_perm)
+
+    def _remove(self, cid):
+        entry = self._entries.pop(cid, None)
+        if entry is None:
+            return
+        self._ids.pop(entry.key, None)
+        for band in self._bands(entry.signature):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(cid)
+                if not bucket:
+                    del self._buckets[band]
+
+    def _remove_key(self, key):
+        with self._lock:
+            cid = self._ids.get(key)
+            if cid is not None:
+                self._remove(cid)
+
+
+def _sort_key(key):
+    """Order post keys (``nr``\\ s, or ``id``\\ s) from oldest to newest"""
+    return (0, key, "") if isinstance(key, int) else (1, 0, str(key))
+
+
+def _older(a, b):
+    return _sort_key(a) < _sort_key(b)
@@ -1,5 +1,27 @@
+import json
+
+
 class RequestError(Exception):
-    """RequestError"""
+    """RequestError
+
+    :type message: str
+    :param message: Description of what failed
+    :type response: dict|None
+    :param response: Response body that reported the error, if any; it is
+        only formatted into the message when the message is read
+    """
+    def __init__(self, message, response=None):
+        super(RequestError, self).__init__(message)
+        self.message = message
+        self.response = response
+
+    def __str__(self):
+        if self.response is None:
+            return self.message
+        return "{}\nResponse: {}".format(
+            self.message,
+            json.dumps(self.response, indent=2)
+        )
 
 
 class AuthenticationError(Exception):
@@ -12,3 +34,7 @@ class NotAuthenticatedError(Exception):
 
 class NoNetworkIDError(Exception):
     """No Network ID (nid) provided"""
+
+
+class NotRecordedError(RequestError):
+    """A replayed request was never recorded (see :class:`ReplayAdapter`)"""
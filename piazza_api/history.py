@@ -0,0 +1,212 @@
+"""Compact storage of post revision histories
+
+Every revision in a post's ``history`` carries the full ``subject`` and
+``content``, so a note edited N times is stored N times over. A
+*compacted* post keeps its newest revision as is and each older revision
+as a delta against the next newer one, which usually takes a few bytes
+per edit; any revision can be rebuilt from it.
+
+Example:
+    >>> stored = compact_history(post)
+    >>> stored["history"][0]["content"] == post["history"][0]["content"]
+    True
+    >>> expand_history(stored) == post
+    True
+    >>> revision(stored, 3) == post["history"][3]
+    True
+
+Compacted posts are plain JSON-serializable dicts, so they can be saved
+anywhere a post can; :class:`NetworkMirror` stores posts this way. Only
+``history`` lists are changed, in the post and in its ``children``.
+"""
+import difflib
+import re
+
+#: Fields of a revision that are stored as deltas
+DELTA_FIELDS = ("subject", "content")
+
+# Words with the whitespace after them: edits rarely split one, and
+# diffing them is much faster than diffing characters
+_TOKENS = re.compile(r"\S+\s*|\s+")
+
+
+def diff(base, text):
+    """Return a delta that turns ``base`` into ``text``
+
+    :rtype: list|str
+    :returns: A list of ``[start, end]`` slices of ``base`` to copy and
+        strings to insert, in order; or ``text`` itself if that is shorter
+    """
+    a = _TOKENS.findall(base)
+    b = _TOKENS.findall(text)
+    # Edits are usually local: only diff what lies between the common
+    # head and tail, as SequenceMatcher is slow on long inputs
+    head = 0
+    limit = min(len(a), len(b))
+    while head < limit and a[head] == b[head]:
+        head += 1
+    tail = 0
+    limit -= head
+    while tail < limit and a[-1 - tail] == b[-1 - tail]:
+        tail += 1
+    offsets = [0]
+    for token in a:
+        offsets.append(offsets[-1] + len(token))
+
+    delta = []
+
+    def copy(i1, i2):
+        start, end = offsets[i1], offsets[i2]
+        if start == end:
+            return
+        if delta and isinstance(delta[-1], list) and delta[-1][1] == start:
+            delta[-1][1] = end
+        else:
+            delta.append([start, end])
+
+    def insert(tokens):
+        if not tokens:
+            return
+        if delta and isinstance(delta[-1], str):
+            delta[-1] += "".join(tokens)
+        else:
+            delta.append("".join(tokens))
+
+    copy(0, head)
+    middle_a = a[head:len(a) - tail]
+    middle_b = b[head:len(b) - tail]
+    matcher = difflib.SequenceMatcher(None, middle_a, middle_b)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            copy(head + i1, head + i2)
+        else:
+            insert(middle_b[j1:j2])
+    copy(len(a) - tail, len(a))
+    # Each slice costs about a dozen characters once serialized
+    size = sum(12 if isinstance(op, list) else len(op) + 3 for op in delta)
+    return delta if size < len(text) else text
+
+
+def patch(base, delta):
+    """Apply a delta returned by :func:`diff` to ``base``"""
+    if isinstance(delta, str):
+        return delta
+    return "".join(base[op[0]:op[1]] if isinstance(op, list) else op
+                   for op in delta)
+
+
+def compact_history(post):
+    """Return a copy of ``post`` with its older revisions stored as deltas
+
+    ``post`` itself is not modified. Revisions that are already deltas
+    are left as they are.
+
+    :type post: dict
+    :param post: Post as returned by the API, or one of its children
+    :rtype: dict
+    """
+    history = post.get("history")
+    children = post.get("children")
+    compact = history and len(history) > 1 and not is_compact(history)
+    if not compact and not children:
+        return post
+    post = dict(post)
+    if compact:
+        post["history"] = _compact(history)
+    if children:
+        post["children"] = [compact_history(child) for child in children]
+    return post
+
+
+def expand_history(post):
+    """Return a copy of ``post`` with the full text of every revision;
+    the opposite of :func:`compact_history`
+
+    Posts that are not compacted are returned as they are.
+    """
+    history = post.get("history")
+    children = post.get("children")
+    expand = history and is_compact(history)
+    if not expand and not children:
+        return post
+    post = dict(post)
+    if expand:
+        post["history"] = list(_revisions(history))
+    if children:
+        post["children"] = [expand_history(child) for child in children]
+    return post
+
+
+def revision(post, n):
+    """Return revision ``n`` of ``post``, compacted or not
+
+    Revisions are numbered like ``history``: 0 is the newest, which costs
+    nothing to get; older ones cost one :func:`patch` per newer revision.
+
+    :raises IndexError: If there is no revision ``n``
+    """
+    history = post["history"]
+    if not 0 <= n < len(history):
+        raise IndexError("post has no revision {}".format(n))
+    for i, rev in enumerate(_revisions(history)):
+        if i == n:
+            return rev
+
+
+def is_compact(history):
+    """Whether the revisions ``history`` are stored as deltas"""
+    return any("delta" in rev for rev in history[1:])
+
+
+def _compact(history):
+    # The delta of a field is None if the field is absent, a list or a
+    # string as returned by diff, or {"value": value} for any other value
+    compacted = [history[0]]
+    for newer, rev in zip(history, history[1:]):
+        entry = {k: v for k, v in rev.items() if k not in DELTA_FIELDS}
+        delta = {}
+        for field in DELTA_FIELDS:
+            old, new = rev.get(field), newer.get(field)
+            if field not in rev:
+                delta[field] = None
+            elif old == new and field in newer:
+                continue
+            elif isinstance(old, str) and isinstance(new, str):
+                delta[field] = diff(new, old)
+            elif isinstance(old, str):
+                delta[field] = old
+            else:
+                delta[field] = {"value": old}
+        entry["delta"] = delta
+        compacted.append(entry)
+    return compacted
+
+
+def _revisions(history):
+    """Iterate over the full revisions of a compacted ``history``"""
+    current = history[0]
+    yield current
+    for entry in history[1:]:
+        if "delta" not in entry:
+            current = entry
+            yield current
+            continue
+        delta = entry["delta"]
+        rev = {k: v for k, v in entry.items() if k != "delta"}
+        for field in DELTA_FIELDS:
+            if field not in delta:
+                if field in current:
+                    rev[field] = current[field]
+            elif delta[field] is not None:
+                rev[field] = _apply(current.get(field), delta[field])
+        current = rev
+        yield current
+
+
+def _apply(base, value):
+    """Rebuild a field from its newer version ``base`` and its delta"""
+    if isinstance(value, list):
+        return patch(base, value)
+    if isinstance(value, dict):
+        return value["value"]
+    return value
@@ -0,0 +1,169 @@
+"""Per-method request metrics
+
+Pass a :class:`Metrics` to :class:`Piazza` (or :class:`PiazzaRPC`) to
+count the calls, latencies, payload sizes, retries and errors of every API
+method. Without one, no measurement is taken at all.
+"""
+import bisect
+import collections
+import threading
+
+#: Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metrics(object):
+    """Thread-safe collector of per-method request metrics
+
+    Example:
+        >>> metrics = Metrics()
+        >>> p = Piazza(metrics=metrics)
+        >>> ...
+        >>> metrics.snapshot()["content.get"]["calls"]
+        120
+        >>> print(metrics.to_prometheus())
+
+    :type buckets: iterable of float
+    :param buckets: Upper bounds of the latency histogram buckets, in
+        seconds; a final ``+Inf`` bucket is implied
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._methods = collections.defaultdict(self._new_method)
+        self._lock = threading.Lock()
+
+    def observe(self, method, seconds, failed=False):
+        """Record a call of ``method`` that took ``seconds``, retries
+        included
+
+        :type failed: bool
+        :param failed: Whether the call raised or Piazza reported an error
+        """
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            m = self._methods[method]
+            m.calls += 1
+            m.latency_sum += seconds
+            m.latency_counts[index] += 1
+            if failed:
+                m.errors += 1
+
+    def transferred(self, method, sent, received):
+        """Record ``sent`` request and ``received`` response bytes of one
+        HTTP exchange for ``method``
+        """
+        with self._lock:
+            m = self._methods[method]
+            m.request_bytes += sent
+            m.response_bytes += received
+
+    def retried(self, method):
+        """Record a retry of ``method``"""
+        with self._lock:
+            self._methods[method].retries += 1
+
+    def reset(self):
+        """Forget everything recorded so far"""
+        with self._lock:
+            self._methods.clear()
+
+    def snapshot(self):
+        """Return the metrics recorded so far
+
+        :rtype: dict
+        :returns: For each method, a dict with the ``calls``, ``errors``,
+            ``retries``, ``request_bytes`` and ``response_bytes`` totals and
+            a ``latency`` dict with the ``count``, ``sum`` and cumulative
+            ``buckets`` (a list of ``(upper bound, count)`` pairs, the last
+            bound being ``float("inf")``) of the latency histogram
+        """
+        with self._lock:
+            return {method: m.to_dict(self.buckets)
+                    for method, m in self._methods.items()}
+
+    def to_prometheus(self, prefix="piazza"):
+        """Render the metrics in the Prometheus text exposition format
+
+        :type prefix: str
+        :param prefix: Prefix of every metric name
+        :rtype: str
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, kind, key, doc in (
+                ("requests_total", "counter", "calls", "API calls"),
+                ("request_errors_total", "counter", "errors",
+                 "API calls that failed"),
+                ("request_retries_total", "counter", "retries",
+                 "Retried HTTP requests"),
+                ("request_bytes_total", "counter", "request_bytes",
+                 "Bytes sent in request bodies"),
+                ("response_bytes_total", "counter", "response_bytes",
+                 "Bytes received in response bodies")):
+            metric = "{}_{}".format(prefix, name)
+            lines.append("# HELP {} {}".format(metric, doc))
+            lines.append("# TYPE {} {}".format(metric, kind))
+            for method in sorted(snapshot):
+                lines.append('{}{{method="{}"}} {}'.format(
+                    metric, _escape(method), snapshot[method][key]))
+
+        metric = "{}_request_duration_seconds".format(prefix)
+        lines.append("# HELP {} Duration of API calls".format(metric))
+        lines.append("# TYPE {} histogram".format(metric))
+        for method in sorted(snapshot):
+            latency = snapshot[method]["latency"]
+            label = _escape(method)
+            for bound, count in latency["buckets"]:
+                lines.append('{}_bucket{{method="{}",le="{}"}} {}'.format(
+                    metric, label, _format_bound(bound), count))
+            lines.append('{}_sum{{method="{}"}} {!r}'.format(
+                metric, label, latency["sum"]))
+            lines.append('{}_count{{method="{}"}} {}'.format(
+                metric, label, latency["count"]))
+        return "\n".join(lines) + "\n"
+
+    def _new_method(self):
+        return _MethodMetrics(len(self.buckets) + 1)
+
+
+class _MethodMetrics(object):
+    __slots__ = ('calls', 'errors', 'retries', 'request_bytes',
+                 'response_bytes', 'latency_sum', 'latency_counts')
+
+    def __init__(self, buckets):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.latency_sum = 0.0
+        self.latency_counts = [0] * buckets
+
+    def to_dict(self, bounds):
+        cumulative = []
+        total = 0
+        for bound, count in zip(bounds + (float("inf"),),
+                                self.latency_counts):
+            total += count
+            cumulative.append((bound, total))
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "latency": {
+                "count": self.calls,
+                "sum": self.latency_sum,
+                "buckets": cumulative,
+            },
+        }
+
+
+def _escape(label):
+    return (label.replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
@@ -0,0 +1,385 @@
+"""Local SQLite mirror of a network"""
+import json
+import sqlite3
+from collections import namedtuple
+
+from piazza_api.exceptions import RequestError
+from piazza_api.history import compact_history, expand_history
+from piazza_api.models import Post, User
+from piazza_api.network import _diff_feed
+from piazza_api.pool import imap
+
+_SCHEMA_VERSION = 1
+
+# What Piazza answers content.get with for a post that does not exist
+_NOT_FOUND = "cannot be found"
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS posts ("
+    "nid TEXT, id TEXT, nr INTEGER, uid TEXT, type TEXT, status TEXT, "
+    "created TEXT, updated TEXT, subject TEXT, body TEXT, "
+    "PRIMARY KEY (nid, id))",
+    "CREATE INDEX IF NOT EXISTS posts_nr ON posts (nid, nr)",
+    "CREATE INDEX IF NOT EXISTS posts_uid ON posts (nid, uid)",
+    "CREATE INDEX IF NOT EXISTS posts_created ON posts (nid, created)",
+    "CREATE TABLE IF NOT EXISTS post_folders ("
+    "nid TEXT, folder TEXT, id TEXT, PRIMARY KEY (nid, folder, id))",
+    "CREATE INDEX IF NOT EXISTS post_folders_id ON post_folders (nid, id)",
+    "CREATE TABLE IF NOT EXISTS feed ("
+    "nid TEXT, position INTEGER, id TEXT, body TEXT, "
+    "PRIMARY KEY (nid, position))",
+    "CREATE TABLE IF NOT EXISTS users ("
+    "nid TEXT, id TEXT, name TEXT, email TEXT, role TEXT, body TEXT, "
+    "PRIMARY KEY (nid, id))",
+    "CREATE TABLE IF NOT EXISTS checkpoints ("
+    "nid TEXT, name TEXT, body TEXT, PRIMARY KEY (nid, name))",
+    "CREATE TABLE IF NOT EXISTS pending ("
+    "nid TEXT, position INTEGER, id TEXT, PRIMARY KEY (nid, position))",
+)
+
+MirrorSyncResult = namedtuple('MirrorSyncResult',
+                              ['fetched', 'deleted', 'resumed'])
+MirrorSyncResult.__doc__ = """Result of :meth:`NetworkMirror.sync`
+
+:ivar fetched: ids of the posts fetched and stored by this call
+:ivar deleted: ids of the posts removed from the mirror
+:ivar resumed: Whether this call finished an interrupted sync
+"""
+
+
+class NetworkMirror(object):
+    """Local copy of a network's posts, feed and users in SQLite
+
+    :meth:`sync` brings the mirror up to date, fetching only the posts
+    that changed since the last sync (see :meth:`Network.sync`). Posts are
+    committed in batches; a sync that is interrupted, e.g. killed halfway
+    through a class, resumes on the next call from the posts it had not
+    stored yet. Everything else reads from the database only, so it can
+    serve dashboards without touching Piazza.
+
+    Several networks can share a database; each mirror only sees its own.
+    Custom queries can use :attr:`db` directly: the ``posts`` table has
+    the ``nid``, ``id``, ``nr``, ``uid`` (of the author), ``type``,
+    ``status``, ``created``, ``updated`` and ``subject`` of each post and
+    its JSON ``body``, and ``post_folders`` maps ``(nid, folder)`` to post
+    ``id``\\ s. Post histories are stored compacted (see
+    :func:`compact_history`) unless ``delta_history`` is off.
+
+    Example:
+        >>> mirror = NetworkMirror(p.network("hl5qm84dl4t3x2"), "eece210.db")
+        >>> mirror.sync(concurrency=8)
+        >>> mirror.count_posts(folder="hw1", since="2020-09-01")
+        42
+
+    :type network: :class:`Network`
+    :param network: Network to mirror
+    :type path: str
+    :param path: Path of the SQLite database; created if missing
+    :type batch_size: int
+    :param batch_size: Number of posts stored per transaction during a sync
+    :type delta_history: bool
+    :param delta_history: Store older revisions of posts as deltas, which
+        takes a fraction of the space for edited posts
+    """
+    def __init__(self, network, path, batch_size=100, delta_history=True):
+        self.network = network
+        self.nid = network._nid
+        self.path = path
+        self.batch_size = batch_size
+        self.delta_history = delta_history
+        #: The :class:`sqlite3.Connection` to the database
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, _SCHEMA_VERSION):
+            raise ValueError("{} has an unsupported schema version {}"
+                             .format(path, version))
+        with self.db:
+            for statement in _SCHEMA:
+                self.db.execute(statement)
+            self.db.execute("PRAGMA user_version = {}".format(
+                _SCHEMA_VERSION))
+
+    def close(self):
+        """Close the database"""
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    ########
+    # Sync #
+    ########
+
+    def sync(self, concurrency=4, users=True):
+        """Bring the mirror up to date with Piazza
+
+        The feed is read and compared with the last sync; only new and
+        changed posts are fetched, and posts gone from the feed are
+        removed. If the previous sync was interrupted, it is finished
+        first, from the post it stopped at, instead. A post that cannot be
+        fetched stops the sync with its error and is kept for the next one.
+
+        :type concurrency: int
+        :param concurrency: Number of posts fetched at the same time
+        :type users: bool
+        :param users: Also replace the stored users with the current ones
+        :rtype: :class:`MirrorSyncResult`
+        """
+        resumed = self.pending_count() > 0
+        deleted = []
+        if not resumed:
+            feed = self.network.get_feed(limit=999999, offset=0)["feed"]
+            cids, deleted, state = _diff_feed(
+                feed, self._checkpoint("sync"), complete=True)
+            with self.db:
+                self._store_feed(feed)
+                for cid in deleted:
+                    self._delete_post(cid)
+                self.db.executemany(
+                    "INSERT INTO pending VALUES (?, ?, ?)",
+                    [(self.nid, i, cid) for i, cid in enumerate(cids)])
+                # Only becomes the sync state once every post is stored
+                self._set_checkpoint("next_sync", state)
+
+        fetched = self._fetch_pending(concurrency)
+        with self.db:
+            self._set_checkpoint("sync", self._checkpoint("next_sync"))
+            self.db.execute("DELETE FROM checkpoints "
+                            "WHERE nid = ? AND name = 'next_sync'",
+                            (self.nid,))
+        if users:
+            self.sync_users()
+        return MirrorSyncResult(fetched, deleted, resumed)
+
+    def sync_users(self):
+        """Replace the stored users with the current ones"""
+        users = list(self.network.iter_all_users())
+        with self.db:
+            self.db.execute("DELETE FROM users WHERE nid = ?", (self.nid,))
+            self.db.executemany(
+                "INSERT INTO users VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.nid, user["id"], user.get("name"), user.get("email"),
+                  user.get("role"), json.dumps(user)) for user in users])
+
+    def pending_count(self):
+        """Number of posts an interrupted sync has yet to fetch"""
+        return self.db.execute("SELECT COUNT(*) FROM pending WHERE nid = ?",
+                               (self.nid,)).fetchone()[0]
+
+    def _fetch_pending(self, concurrency):
+        cids = [row[0] for row in self.db.execute(
+            "SELECT id FROM pending WHERE nid = ? ORDER BY position",
+            (self.nid,))]
+
+        def fetch(cid):
+            try:
+                return cid, self.network.get_post(cid, cached=False)
+            except RequestError as e:
+                if not _is_not_found(e):
+                    # Left pending, to be fetched when the sync resumes
+                    raise
+                # Deleted since the feed was read
+                return cid, None
+
+        fetched = []
+        batch = []
+        results = imap(fetch, cids, concurrency) if concurrency > 1 else \
+            map(fetch, cids)
+        try:
+            for cid, post in results:
+                batch.append((cid, post))
+                if len(batch) >= self.batch_size:
+                    fetched.extend(self._commit(batch))
+                    batch = []
+        finally:
+            if hasattr(results, "close"):
+                results.close()
+            # Keep what was fetched before any error
+            fetched.extend(self._commit(batch))
+        return fetched
+
+    def _commit(self, batch):
+        """Store a batch of fetched posts and mark them done"""
+        with self.db:
+            for cid, post in batch:
+                if post is None:
+                    self._delete_post(cid)
+                else:
+                    self._store_post(post)
+            self.db.executemany(
+                "DELETE FROM pending WHERE nid = ? AND id = ?",
+                [(self.nid, cid) for cid, _ in batch])
+        return [cid for cid, post in batch if post is not None]
+
+    def _store_post(self, post):
+        if self.delta_history:
+            post = compact_history(post)
+        history = post.get("history") or [{}]
+        self.db.execute(
+            "INSERT OR REPLACE INTO posts VALUES "
+            "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.nid, post["id"], post.get("nr"), history[-1].get("uid"),
+             post.get("type"), post.get("status"), post.get("created"),
+             history[0].get("created"), history[0].get("subject"),
+             json.dumps(post)))
+        self.db.execute("DELETE FROM post_folders WHERE nid = ? AND id = ?",
+                        (self.nid, post["id"]))
+        self.db.executemany(
+            "INSERT OR IGNORE INTO post_folders VALUES (?, ?, ?)",
+            [(self.nid, folder, post["id"])
+             for folder in post.get("folders") or ()])
+
+    def _delete_post(self, cid):
+        for table in ("posts", "post_folders"):
+            self.db.execute(
+                "DELETE FROM {} WHERE nid = ? AND id = ?".format(table),
+                (self.nid, cid))
+
+    def _store_feed(self, feed):
+        self.db.execute("DELETE FROM feed WHERE nid = ?", (self.nid,))
+        self.db.executemany(
+            "INSERT INTO feed VALUES (?, ?, ?, ?)",
+            [(self.nid, i, item["id"], json.dumps(item))
+             for i, item in enumerate(feed)])
+
+    def _checkpoint(self, name):
+        row = self.db.execute(
+            "SELECT body FROM checkpoints WHERE nid = ? AND name = ?",
+            (self.nid, name)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set_checkpoint(self, name, value):
+        self.db.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?)",
+                        (self.nid, name, json.dumps(value)))
+
+    ###########
+    # Queries #
+    ###########
+
+    def get_post(self, cid, typed=False, full_history=True):
+        """Return the stored post ``cid`` (its ``id`` or ``nr``), or
+        ``None``
+
+        :type typed: bool
+        :param typed: Return a :class:`Post` instead of a dict
+        :type full_history: bool
+        :param full_history: Rebuild the full text of every revision;
+            otherwise older revisions may be left as deltas, which is
+            cheaper when only the newest one is needed (see
+            :func:`revision`)
+        """
+        row = self.db.execute(
+            "SELECT body FROM posts WHERE nid = ? AND (id = ? OR nr = ?)",
+            (self.nid, str(cid), _int_or_none(cid))).fetchone()
+        if row is None:
+            return None
+        post = _load_post(row[0], full_history)
+        return Post.from_dict(post) if typed else post
+
+    def iter_posts(self, folder=None, uid=None, since=None, until=None,
+                   limit=None, typed=False, full_history=True):
+        """Iterate over the stored posts matching all the filters given,
+        newest (highest ``nr``) first
+
+        :type folder: str|None
+        :param folder: Only posts in this folder
+        :type uid: str|None
+        :param uid: Only posts created by this user
+        :type since: str|None
+        :param since: Only posts created at or after this ISO 8601 time
+            (e.g. ``"2020-09-01"``)
+        :type until: str|None
+        :param until: Only posts created before this ISO 8601 time
+        :type limit: int|None
+        :param limit: Maximum number of posts
+        :type typed: bool
+        :param typed: Yield :class:`Post` instances instead of dicts
+        :type full_history: bool
+        :param full_history: See :meth:`get_post`
+        """
+        where, params = self._filters(folder, uid, since, until)
+        sql = "SELECT body FROM posts WHERE {} ORDER BY nr DESC".format(where)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        for (body,) in self.db.execute(sql, params):
+            post = _load_post(body, full_history)
+            yield Post.from_dict(post) if typed else post
+
+    def count_posts(self, folder=None, uid=None, since=None, until=None):
+        """Number of stored posts matching all the filters given (see
+        :meth:`iter_posts`)
+        """
+        where, params = self._filters(folder, uid, since, until)
+        return self.db.execute(
+            "SELECT COUNT(*) FROM posts WHERE {}".format(where),
+            params).fetchone()[0]
+
+    def folders(self):
+        """Return ``{folder: number of posts}`` for the stored posts"""
+        return dict(self.db.execute(
+            "SELECT folder, COUNT(*) FROM post_folders WHERE nid = ? "
+            "GROUP BY folder", (self.nid,)))
+
+    def get_feed(self):
+        """Return the feed items stored by the last sync, in feed order"""
+        return [json.loads(body) for (body,) in self.db.execute(
+            "SELECT body FROM feed WHERE nid = ? ORDER BY position",
+            (self.nid,))]
+
+    def get_user(self, uid, typed=False):
+        """Return the stored user ``uid``, or ``None``"""
+        row = self.db.execute(
+            "SELECT body FROM users WHERE nid = ? AND id = ?",
+            (self.nid, uid)).fetchone()
+        if row is None:
+            return None
+        user = json.loads(row[0])
+        return User.from_dict(user) if typed else user
+
+    def get_all_users(self, typed=False):
+        """Return the stored users"""
+        users = [json.loads(body) for (body,) in self.db.execute(
+            "SELECT body FROM users WHERE nid = ? ORDER BY id", (self.nid,))]
+        return [User.from_dict(u) for u in users] if typed else users
+
+    def _filters(self, folder, uid, since, until):
+        where = ["nid = ?"]
+        params = [self.nid]
+        if folder is not None:
+            where.append("id IN (SELECT id FROM post_folders "
+                         "WHERE nid = ? AND folder = ?)")
+            params.extend((self.nid, folder))
+        if uid is not None:
+            where.append("uid = ?")
+            params.append(uid)
+        if since is not None:
+            where.append("created >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("created < ?")
+            params.append(until)
+        return " AND ".join(where), params
+
+
+def _load_post(body, full_history):
+    post = json.loads(body)
+    return expand_history(post) if full_history else post
+
+
+def _int_or_none(cid):
+    try:
+        return int(cid)
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_not_found(error):
+    """Whether ``error`` is Piazza reporting that a post does not exist"""
+    response = error.response
+    return isinstance(response, dict) and \
+        _NOT_FOUND in str(response.get("error") or "")
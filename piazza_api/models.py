@@ -0,0 +1,279 @@
+"""Compact typed wrappers for posts, feed items and users
+
+The API returns plain nested dicts, which are convenient but large: a post
+with its full ``history``, ``change_log`` and ``children`` easily takes
+tens of kilobytes in memory. The classes here store scalar fields in
+``__slots__`` and keep the heavy subtrees as encoded (and, when large,
+zlib-compressed) JSON that is only decoded, and then kept, the first time
+it is accessed. Subtrees too small for that to pay off are kept as they
+are.
+
+Field names and meanings follow
+``data_descriptions/Piazza_API_Post_Data_Dictionary.md``. Fields missing
+from a response are ``None`` as attributes; fields not listed here are
+kept as well and can be read with ``model["name"]`` or :meth:`Model.get`.
+
+Models also support ``model["field"]``, ``in`` and :meth:`Model.get` with
+the semantics of the dict they were made from, so that they can be passed
+to methods expecting a post dict, e.g. :meth:`Network.create_followup`.
+"""
+import zlib
+
+from piazza_api.serialization import get_backend
+
+# Subtrees of about this many bytes of JSON or less are not encoded
+_ENCODE_THRESHOLD = 256
+
+# Encoded subtrees larger than this many bytes are also compressed
+_COMPRESS_THRESHOLD = 512
+
+
+class _Encoded(object):
+    """A JSON subtree that has not been decoded yet
+
+    Small subtrees are kept decoded: encoding them would take longer, and
+    save less memory, than it is worth.
+    """
+    __slots__ = ('data', 'encoded', 'compressed')
+
+    def __init__(self, value):
+        self.encoded = not _smaller_than(value, _ENCODE_THRESHOLD)
+        self.compressed = False
+        if not self.encoded:
+            self.data = value
+            return
+        data = get_backend().dumps(value)
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        self.compressed = len(data) > _COMPRESS_THRESHOLD
+        self.data = zlib.compress(data, 1) if self.compressed else data
+
+    def decode(self):
+        if not self.encoded:
+            return self.data
+        data = zlib.decompress(self.data) if self.compressed else self.data
+        return get_backend().loads(data)
+
+
+def _smaller_than(value, size):
+    """Whether ``value`` takes about ``size`` bytes of JSON or less
+
+    Stops walking ``value`` as soon as it is known to be larger, so this
+    is much cheaper than encoding it.
+    """
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, str):
+            size -= len(value) + 2
+        elif isinstance(value, dict):
+            size -= 2
+            for key, item in value.items():
+                size -= len(key) + 4
+                if size < 0:
+                    return False
+                stack.append(item)
+        elif isinstance(value, list):
+            size -= len(value) + 2
+            stack.extend(value)
+        else:
+            size -= 5
+        if size < 0:
+            return False
+    return True
+
+
+class _Lazy(object):
+    """Descriptor decoding a heavy subtree on first access
+
+    :param slot: Name of the slot holding the encoded or decoded value
+    :param wrap: Optional function applied to the decoded value
+    """
+    def __init__(self, slot, wrap=None):
+        self.slot = slot
+        self.wrap = wrap
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot)
+        if isinstance(value, _Encoded):
+            value = value.decode()
+            if self.wrap is not None and value is not None:
+                value = self.wrap(value)
+            setattr(obj, self.slot, value)
+        return value
+
+
+class Model(object):
+    """Base class of the typed wrappers
+
+    Subclasses list their eagerly decoded fields in ``_fields`` and their
+    lazily decoded ones in ``_lazy_fields``; each lazy field ``name`` needs
+    a ``_name`` slot and a :class:`_Lazy` descriptor. The slots of fields
+    missing from the response are left unset.
+    """
+    __slots__ = ('_extra',)
+    _fields = ()
+    _lazy_fields = ()
+
+    @classmethod
+    def from_dict(cls, d):
+        """Wrap the dict ``d`` returned by the API
+
+        :type d: dict
+        :rtype: Model
+        """
+        obj = cls.__new__(cls)
+        extra = dict(d)
+        for name in cls._fields:
+            if name in extra:
+                setattr(obj, name, extra.pop(name))
+        for name in cls._lazy_fields:
+            if name in extra:
+                value = extra.pop(name)
+                setattr(obj, '_' + name,
+                        None if value is None else _Encoded(value))
+        obj._extra = extra
+        return obj
+
+    def to_dict(self):
+        """Return the data as the plain dict the API returned
+
+        :rtype: dict
+        """
+        d = dict(self._extra)
+        for name in self._fields:
+            if self._has(name):
+                d[name] = getattr(self, name)
+        for name in self._lazy_fields:
+            if self._has(name):
+                d[name] = _to_plain(getattr(self, name))
+        return d
+
+    def get(self, key, default=None):
+        """Like :meth:`dict.get`"""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def _has(self, name):
+        """Whether field ``name`` was in the response"""
+        slot = '_' + name if name in self._lazy_fields else name
+        try:
+            object.__getattribute__(self, slot)
+        except AttributeError:
+            return False
+        return True
+
+    def __getattr__(self, name):
+        # Only called for unset slots, i.e. fields missing from the response
+        if name in self._fields or name.lstrip('_') in self._lazy_fields:
+            return None
+        raise AttributeError(name)
+
+    def __getitem__(self, key):
+        if key in self._fields or key in self._lazy_fields:
+            if not self._has(key):
+                raise KeyError(key)
+            return getattr(self, key)
+        return self._extra[key]
+
+    def __contains__(self, key):
+        if key in self._fields or key in self._lazy_fields:
+            return self._has(key)
+        return key in self._extra
+
+    def __repr__(self):
+        return "{}(id={!r})".format(type(self).__name__,
+                                    getattr(self, 'id', None))
+
+
+def _to_plain(value):
+    if isinstance(value, Model):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_to_plain(v) for v in value]
+    return value
+
+
+def _followups(children):
+    return [Followup.from_dict(c) for c in children]
+
+
+class Followup(Model):
+    """A follow-up, feedback reply or answer in a post's ``children``
+
+    ``children`` holds the nested replies as :class:`Followup` objects.
+    """
+    _fields = ('id', 'type', 'subject', 'created', 'updated', 'uid', 'anon',
+               'no_upvotes', 'folders', 'bucket_name', 'bucket_order',
+               'tag_good_arr', 'config', 'data')
+    _lazy_fields = ('children', 'history', 'tag_good')
+    __slots__ = _fields + ('_children', '_history', '_tag_good')
+
+    children = _Lazy('_children', _followups)
+    history = _Lazy('_history')
+    tag_good = _Lazy('_tag_good')
+
+
+class Post(Model):
+    """A full post as returned by :meth:`Network.get_post`
+
+    ``history``, ``children``, ``change_log``, ``tag_good`` and ``drafts``
+    are decoded on first access. The latest revision is kept decoded in
+    :attr:`latest`, so :attr:`subject` and :attr:`content` are cheap.
+    """
+    _fields = ('id', 'nr', 'type', 'folders', 'tags', 'created', 'status',
+               'uid', 'history_size', 'unique_views', 'no_answer_followup',
+               'bucket_name', 'bucket_order', 'num_favorites', 'bookmarked',
+               'is_bookmarked', 'my_favorite', 'my_post', 'is_tag_good',
+               'tag_good_arr', 'request_instructor', 'request_instructor_me',
+               'default_anonymity', 'config', 'data', 't')
+    _lazy_fields = ('history', 'children', 'change_log', 'tag_good',
+                    'drafts')
+    __slots__ = _fields + ('_history', '_children', '_change_log',
+                           '_tag_good', '_drafts', 'latest')
+
+    history = _Lazy('_history')
+    children = _Lazy('_children', _followups)
+    change_log = _Lazy('_change_log')
+    tag_good = _Lazy('_tag_good')
+    drafts = _Lazy('_drafts')
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = super(Post, cls).from_dict(d)
+        history = d.get('history')
+        #: Newest entry of ``history`` (a dict), or ``None``
+        obj.latest = history[0] if history else None
+        return obj
+
+    @property
+    def subject(self):
+        """Subject of the latest revision"""
+        return self.latest.get('subject') if self.latest else None
+
+    @property
+    def content(self):
+        """Content of the latest revision"""
+        return self.latest.get('content') if self.latest else None
+
+
+class FeedItem(Model):
+    """An item of a feed, as returned by :meth:`Network.iter_feed`"""
+    _fields = ('id', 'nr', 'type', 'subject', 'snippet', 'folders', 'tags',
+               'updated', 'modified', 'status', 'main_version',
+               'no_answer_followup', 'num_followups', 'unique_views',
+               'is_new', 'bookmarked', 'num_favorites', 'request_instructor',
+               'tag_good_arr')
+    __slots__ = _fields
+
+
+class User(Model):
+    """A user of a network, as returned by :meth:`Network.get_all_users`"""
+    _fields = ('id', 'name', 'email', 'role', 'admin', 'photo', 'photo_url',
+               'published', 'us', 'facebook_id', 'days', 'posts', 'asks',
+               'answers', 'views', 'class_sections')
+    __slots__ = _fields
@@ -1,5 +1,12 @@
 from collections import namedtuple
+import functools
+import itertools
 import time
+import warnings
+from .models import FeedItem, Post, User
+from .pool import imap
+from .projection import project
+from .tracing import traced
 from .rpc import PiazzaRPC
 
 
@@ -39,6 +46,62 @@ class FolderFilter(FeedFilter):
         return dict(folder=True, filter_folder=self.folder_name)
 
 
+########
+# Sync #
+########
+
+#: Fields of a feed item that change when the post or its follow-ups do
+SYNC_MARKERS = ("updated", "modified", "main_version", "history_size",
+                "no_answer_followup", "num_followups", "status")
+
+#: Fields of a feed item; :meth:`Network.iter_posts` only fetches full
+#: posts when asked for other fields
+FEED_FIELDS = frozenset(FeedItem._fields)
+
+SyncResult = namedtuple('SyncResult', ['changed', 'deleted', 'state'])
+SyncResult.__doc__ = """Result of :meth:`Network.sync`
+
+:ivar changed: Full posts that are new or changed since the last sync
+:ivar deleted: ids of posts that disappeared from the feed
+:ivar state: Sync state to pass to the next call of :meth:`Network.sync`
+"""
+
+
+def _merge_feed_item(post, item, fields):
+    """Fill in the fields in ``fields`` that only the feed item ``item``
+    has (e.g. ``snippet``) into the full ``post``
+    """
+    for name in fields:
+        if name not in post and name in item:
+            post[name] = item[name]
+    return post
+
+
+def _markers(item):
+    """Values of the :data:`SYNC_MARKERS` of feed item ``item``"""
+    return [item.get(k) for k in SYNC_MARKERS]
+
+
+def _diff_feed(feed_items, state, complete):
+    """Compare feed items with a sync state
+
+    :type complete: bool
+    :param complete: Whether ``feed_items`` is the whole feed, i.e. posts
+        missing from it were deleted
+    :returns: Tuple of ``(cids to fetch, deleted cids, new state)``
+    """
+    old = (state or {}).get("posts", {})
+    new = {} if complete else dict(old)
+    to_fetch = []
+    for item in feed_items:
+        markers = _markers(item)
+        new[item["id"]] = markers
+        if old.get(item["id"]) != markers:
+            to_fetch.append(item["id"])
+    deleted = [cid for cid in old if cid not in new]
+    return to_fetch, deleted, {"posts": new}
+
+
 ###########
 # Network #
 ###########
@@ -49,11 +112,44 @@ class Network(object):
     :param network_id: ID of the network
     :param session: requests.Session object containing cookies used for
         authentication
+    :type  rate_limiter: :class:`RateLimiter`|None
+    :param rate_limiter: Rate limiter shared with the other networks of the
+        same account
+    :type  retry_policy: :class:`RetryPolicy`|None
+    :param retry_policy: When to retry requests that failed for transient
+        reasons
+    :type  post_cache: :class:`PostCache`|None
+    :param post_cache: Cache that ``get_post`` is served from when possible
+    :type  json_backend: str|:class:`JSONBackend`|None
+    :param json_backend: JSON implementation to use
+    :type  single_flight: :class:`SingleFlight`|bool|None
+    :param single_flight: Coalesces identical concurrent read requests;
+        see :class:`PiazzaRPC`
+    :type  metrics: :class:`Metrics`|None
+    :param metrics: Where request metrics are recorded, if anywhere
+    :type  tracer: :class:`Tracer`|None
+    :param tracer: If given, requests and the operations of this object
+        that make them are traced
+    :type  base_url: str|None
+    :param base_url: Where Piazza is served from; see :class:`PiazzaRPC`
     """
-    def __init__(self, network_id, session):
+    _rpc_cls = PiazzaRPC
+
+    def __init__(self, network_id, session, rate_limiter=None,
+                 retry_policy=None, post_cache=None, json_backend=None,
+                 single_flight=None, metrics=None, tracer=None,
+                 base_url=None):
         self._nid = network_id
-        self._rpc = PiazzaRPC(network_id=self._nid)
-        self._rpc.session = session
+        self._rpc = self._rpc_cls(network_id=self._nid,
+                                  session=session,
+                                  rate_limiter=rate_limiter,
+                                  retry_policy=retry_policy,
+                                  post_cache=post_cache,
+                                  json_backend=json_backend,
+                                  single_flight=single_flight,
+                                  metrics=metrics,
+                                  tracer=tracer,
+                                  base_url=base_url)
 
         ff = namedtuple('FeedFilters', ['unread', 'following', 'folder'])
         self._feed_filters = ff(UnreadFilter, FollowingFilter, FolderFilter)
@@ -72,45 +168,169 @@ class Network(object):
     # Posts #
     #########
 
-    def get_post(self, cid):
+    @traced("cid")
+    def get_post(self, cid, typed=False, fields=None, exclude=None,
+                 max_history=None, cached=True):
         """Get data from post `cid`
 
         :type  cid: str|int
         :param cid: This is the post ID to get
-        :rtype: dict
+        :type  typed: bool
+        :param typed: Return a compact :class:`Post` instead of a dict
+        :type  fields: iterable of str|None
+        :param fields: Only keep these top-level fields of the post (``id``
+            is always kept); see :func:`piazza_api.projection.project`
+        :type  exclude: iterable of str|None
+        :param exclude: Drop these top-level fields of the post
+        :type  max_history: int|None
+        :param max_history: Only keep this many of the newest revisions in
+            ``history``
+        :type  cached: bool
+        :param cached: If unset, the post is fetched from Piazza even if it
+            is in the post cache, and the cache is updated with it
+        :rtype: dict|Post
         :returns: Dictionary with all data on the post
         """
-        return self._rpc.content_get(cid=cid)
-
-    def iter_all_posts(self, limit=None, sleep=0):
+        post = project(self._rpc.content_get(cid=cid, cached=cached),
+                       fields, exclude, max_history)
+        return Post.from_dict(post) if typed else post
+
+    @traced("limit")
+    def iter_all_posts(self, limit=None, sleep=0, concurrency=None,
+                       ordered=True, page_size=100, typed=False,
+                       fields=None, exclude=None, max_history=None,
+                       prefetch=None):
         """Get all posts visible to the current user
 
-        This grabs you current feed and ids of all posts from it; each post
-        is then individually fetched. This method does not go against
+        This pages through your feed (see :meth:`iter_feed`) and
+        individually fetches each post in it as its page arrives. This method does not go against
         a bulk endpoint; it retrieves each post individually, so a
         caution to the user when using this.
 
         :type limit: int|None
-        sleep:int -- If given, will allow to actually iterate through all of 
-            Piazza channel's posts without getting kicked or banned by Piazza.
-            Around 1 second works in practice if you're iterating through
-            a lot of posts.
+        sleep:int -- Deprecated; pass a :class:`RateLimiter` to
+            :class:`Piazza` instead, which throttles every request rather
+            than just this loop. If given, sleeps this many seconds before
+            each post is fetched.
         :param limit: If given, will limit the number of posts to fetch
             before the generator is exhausted and raises StopIteration.
             No special consideration is given to `0`; provide `None` to
             retrieve all posts.
+        :type concurrency: int|None
+        :param concurrency: If given, posts are fetched by a pool of this
+            many threads instead of one after another
+        :type ordered: bool
+        :param ordered: Only used with ``concurrency`` or ``prefetch``. If
+            set (the default), posts are yielded in feed order; otherwise
+            they are yielded in the order in which their fetches complete
+        :type prefetch: int|None
+        :param prefetch: If given, up to this many of the next posts are
+            fetched in the background while the caller works on the
+            current one. Without ``concurrency`` they are fetched by
+            ``prefetch`` threads; with it, at most ``prefetch`` fetches are
+            pending at a time (by default twice ``concurrency``). Fetches
+            that have not started are cancelled when the generator is
+            closed or ``limit`` is reached.
+        :type page_size: int
+        :param page_size: Number of feed items requested at a time
+        :type typed: bool
+        :param typed: Yield compact :class:`Post` objects instead of dicts
+        :param fields, exclude, max_history: Trim each post as soon as it
+            has been fetched; see :meth:`get_post`. This keeps the memory
+            used by long crawls down.
         :returns: An iterator which yields all posts which the current user
             can view
         :rtype: generator
         """
-        feed = self.get_feed(limit=999999, offset=0)
-        cids = [post['id'] for post in feed["feed"]]
+        feed = self.iter_feed(page_size=page_size)
+        cids = (item['id'] for item in feed)
         if limit is not None:
-            cids = cids[:limit]
-        for cid in cids:
+            cids = itertools.islice(cids, limit)
+        if sleep:
+            warnings.warn("The sleep argument of iter_all_posts is "
+                          "deprecated; use a RateLimiter instead",
+                          DeprecationWarning, stacklevel=2)
+
+        def fetch(cid):
             time.sleep(sleep)
-            yield self.get_post(cid)
+            return self.get_post(cid, typed=typed, fields=fields,
+                                 exclude=exclude, max_history=max_history)
+
+        if concurrency or prefetch:
+            posts = imap(fetch, cids, concurrency or prefetch,
+                         ordered=ordered, window=prefetch)
+        else:
+            posts = map(fetch, cids)
+        try:
+            for post in posts:
+                yield post
+        finally:
+            if hasattr(posts, 'close'):
+                posts.close()
+            feed.close()
+
+    @traced("limit")
+    def iter_posts(self, fields=None, limit=None, concurrency=4,
+                   page_size=100, typed=False):
+        """Iterate over the posts in your feed, fetching as little as needed
+
+        Feed items already carry the subject, snippet, folders, tags and
+        timestamps of each post (see :data:`FEED_FIELDS`). If ``fields`` is
+        ``None`` or only names such fields, feed items are yielded and no
+        post is fetched. Otherwise each post is fetched in full, with up
+        to ``concurrency`` posts fetched ahead of the one being consumed,
+        and trimmed to ``fields``.
+
+        Example:
+            >>> # One request per page of the feed
+            >>> titles = [p["subject"] for p in network.iter_posts(
+            ...     fields=("nr", "subject"))]
+            >>> # One more request per post
+            >>> bodies = network.iter_posts(fields=("nr", "history"))
+
+        :type fields: iterable of str|None
+        :param fields: Fields the caller needs; ``id`` is always included.
+            When posts are fetched, fields that only feed items have (e.g.
+            ``snippet``) are copied over from the feed item.
+        :type limit: int|None
+        :param limit: If given, stop after this many posts
+        :type concurrency: int
+        :param concurrency: Number of full posts fetched at once
+        :type page_size: int
+        :param page_size: Number of feed items requested at a time
+        :type typed: bool
+        :param typed: Yield :class:`FeedItem` or :class:`Post` objects
+            instead of dicts
+        :rtype: generator
+        """
+        if fields is not None:
+            fields = tuple(fields)
+        feed = self.iter_feed(page_size=page_size)
+        items = feed
+        if limit is not None:
+            items = itertools.islice(items, limit)
+        if fields is None or FEED_FIELDS.issuperset(fields):
+            try:
+                for item in items:
+                    item = project(item, fields)
+                    yield FeedItem.from_dict(item) if typed else item
+            finally:
+                feed.close()
+            return
+
+        def fetch(item):
+            post = self.get_post(item["id"], fields=fields)
+            return _merge_feed_item(post, item, fields)
+
+        posts = imap(fetch, items, concurrency)
+        try:
+            for post in posts:
+                yield Post.from_dict(post) if typed else post
+        finally:
+            posts.close()
+            feed.close()
 
+    @traced()
     def create_post(self, post_type, post_folders, post_subject, post_content, is_announcement=0, bypass_email=0, anonymous=False):
         """Create a post
 
@@ -152,6 +372,7 @@ class Network(object):
 
         return self._rpc.content_create(params)
 
+    @traced("post")
     def create_followup(self, post, content, anonymous=False, instructor=False):
         """Create a follow-up on a post `post`.
 
@@ -256,6 +477,7 @@ class Network(object):
         }
         return self._rpc.content_create(params)
 
+    @traced("post")
     def update_post(self, post, content):
         """Update post content by cid
 
@@ -281,6 +503,7 @@ class Network(object):
         }
         return self._rpc.content_update(params)
 
+    @traced("duplicated_cid", "master_cid")
     def mark_as_duplicate(self, duplicated_cid, master_cid, msg=''):
         """Mark the post at ``duplicated_cid`` as a duplicate of ``master_cid``
 
@@ -294,8 +517,8 @@ class Network(object):
         :param msg: the optional message (or reason for marking as duplicate)
         :returns: True if it is successful. False otherwise
         """
-        content_id_from = self.get_post(duplicated_cid)["id"]
-        content_id_to = self.get_post(master_cid)["id"]
+        content_id_from = self.get_post(duplicated_cid, fields=())["id"]
+        content_id_to = self.get_post(master_cid, fields=())["id"]
         params = {
             "cid_dupe": content_id_from,
             "cid_to": content_id_to,
@@ -303,6 +526,7 @@ class Network(object):
         }
         return self._rpc.content_mark_duplicate(params)
 
+    @traced("post")
     def resolve_post(self, post):
         """Mark post as resolved
 
@@ -323,6 +547,7 @@ class Network(object):
 
         return self._rpc.content_mark_resolved(params)
 
+    @traced("post", "unpin")
     def pin_post(self, post, unpin=False):
         """Pin/Unpin post
 
@@ -343,6 +568,7 @@ class Network(object):
 
         return self._rpc.content_pin(params, unpin=unpin)
 
+    @traced("post")
     def delete_post(self, post):
         """ Deletes post by cid
 
@@ -367,6 +593,7 @@ class Network(object):
 
         return self._rpc.content_delete(params)
 
+    @traced("post")
     def add_feedback(self, post):
         """Marks a post as a good note
         :type post: dict|str|int
@@ -391,6 +618,7 @@ class Network(object):
 
         return self._rpc.content_add_feedback(params)
 
+    @traced("post")
     def remove_feedback(self, post):
         """Unmarks a post as a good note
         :type post: dict|str|int
@@ -439,21 +667,30 @@ class Network(object):
         """
         return iter(self.get_users(user_ids=user_ids))
 
-    def get_all_users(self):
+    @traced()
+    def get_all_users(self, typed=False):
         """Get a listing of data for all users in this network
 
+        :type typed: bool
+        :param typed: Return compact :class:`User` objects instead of dicts
         :rtype: list
         :returns: Python object containing returned data, a list
             of dicts containing user data.
         """
-        return self._rpc.get_all_users()
+        users = self._rpc.get_all_users()
+        return [User.from_dict(u) for u in users] if typed else users
 
-    def iter_all_users(self):
+    @traced()
+    def iter_all_users(self, typed=False):
         """Same as ``Network.get_all_users``, but returns an iterable instead
 
-        :rtype: listiterator
+        The response is decoded one user at a time as it is received, so
+        the whole list never has to be held in memory.
+
+        :rtype: generator
         """
-        return iter(self.get_all_users())
+        for user in self._rpc.iter_all_users():
+            yield User.from_dict(user) if typed else user
 
     def add_students(self, student_emails):
         """Add students with ``student_emails`` to the network
@@ -488,7 +725,8 @@ class Network(object):
     # Feed #
     ########
 
-    def get_feed(self, limit=100, offset=0):
+    @traced("limit", "offset")
+    def get_feed(self, limit=100, offset=0, fields=None, exclude=None):
         """Get your feed for this network
 
         Pagination for this can be achieved by using the ``limit`` and
@@ -498,6 +736,11 @@ class Network(object):
         :param limit: Number of posts from feed to get, starting from ``offset``
         :type offset: int
         :param offset: Offset starting from bottom of feed
+        :type fields: iterable of str|None
+        :param fields: Only keep these fields of each feed item (``id`` is
+            always kept)
+        :type exclude: iterable of str|None
+        :param exclude: Drop these fields of each feed item
         :rtype: dict
         :returns: Feed metadata, including list of posts in feed format; this
             means they are not the full posts but only in partial form as
@@ -505,8 +748,93 @@ class Network(object):
             returned dicts only have content snippets of posts rather
             than the full text.
         """
-        return self._rpc.get_my_feed(limit=limit, offset=offset)
-
+        feed = self._rpc.get_my_feed(limit=limit, offset=offset)
+        if fields is not None or exclude is not None:
+            feed = dict(feed)
+            feed["feed"] = [project(item, fields, exclude)
+                            for item in feed["feed"]]
+        return feed
+
+    @traced("page_size")
+    def iter_feed(self, page_size=100, stream=False, typed=False,
+                  fields=None, exclude=None):
+        """Iterate over your whole feed for this network, one page at a time
+
+        Unlike requesting the whole feed with :meth:`get_feed`, only one
+        page of ``page_size`` items is held in memory at a time and the
+        first items are available as soon as the first page arrives.
+
+        The feed is sorted by update time, so a post updated while the
+        pages are read moves to its head and could be missed. Once the
+        last page has been read, the head of the feed is read again, up to
+        the first post that has not changed since it was yielded, and the
+        posts not yielded yet are yielded then. Each post is yielded once.
+
+        :type page_size: int|None
+        :param page_size: Number of feed items to request at a time; with
+            ``stream``, ``None`` requests the whole feed at once
+        :type stream: bool
+        :param stream: Decode each page item by item as it is received
+            instead of all at once, so that only about one item is held
+            in memory at a time
+        :type typed: bool
+        :param typed: Yield :class:`FeedItem` objects instead of dicts
+        :param fields, exclude: Trim each feed item; see :meth:`get_feed`
+        :returns: An iterator which yields feed items (see :meth:`get_feed`)
+        :rtype: generator
+        """
+        if page_size is None and not stream:
+            raise ValueError("page_size is required unless streaming")
+        # id -> markers of every item yielded
+        seen = {}
+        for item in self._iter_feed_pages(page_size, stream):
+            # Posts can move between pages while paging through a feed
+            # sorted by update time, so the same post may come up twice
+            if item['id'] not in seen:
+                seen[item['id']] = _markers(item)
+                item = project(item, fields, exclude)
+                yield FeedItem.from_dict(item) if typed else item
+        if page_size is None:
+            # The whole feed was read at once
+            return
+
+        found = True
+        while found:
+            found = False
+            head = self._iter_feed_pages(page_size, stream)
+            try:
+                for item in head:
+                    markers = _markers(item)
+                    if seen.get(item['id']) == markers:
+                        # Unchanged, so are all the posts after it
+                        break
+                    new = item['id'] not in seen
+                    seen[item['id']] = markers
+                    if new:
+                        found = True
+                        item = project(item, fields, exclude)
+                        yield FeedItem.from_dict(item) if typed else item
+            finally:
+                head.close()
+
+    def _iter_feed_pages(self, page_size, stream):
+        """Items of the whole feed, requested ``page_size`` at a time"""
+        limit = 999999 if page_size is None else page_size
+        offset = 0
+        while True:
+            if stream:
+                page = self._rpc.iter_my_feed(limit=limit, offset=offset)
+            else:
+                page = self.get_feed(limit=limit, offset=offset)["feed"]
+            count = 0
+            for item in page:
+                count += 1
+                yield item
+            if page_size is None or count < page_size:
+                return
+            offset += count
+
+    @traced()
     def get_filtered_feed(self, feed_filter):
         """Get your feed containing only posts filtered by ``feed_filter``
 
@@ -519,6 +847,7 @@ class Network(object):
                                         FolderFilter))
         return self._rpc.filter_feed(**feed_filter.to_kwargs())
 
+    @traced("query")
     def search_feed(self, query):
         """Search for posts with ``query``, returned in feed format
 
@@ -529,6 +858,51 @@ class Network(object):
         """
         return self._rpc.search(query=query)
 
+    ########
+    # Sync #
+    ########
+
+    @traced()
+    def sync(self, state=None, feed_filter=None, concurrency=None):
+        """Fetch only the posts that changed since the last sync
+
+        The feed is read with a single request and each item's modification
+        markers (see :data:`SYNC_MARKERS`) are compared with ``state``;
+        only posts that are new or whose markers changed are fetched in
+        full. Syncing an unchanged network costs one request.
+
+        Example:
+            >>> result = network.sync()
+            >>> save(result.changed)
+            >>> json.dump(result.state, open("state.json", "w"))
+            >>> # ... the next day
+            >>> result = network.sync(json.load(open("state.json")))
+
+        :type state: dict|None
+        :param state: ``state`` of the previous :class:`SyncResult`; it is
+            a JSON-serializable dict. ``None`` fetches every post.
+        :type feed_filter: FeedFilter|None
+        :param feed_filter: Only sync the posts in this filtered feed. Posts
+            missing from a filtered feed are not reported as deleted.
+        :type concurrency: int|None
+        :param concurrency: Fetch changed posts with this many threads; see
+            :meth:`iter_all_posts`
+        :rtype: SyncResult
+        """
+        if feed_filter is None:
+            feed = self.get_feed(limit=999999, offset=0)
+        else:
+            feed = self.get_filtered_feed(feed_filter)
+        cids, deleted, new_state = _diff_feed(feed["feed"], state,
+                                              complete=feed_filter is None)
+        # The markers say these changed, so a cached copy is out of date
+        fetch = functools.partial(self.get_post, cached=False)
+        if concurrency:
+            changed = list(imap(fetch, cids, concurrency))
+        else:
+            changed = [fetch(cid) for cid in cids]
+        return SyncResult(changed, deleted, new_state)
+
     ##############
     # Statistics #
     ##############
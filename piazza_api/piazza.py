@@ -1,14 +1,90 @@
 from .rpc import PiazzaRPC
 from .network import Network
+from .serialization import get_backend
 
 
 class Piazza(object):
     """Unofficial Client for Piazza's Internal API
 
     :type piazza_rpc: :class:`PiazzaRPC`
+    :type rate_limiter: :class:`RateLimiter`|None
+    :param rate_limiter: Rate limiter applied to every request made through
+        this object, including those of the networks it creates
+    :type retry_policy: :class:`RetryPolicy`|None
+    :param retry_policy: When to retry requests that failed for transient
+        reasons; shared with the networks this object creates
+    :type post_cache: :class:`PostCache`|None
+    :param post_cache: Cache of fetched posts shared with the networks this
+        object creates
+    :type json_backend: str|:class:`JSONBackend`|None
+    :param json_backend: JSON implementation to use; defaults to the
+        fastest one installed
+    :type single_flight: :class:`SingleFlight`|bool|None
+    :param single_flight: Coalesces identical read requests made at the
+        same time, including by different networks created from this
+        object; ``False`` disables it (see :class:`PiazzaRPC`)
+    :type metrics: :class:`Metrics`|None
+    :param metrics: Records per-method metrics of every request made
+        through this object and the networks it creates
+    :type tracer: :class:`Tracer`|None
+    :param tracer: Traces every request made through this object and the
+        operations of the networks it creates
+    :type base_url: str|None
+    :param base_url: Where Piazza is served from, e.g. the URL of a
+        :class:`Simulator`; defaults to https://piazza.com
+    :param session_options: Connection pool settings for the client created
+        on login, e.g. ``pool_maxsize``, ``pool_block``, ``keep_alive`` or
+        ``adapter``; see :class:`PiazzaRPC`. The session and its pool are
+        shared by every network created from this object.
+    :raises TypeError: If given session options :attr:`_rpc_cls` does not
+        take
     """
-    def __init__(self, piazza_rpc=None):
+    _rpc_cls = PiazzaRPC
+    _network_cls = Network
+    # Arguments of _rpc_cls accepted as session_options
+    _session_option_names = ("session", "pool_maxsize", "pool_block",
+                             "keep_alive", "adapter")
+
+    def __init__(self, piazza_rpc=None, rate_limiter=None, retry_policy=None,
+                 post_cache=None, json_backend=None, single_flight=None,
+                 metrics=None, tracer=None, base_url=None,
+                 **session_options):
+        unknown = sorted(set(session_options) -
+                         set(self._session_option_names))
+        if unknown:
+            raise TypeError(
+                "{} got unexpected session options {}; it takes {}".format(
+                    type(self).__name__, ", ".join(unknown),
+                    ", ".join(self._session_option_names)))
         self._rpc_api = piazza_rpc if piazza_rpc else None
+        self._rate_limiter = rate_limiter
+        self._retry_policy = retry_policy
+        self._post_cache = post_cache
+        self._json_backend = json_backend
+        self._single_flight = single_flight
+        self._metrics = metrics
+        self._tracer = tracer
+        self._base_url = base_url
+        self._session_options = session_options
+        self._networks = {}
+        if piazza_rpc:
+            if rate_limiter is not None:
+                piazza_rpc.rate_limiter = rate_limiter
+            if retry_policy is not None:
+                piazza_rpc.retry_policy = retry_policy
+            if post_cache is not None:
+                piazza_rpc.post_cache = post_cache
+            if json_backend is not None:
+                piazza_rpc.json_backend = get_backend(json_backend)
+            if single_flight is not None:
+                piazza_rpc.single_flight = piazza_rpc._single_flight(
+                    single_flight)
+            if metrics is not None:
+                piazza_rpc.metrics = metrics
+            if tracer is not None:
+                piazza_rpc.tracer = tracer
+            if base_url is not None:
+                piazza_rpc.base_url = base_url
 
     def user_login(self, email=None, password=None):
         """Login with email, password and get back a session cookie
@@ -18,7 +94,7 @@ class Piazza(object):
         :type  password: str
         :param password: The password used for authentication
         """
-        self._rpc_api = PiazzaRPC()
+        self._rpc_api = self._new_rpc()
         self._rpc_api.user_login(email=email, password=password)
 
     def demo_login(self, auth=None, url=None):
@@ -30,12 +106,15 @@ class Piazza(object):
         :param url: Example - "https://piazza.com/demo_login?nid=hbj11a1gcvl1s6&auth=06c111b"
         :param auth: Example - "06c111b"
         """
-        self._rpc_api = PiazzaRPC()
+        self._rpc_api = self._new_rpc()
         self._rpc_api.demo_login(auth=auth, url=url)
 
     def network(self, network_id):
         """Returns :class:`Network` instance for ``network_id``
 
+        Instances are cached, so calling this again with the same
+        ``network_id`` returns the same object until the next login.
+
         :type  network_id: str
         :param network_id: This is the ID of the network.
             This can be found by visiting your class page
@@ -43,7 +122,22 @@ class Piazza(object):
             https://piazza.com/class/{network_id}
         """
         self._ensure_authenticated()
-        return Network(network_id, self._rpc_api.session)
+        network = self._networks.get(network_id)
+        if network is None:
+            network = self._networks.setdefault(
+                network_id,
+                self._network_cls(network_id, self._rpc_api.session,
+                                  rate_limiter=self._rpc_api.rate_limiter,
+                                  retry_policy=self._rpc_api.retry_policy,
+                                  post_cache=self._rpc_api.post_cache,
+                                  json_backend=self._rpc_api.json_backend,
+                                  single_flight=self._single_flight_of(
+                                      self._rpc_api),
+                                  metrics=self._rpc_api.metrics,
+                                  tracer=self._rpc_api.tracer,
+                                  base_url=self._rpc_api.base_url)
+            )
+        return network
 
     def get_user_profile(self):
         """Get profile of the current user
@@ -74,7 +168,11 @@ class Piazza(object):
         # raw_classes = self.get_user_profile().get('all_classes').values()
 
         # Get classes from the user status (includes all classes)
-        status = self.get_user_status()
+        return self._classes_from_status(self.get_user_status())
+
+    @staticmethod
+    def _classes_from_status(status):
+        """Extract the list of classes from a ``user.status`` result"""
         uid = status['id']
         raw_classes = status.get('networks', [])
 
@@ -88,5 +186,23 @@ class Piazza(object):
 
         return classes
 
+    def _new_rpc(self):
+        # A new login means a new session, which old networks don't share
+        self._networks = {}
+        return self._rpc_cls(rate_limiter=self._rate_limiter,
+                             retry_policy=self._retry_policy,
+                             post_cache=self._post_cache,
+                             json_backend=self._json_backend,
+                             single_flight=self._single_flight,
+                             metrics=self._metrics,
+                             tracer=self._tracer,
+                             base_url=self._base_url,
+                             **self._session_options)
+
+    @staticmethod
+    def _single_flight_of(rpc):
+        """``single_flight`` argument making a new client share ``rpc``'s"""
+        return False if rpc.single_flight is None else rpc.single_flight
+
     def _ensure_authenticated(self):
         self._rpc_api._check_authenticated()
@@ -0,0 +1,138 @@
+"""Bounded worker pools used to fetch many posts at once"""
+import asyncio
+import collections
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def imap(func, iterable, workers, ordered=True, window=None):
+    """Lazily map ``func`` over ``iterable`` using a pool of ``workers`` threads
+
+    At most ``window`` calls are pending at any time so that memory stays
+    bounded no matter how long ``iterable`` is. Closing the generator early
+    cancels everything that has not started yet. Each call runs in a copy
+    of the context (see :mod:`contextvars`) it was submitted from.
+
+    :type func: callable
+    :param func: Function to call with each item
+    :type iterable: iterable
+    :param iterable: Items to call ``func`` with
+    :type workers: int
+    :param workers: Number of worker threads
+    :type ordered: bool
+    :param ordered: If set, results are yielded in the order of
+        ``iterable``; otherwise as soon as they complete
+    :type window: int|None
+    :param window: Maximum number of calls submitted but not yet yielded;
+        defaults to twice ``workers``
+    :returns: Iterator over the results of ``func``
+    :rtype: generator
+    """
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    window = max(window or 2 * workers, 1)
+    items = iter(iterable)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = collections.deque() if ordered else set()
+    add = pending.append if ordered else pending.add
+    try:
+        for item in items:
+            add(_submit(executor, func, item))
+            if len(pending) >= window:
+                break
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                add = pending.add
+            for future in done:
+                result = future.result()
+                for item in items:
+                    add(_submit(executor, func, item))
+                    break
+                yield result
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def _submit(executor, func, item):
+    context = contextvars.copy_context()
+    return executor.submit(context.run, func, item)
+
+
+async def aimap(func, iterable, workers, ordered=True, window=None):
+    """Asynchronous version of :func:`imap` for coroutine functions
+
+    Runs at most ``workers`` calls of ``func`` concurrently on the running
+    event loop.
+
+    :type func: coroutine function
+    :param func: Coroutine function to call with each item
+    :type iterable: iterable|async iterable
+    :param iterable: Items to call ``func`` with
+    :type window: int|None
+    :param window: Maximum number of calls started but not yet yielded;
+        defaults to ``workers``
+    :rtype: async generator
+    """
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    window = max(window or workers, 1)
+    if window > workers:
+        semaphore = asyncio.Semaphore(workers)
+        call = func
+
+        async def func(item):
+            async with semaphore:
+                return await call(item)
+    next_item = _anext_function(iterable)
+    pending = collections.deque() if ordered else set()
+    add = pending.append if ordered else pending.add
+    try:
+        while len(pending) < window:
+            item = await next_item()
+            if item is _DONE:
+                break
+            add(asyncio.ensure_future(func(item)))
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                add = pending.add
+            for task in done:
+                result = await task
+                item = await next_item()
+                if item is not _DONE:
+                    add(asyncio.ensure_future(func(item)))
+                yield result
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+_DONE = object()
+
+
+def _anext_function(iterable):
+    """Return a coroutine function giving the next item of ``iterable``
+    (which may be asynchronous), or ``_DONE`` once it is exhausted
+    """
+    if hasattr(iterable, '__aiter__'):
+        items = iterable.__aiter__()
+
+        async def next_item():
+            try:
+                return await items.__anext__()
+            except StopAsyncIteration:
+                return _DONE
+    else:
+        items = iter(iterable)
+
+        async def next_item():
+            return next(items, _DONE)
+    return next_item
@@ -0,0 +1,53 @@
+"""Trimming posts and feed items down to the fields a caller needs
+
+A full post carries every revision in ``history`` as well as its
+``change_log``, ``drafts`` and ``tag_good``, most of which is rarely used.
+Projecting a post right after it has been decoded lets that data be freed
+immediately instead of being held for as long as the post is.
+"""
+
+
+def project(obj, fields=None, exclude=None, max_history=None):
+    """Return a copy of the post or feed item ``obj`` with only some fields
+
+    ``obj`` itself is not modified, so it is safe to project posts that are
+    shared with other callers. If no option is given, ``obj`` is returned
+    as is.
+
+    Example:
+        >>> project(post, fields=("id", "nr", "history", "children"),
+        ...         max_history=1)
+
+    :type obj: dict
+    :param obj: Post or feed item as returned by the API
+    :type fields: iterable of str|None
+    :param fields: Top-level fields to keep; ``id`` is always kept. ``None``
+        keeps every field.
+    :type exclude: iterable of str|None
+    :param exclude: Top-level fields to drop
+    :type max_history: int|None
+    :param max_history: Keep only this many of the newest revisions in
+        ``history``
+    :rtype: dict
+    """
+    if fields is None and exclude is None and max_history is None:
+        return obj
+    if isinstance(fields, str) or isinstance(exclude, str):
+        raise TypeError("fields and exclude must be iterables of field "
+                        "names, not a single string")
+    if max_history is not None and max_history < 0:
+        raise ValueError("max_history must not be negative")
+
+    if fields is None:
+        result = dict(obj)
+    else:
+        keep = set(fields)
+        keep.add("id")
+        result = {k: v for k, v in obj.items() if k in keep}
+    for name in exclude or ():
+        result.pop(name, None)
+    history = result.get("history")
+    if max_history is not None and isinstance(history, list):
+        # The newest revision comes first
+        result["history"] = history[:max_history]
+    return result
@@ -0,0 +1,167 @@
+"""Client-side rate limiting of requests made to Piazza"""
+import threading
+import time
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket
+
+    Tokens are reserved rather than waited for, so that callers can wait
+    however suits them (``time.sleep`` or ``asyncio.sleep``). Reserving
+    more tokens than are available puts the bucket in debt, which queues
+    later callers behind earlier ones.
+
+    :type rate: float
+    :param rate: Tokens added per second
+    :type burst: float|None
+    :param burst: Maximum number of tokens the bucket can hold; defaults to
+        ``max(1, rate)``
+    """
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """Take ``tokens`` from the bucket
+
+        :returns: Number of seconds the caller must wait before going ahead
+        :rtype: float
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= tokens
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(delay, self._paused_until - now)
+
+    def acquire(self, tokens=1):
+        """Take ``tokens`` from the bucket, sleeping until they are available"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """Hold back every caller for at least ``seconds`` from now"""
+        with self._lock:
+            self._paused_until = max(self._paused_until,
+                                     time.monotonic() + seconds)
+
+    def set_rate(self, rate):
+        """Change the refill rate, keeping the tokens accrued so far"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+
+class RateLimiter(object):
+    """Per-method-family rate limiter with adaptive backoff
+
+    Requests are grouped by method family, i.e. the part of the method name
+    before the first dot (``content`` for ``content.get``). Each family has
+    its own :class:`TokenBucket`. When Piazza answers with HTTP 429 or a 5xx
+    status, the rate of that family is cut by ``decrease``; every successful
+    request then wins back ``increase`` of the configured rate until it is
+    reached again.
+
+    One instance is meant to be shared by every client talking to Piazza
+    with the same account, e.g. by passing it to :class:`Piazza`.
+
+    Example:
+        >>> limiter = RateLimiter({"content.*": 2, "network.*": 0.5})
+        >>> p = Piazza(rate_limiter=limiter)
+
+    :type rates: dict|None
+    :param rates: Mapping of family (``"content"`` or ``"content.*"``) or
+        full method name (``"content.get"``) to requests per second
+    :type default: float|None
+    :param default: Requests per second for methods not in ``rates``;
+        ``None`` leaves them unlimited
+    :type burst: float|None
+    :param burst: Burst size of each bucket; see :class:`TokenBucket`
+    :type min_rate: float
+    :param min_rate: Floor under which adaptive backoff will not go
+    :type decrease: float
+    :param decrease: Factor applied to the rate when throttled
+    :type increase: float
+    :param increase: Fraction of the configured rate recovered per success
+    """
+    def __init__(self, rates=None, default=None, burst=None, min_rate=0.05,
+                 decrease=0.5, increase=0.05):
+        self._rates = {}
+        for key, rate in (rates or {}).items():
+            if key.endswith(".*"):
+                key = key[:-2]
+            self._rates[key] = rate
+        self._default = default
+        self._burst = burst
+        self.min_rate = min_rate
+        self.decrease = decrease
+        self.increase = increase
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, method):
+        """Return the :class:`TokenBucket` for ``method`` or ``None``
+
+        :type method: str
+        :param method: Piazza API method name like ``content.get``
+        """
+        key = method if method in self._rates else method.split(".")[0]
+        try:
+            return self._buckets[key]
+        except KeyError:
+            pass
+        rate = self._rates.get(key, self._default)
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = (None if rate is None else
+                                      TokenBucket(rate, self._burst))
+            return self._buckets[key]
+
+    def reserve(self, method):
+        """Reserve a request slot for ``method``
+
+        :returns: Number of seconds to wait before sending the request
+        :rtype: float
+        """
+        bucket = self.bucket(method)
+        return bucket.reserve() if bucket is not None else 0.0
+
+    def acquire(self, method):
+        """Block until a request for ``method`` may be sent"""
+        delay = self.reserve(method)
+        if delay > 0:
+            time.sleep(delay)
+
+    def update(self, method, status_code, retry_after=None):
+        """Adapt the rate of ``method``'s family to the response received
+
+        :type status_code: int
+        :param status_code: HTTP status of the response
+        :type retry_after: str|float|None
+        :param retry_after: Value of the ``Retry-After`` header, if any
+        """
+        bucket = self.bucket(method)
+        if bucket is None:
+            return
+        if status_code == 429 or status_code >= 500:
+            bucket.set_rate(max(self.min_rate, bucket.rate * self.decrease))
+            try:
+                bucket.pause(float(retry_after))
+            except (TypeError, ValueError):
+                pass
+        elif bucket.rate < bucket.max_rate:
+            bucket.set_rate(min(bucket.max_rate,
+                                bucket.rate + bucket.max_rate * self.increase))
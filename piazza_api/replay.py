@@ -0,0 +1,252 @@
+"""Recording API traffic and replaying it offline
+
+:class:`RecordingAdapter` is mounted in place of the client's HTTP adapter
+and writes every API exchange to a log: the method, its params, the URL
+without its nonce, the response status and body, and the time it took.
+:class:`ReplayAdapter` later answers the same requests from the log
+without any network access, with the recorded latencies or with none, so
+that a crawl can be re-run repeatably, e.g. to compare client versions.
+
+Example:
+    >>> recorder = RecordingAdapter("crawl.log.gz")
+    >>> p = Piazza(adapter=recorder)
+    >>> p.user_login()
+    >>> posts = list(p.network("hl5qm84dl4t3x2").iter_all_posts())
+    >>> recorder.close()
+    >>> # ... later, offline
+    >>> p = Piazza(adapter=ReplayAdapter("crawl.log.gz", latency=0))
+    >>> p.user_login("anyone", "anything")
+    >>> posts = list(p.network("hl5qm84dl4t3x2").iter_all_posts())
+
+Logins are not recorded, so the log never contains credentials; the
+replay accepts any login instead. The log is one JSON object per line,
+gzip-compressed when the file name ends in ``.gz``.
+"""
+import base64
+import collections
+import gzip
+import http.client
+import json
+import threading
+import time
+import types
+
+import requests
+from requests.adapters import BaseAdapter
+from six.moves.urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+from piazza_api.exceptions import NotRecordedError
+from piazza_api.session import KeepAliveAdapter
+
+_FORMAT = "piazza-api-replay"
+_VERSION = 1
+
+# Response headers worth keeping; the client reads no others
+_HEADERS = ("Content-Type", "Retry-After")
+
+# Paths of the JSON-RPC endpoints; everything else is login
+_API_PATHS = ("/logic/api", "/main/api")
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_log(path):
+    """Iterate over the exchanges recorded in the log at ``path``
+
+    :rtype: iterator of dict
+    :returns: For each exchange, a dict with the ``method``, ``params``,
+        ``url``, ``status``, ``headers``, ``body`` and ``elapsed`` seconds,
+        or with an ``error`` instead of the response if none was received
+    """
+    with _open(path, "r") as f:
+        header = json.loads(next(f, "null"))
+        if not isinstance(header, dict) or header.get("format") != _FORMAT:
+            raise ValueError("{} is not a replay log".format(path))
+        if header.get("version") != _VERSION:
+            raise ValueError("Unsupported replay log version {}".format(
+                header.get("version")))
+        for line in f:
+            record = json.loads(line)
+            if "body64" in record:
+                record["body"] = base64.b64decode(record.pop("body64"))
+            elif "body" in record:
+                record["body"] = record["body"].encode("utf-8")
+            yield record
+
+
+def _parse_request(request):
+    """``(method, params)`` of an API request, from its body"""
+    body = request.body or b"{}"
+    if isinstance(body, bytes):
+        body = body.decode("utf-8")
+    data = json.loads(body)
+    return data.get("method"), data.get("params") or {}
+
+
+def _strip_nonce(url):
+    """``url`` without its ``aid`` nonce, which changes on every request"""
+    parts = urlparse(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != "aid"]
+    return urlunparse(parts._replace(query=urlencode(query)))
+
+
+def _key(method, params):
+    return method, json.dumps(params, sort_keys=True)
+
+
+class RecordingAdapter(BaseAdapter):
+    """Transport adapter recording API exchanges to a log
+
+    Requests are sent by ``adapter``; the exchanges with the JSON-RPC
+    endpoints are also appended to the log at ``path``. Streamed responses
+    are read in full to be recorded. Call :meth:`close` (or close the
+    session) to finish writing the log.
+
+    :type path: str
+    :param path: File to write the log to; gzip-compressed if it ends in
+        ``.gz``
+    :type adapter: :class:`requests.adapters.BaseAdapter`|None
+    :param adapter: Adapter that actually sends the requests; defaults to
+        a :class:`KeepAliveAdapter`
+    """
+    def __init__(self, path, adapter=None):
+        super(RecordingAdapter, self).__init__()
+        self.path = path
+        self.adapter = adapter if adapter is not None else KeepAliveAdapter()
+        self._file = _open(path, "w")
+        self._lock = threading.Lock()
+        self._write({"format": _FORMAT, "version": _VERSION})
+
+    def send(self, request, **kwargs):
+        if urlparse(request.url).path not in _API_PATHS:
+            return self.adapter.send(request, **kwargs)
+        method, params = _parse_request(request)
+        record = {"method": method, "params": params,
+                  "url": _strip_nonce(request.url)}
+        started = time.monotonic()
+        try:
+            response = self.adapter.send(request, **kwargs)
+            content = response.content
+        except requests.RequestException as e:
+            record["elapsed"] = round(time.monotonic() - started, 6)
+            record["error"] = type(e).__name__
+            self._write(record)
+            raise
+        record["elapsed"] = round(time.monotonic() - started, 6)
+        record["status"] = response.status_code
+        record["headers"] = {name: response.headers[name]
+                             for name in _HEADERS if name in response.headers}
+        try:
+            record["body"] = content.decode("utf-8")
+        except UnicodeDecodeError:
+            record["body64"] = base64.b64encode(content).decode("ascii")
+        self._write(record)
+        return response
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        self.adapter.close()
+
+    def _write(self, record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+
+class ReplayAdapter(BaseAdapter):
+    """Transport adapter answering requests from a recorded log
+
+    Each request is answered with the response recorded for the same
+    method and params; when a request was recorded several times (e.g. a
+    retried one), the responses are replayed in their recorded order, and
+    start over once all were used. Login requests always succeed.
+
+    :type path: str
+    :param path: Log written by :class:`RecordingAdapter`
+    :type latency: float
+    :param latency: Multiplier of the recorded latencies: 1 waits as long
+        as the original requests took, 0 answers at once
+    :raises NotRecordedError: From requests that were not recorded
+    """
+    def __init__(self, path, latency=1.0):
+        super(ReplayAdapter, self).__init__()
+        self.path = path
+        self.latency = latency
+        self._records = collections.defaultdict(list)
+        for record in read_log(path):
+            self._records[_key(record["method"],
+                               record["params"])].append(record)
+        self._next = collections.Counter()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Number of recorded exchanges"""
+        return sum(len(records) for records in self._records.values())
+
+    def reset(self):
+        """Start replaying every request from its first recorded response"""
+        with self._lock:
+            self._next.clear()
+
+    def send(self, request, **kwargs):
+        path = urlparse(request.url).path
+        if path not in _API_PATHS:
+            return self._login_response(request, path)
+        method, params = _parse_request(request)
+        key = _key(method, params)
+        records = self._records.get(key)
+        if not records:
+            raise NotRecordedError(
+                "No recorded response to {} with params {}".format(
+                    method, key[1]))
+        with self._lock:
+            record = records[self._next[key] % len(records)]
+            self._next[key] += 1
+        if self.latency:
+            time.sleep(record["elapsed"] * self.latency)
+        if "error" in record:
+            error = getattr(requests.exceptions, record["error"],
+                            requests.ConnectionError)
+            raise error("Recorded {}".format(record["error"]),
+                        request=request)
+        return _response(request, record["status"], record["body"],
+                         record["headers"])
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _login_response(request, path):
+        if path == "/main/csrf_token":
+            return _response(request, 200, b'CSRF_TOKEN="replay";',
+                             {"Content-Type": "text/javascript"})
+        # /class and /demo_login: log in
+        return _response(request, 200, b"<html></html>",
+                         {"Content-Type": "text/html"},
+                         set_cookie="session_id=replay; Path=/")
+
+
+def _response(request, status, body, headers, set_cookie=None):
+    """A :class:`requests.Response` to ``request`` with ``body``"""
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers)
+    response._content = body
+    response._content_consumed = True
+    response.url = request.url
+    response.request = request
+    response.encoding = "utf-8"
+    if set_cookie is not None:
+        # The session reads cookies from the underlying http.client
+        # response, so give it a stand-in with just the header
+        message = http.client.HTTPMessage()
+        message["Set-Cookie"] = set_cookie
+        response.raw = types.SimpleNamespace(
+            _original_response=types.SimpleNamespace(msg=message))
+    return response
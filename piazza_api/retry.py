@@ -0,0 +1,79 @@
+"""Retrying of requests that failed for transient reasons"""
+import collections
+import random
+import threading
+
+
+#: Piazza API methods that only read data and are therefore always safe to
+#: send again
+READ_METHODS = frozenset([
+    "content.get",
+    "network.get_my_feed",
+    "network.filter_feed",
+    "network.search",
+    "network.get_users",
+    "network.get_all_users",
+    "network.get_stats",
+    "user_profile.get_profile",
+    "user.status",
+])
+
+
+class RetryPolicy(object):
+    """When and how often to retry a failed request
+
+    A request is retried when the connection fails, when Piazza answers
+    with one of ``statuses`` or when the body is not valid JSON. Only
+    methods in :data:`READ_METHODS` are retried unless ``retry_writes`` is
+    set, as sending e.g. ``content.create`` twice may create two posts.
+
+    The n-th retry waits ``backoff * 2 ** (n - 1)`` seconds (capped at
+    ``max_backoff``), of which a random fraction of up to ``jitter`` is
+    taken off so that concurrent clients do not retry in lockstep.
+
+    :type max_attempts: int
+    :param max_attempts: Total number of attempts, including the first one
+    :type backoff: float
+    :param backoff: Delay before the first retry, in seconds
+    :type max_backoff: float
+    :param max_backoff: Upper bound for the delay between attempts
+    :type jitter: float
+    :param jitter: Fraction (0 to 1) of each delay that is randomized
+    :type retry_writes: bool
+    :param retry_writes: Also retry methods that are not read-only
+    :type statuses: iterable of int
+    :param statuses: HTTP statuses that are considered transient
+    """
+    def __init__(self, max_attempts=4, backoff=0.5, max_backoff=30.0,
+                 jitter=1.0, retry_writes=False,
+                 statuses=(429, 500, 502, 503, 504)):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_writes = retry_writes
+        self.statuses = frozenset(statuses)
+        #: Number of retries made so far, by method
+        self.retries = collections.Counter()
+        self._lock = threading.Lock()
+
+    def should_retry(self, method, attempt):
+        """Whether a request for ``method`` that failed on its ``attempt``-th
+        try may be sent again
+        """
+        return (attempt < self.max_attempts and
+                (self.retry_writes or method in READ_METHODS))
+
+    def is_transient(self, status_code):
+        """Whether HTTP status ``status_code`` is worth retrying"""
+        return status_code in self.statuses
+
+    def delay(self, attempt):
+        """Seconds to wait before retrying after the ``attempt``-th try"""
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def record(self, method):
+        """Count a retry of ``method``"""
+        with self._lock:
+            self.retries[method] += 1
@@ -1,5 +1,7 @@
+import contextlib
 import getpass
 import json
+import time
 
 import requests
 import six.moves
@@ -7,7 +9,29 @@ import six.moves
 from piazza_api.exceptions import AuthenticationError, NotAuthenticatedError, \
     RequestError
 
+from piazza_api.coalesce import SingleFlight
 from piazza_api.nonce import nonce as _piazza_nonce
+from piazza_api.retry import READ_METHODS, RetryPolicy
+from piazza_api.serialization import get_backend
+from piazza_api.session import ThreadLocalSessions, make_session
+from piazza_api.stream import iter_json_array
+
+
+# Exceptions raised by requests for failures that are worth retrying
+_TRANSIENT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+# Bytes read at a time from streamed responses
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+# Parameters of ``content.*`` writes that name the posts being changed
+_CID_PARAMS = ("cid", "cid_dupe", "cid_to")
+
+#: Where Piazza is served from
+BASE_URL = "https://piazza.com"
 
 
 class PiazzaRPC(object):
@@ -21,17 +45,103 @@ class PiazzaRPC(object):
         >>> p.content_get(181)
         ...
 
+    A client may be shared by many threads: each thread sends its requests
+    through its own session, and all of them share the cookies and the
+    connection pool (see :class:`ThreadLocalSessions`).
+
     :type  network_id: str|None
     :param network_id: This is the ID of the network (or class) from which
         to query posts
+    :type  rate_limiter: :class:`RateLimiter`|None
+    :param rate_limiter: If given, every request waits for a slot from this
+        limiter before being sent
+    :type  retry_policy: :class:`RetryPolicy`|None
+    :param retry_policy: When to retry requests that failed for transient
+        reasons. Defaults to ``RetryPolicy()``, which retries read-only
+        methods; use ``RetryPolicy(max_attempts=1)`` to disable retrying
+    :type  post_cache: :class:`PostCache`|None
+    :param post_cache: If given, ``content_get`` is served from this cache
+        when possible, and writes evict the posts they touch from it
+    :type  json_backend: str|:class:`JSONBackend`|None
+    :param json_backend: JSON implementation used to encode requests and
+        decode responses; defaults to the fastest one installed (see
+        :func:`get_backend`)
+    :type  single_flight: :class:`SingleFlight`|bool|None
+    :param single_flight: Identical read requests (see
+        :data:`READ_METHODS`) made at the same time by several threads
+        share one HTTP request through this; defaults to a new
+        :class:`SingleFlight`, ``False`` disables coalescing
+    :type  metrics: :class:`Metrics`|None
+    :param metrics: If given, the calls, latencies, payload sizes, retries
+        and errors of every request are recorded in it
+    :type  tracer: :class:`Tracer`|None
+    :param tracer: If given, every request is traced in a ``piazza.request``
+        span
+    :type  base_url: str|None
+    :param base_url: Where Piazza is served from, defaults to
+        :data:`BASE_URL`; e.g. the URL of a :class:`Simulator`
+    :type  session: requests.Session|None
+    :param session: Session to use, e.g. to share cookies and connections
+        with another client; the remaining arguments configure the session
+        created when this is not given (see :func:`make_session`)
+    :type  pool_maxsize: int
+    :param pool_maxsize: Maximum number of pooled connections to Piazza;
+        should be at least the number of threads making requests
+    :type  pool_block: bool
+    :param pool_block: Wait for a free pooled connection instead of opening
+        a throwaway one when all of them are in use
+    :type  keep_alive: int|None
+    :param keep_alive: Idle seconds before TCP keep-alive probes are sent
+    :type  adapter: :class:`requests.adapters.HTTPAdapter`|None
+    :param adapter: Fully custom adapter to mount instead
     """
-    def __init__(self, network_id=None):
+    def __init__(self, network_id=None, rate_limiter=None,
+                 retry_policy=None, post_cache=None, json_backend=None,
+                 single_flight=None, metrics=None, tracer=None, base_url=None,
+                 session=None, pool_maxsize=10, pool_block=False,
+                 keep_alive=60, adapter=None):
         self._nid = network_id
+        self.base_url = base_url
+        if session is None:
+            session = make_session(pool_maxsize=pool_maxsize,
+                                   pool_block=pool_block,
+                                   keep_alive=keep_alive, adapter=adapter)
+        self.session = session
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.post_cache = post_cache
+        self.json_backend = get_backend(json_backend)
+        self.single_flight = self._single_flight(single_flight)
+        self.metrics = metrics
+        self.tracer = tracer
+
+    @property
+    def base_url(self):
+        """Where Piazza is served from; setting this also updates
+        :attr:`base_api_urls`
+        """
+        return self._base_url
+
+    @base_url.setter
+    def base_url(self, base_url):
+        self._base_url = (base_url or BASE_URL).rstrip("/")
         self.base_api_urls = {
-            "logic": "https://piazza.com/logic/api",
-            "main": "https://piazza.com/main/api",
+            "logic": self._base_url + "/logic/api",
+            "main": self._base_url + "/main/api",
         }
-        self.session = requests.Session()
+
+    @property
+    def session(self):
+        """The :class:`requests.Session` used by the calling thread
+
+        Setting this replaces the session of every thread; see
+        :class:`ThreadLocalSessions`.
+        """
+        return self._sessions.get()
+
+    @session.setter
+    def session(self, session):
+        self._sessions = ThreadLocalSessions(session)
 
     def get_cookies(self):
         """Export the session cookies.
@@ -50,7 +160,7 @@ class PiazzaRPC(object):
         :param cookies: The session cookies (obtained using get_cookies or from a browser)
         """
         for name, val in cookies.items():
-            self.session.cookies.set(name, val, domain="piazza.com")
+            self.session.cookies.set(name, val, domain=self._cookie_domain())
 
     def user_login(self, email=None, password=None):
         """Login with email, password and get back a session cookie
@@ -62,40 +172,18 @@ class PiazzaRPC(object):
         """
 
         # Need to get the CSRF token first
-        response = self.session.get('https://piazza.com/main/csrf_token')
-
-        # Make sure a CSRF token was retrieved, otherwise bail
-        if response.text.upper().find('CSRF_TOKEN') == -1:
-            raise AuthenticationError("Could not get CSRF token")
-        
-        # Remove double quotes and semicolon (ASCI 34 & 59) from response string.
-        # Then split the string on "=" to parse out the actual CSRF token
-        csrf_token = response.text.translate({34: None, 59: None}).split("=")[1]
+        response = self.session.get(self.base_url + '/main/csrf_token')
+        csrf_token = self._parse_csrf_token(response.text)
 
         email = six.moves.input("Email: ") if email is None else email
         password = getpass.getpass() if password is None else password
 
         # Log in using credentials and CSRF token and store cookie in session
         response = self.session.post(
-            'https://piazza.com/class', 
-            data=f'from=%2Fsignup&email={email}&password={password}&remember=on&csrf_token={csrf_token}'
+            self.base_url + '/class',
+            data=self._login_data(email, password, csrf_token)
         )
-
-        # If non-successful http response, bail
-        if response.status_code != 200:
-            raise AuthenticationError(f"Could not authenticate.\n{response.text}")
-        
-        # Piazza might give a successful http response even if there is some other
-        # kind of authentication problem. Need to parse the response html for error message
-        pos = response.text.upper().find('VAR ERROR_MSG')
-        errorMsg = None
-        if pos != -1:
-            end = response.text[pos:].find(';')
-            errorMsg = response.text[pos:pos+end].translate({34: None}).split('=')[1].strip()
-
-        if errorMsg is not None:
-            raise AuthenticationError(f"Could not authenticate.\n{errorMsg}")
-
+        self._check_login_response(response.status_code, response.text)
 
     def demo_login(self, auth=None, url=None):
         """Authenticate with a "Share Your Class" URL using a demo user.
@@ -111,13 +199,13 @@ class PiazzaRPC(object):
             not (auth and url)  # Cannot provide more than one
         ])
         if url is None:
-            url = "https://piazza.com/demo_login"
+            url = self.base_url + "/demo_login"
             params = dict(nid=self._nid, auth=auth)
             res = self.session.get(url, params=params)
         else:
             res = self.session.get(url)
 
-    def content_get(self, cid, nid=None):
+    def content_get(self, cid, nid=None, cached=True):
         """Get data from post `cid` in network `nid`
 
         :type  nid: str
@@ -126,14 +214,25 @@ class PiazzaRPC(object):
             `network_id` entered when created the class
         :type  cid: str|int
         :param cid: This is the post ID which we grab
+        :type  cached: bool
+        :param cached: If unset, the post cache is not read from, only
+            updated with the post fetched
         :returns: Python object containing returned data
         """
+        if cached and self.post_cache is not None:
+            post = self.post_cache.get(nid if nid else self._nid, cid)
+            if post is not None:
+                return post
+
         r = self.request(
             method="content.get",
             data={"cid": cid, "student_view": None},
             nid=nid
         )
-        return self._handle_error(r, "Could not get post {}.".format(cid))
+        post = self._handle_error(r, "Could not get post {}.".format(cid))
+        if self.post_cache is not None:
+            self.post_cache.put(nid if nid else self._nid, cid, post)
+        return post
 
     def content_create(self, params):
         """Create a post or followup.
@@ -336,6 +435,19 @@ class PiazzaRPC(object):
         )
         return self._handle_error(r, "Could not get users.")
 
+    def iter_all_users(self, nid=None):
+        """Same as :meth:`get_all_users`, but decode the response one user
+        at a time as it is received (see :meth:`request_stream`)
+
+        :rtype: generator
+        """
+        return self.request_stream(
+            method="network.get_all_users",
+            nid=nid,
+            path=("result",),
+            err_msg="Could not get users."
+        )
+
     def get_users(self, user_ids, nid=None):
         """Get a listing of data for specific users `user_ids` in
         a network `nid`
@@ -405,6 +517,24 @@ class PiazzaRPC(object):
         )
         return self._handle_error(r, "Could not retrieve your feed.")
 
+    def iter_my_feed(self, limit=150, offset=20, sort="updated", nid=None):
+        """Same as :meth:`get_my_feed`, but yield the feed items one at a
+        time as the response is received (see :meth:`request_stream`)
+
+        :rtype: generator
+        """
+        return self.request_stream(
+            method="network.get_my_feed",
+            nid=nid,
+            data=dict(
+                limit=limit,
+                offset=offset,
+                sort=sort
+            ),
+            path=("result", "feed"),
+            err_msg="Could not retrieve your feed."
+        )
+
     def filter_feed(self, updated=False, following=False, folder=False,
                     filter_folder="", sort="updated", nid=None):
         """Get filtered feed
@@ -519,16 +649,267 @@ class PiazzaRPC(object):
         :type return_response: bool
         :param return_response: If set, returns whole :class:`requests.Response`
             object rather than just the response body
+        :raises RequestError: If the response body could not be decoded,
+            even after retrying
         """
         self._check_authenticated()
 
+        call = self._begin(method, data, nid)
+        failed, error = True, None
+        try:
+            if self._coalesces(method, return_response):
+                result = self.single_flight.do(
+                    self._flight_key(method, data, nid, nid_key, api_type),
+                    lambda: self._send(method, data, nid, nid_key, api_type,
+                                       False))
+            else:
+                result = self._send(method, data, nid, nid_key, api_type,
+                                    return_response)
+            failed = _is_error(result)
+            return result
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if call is not None:
+                self._end(method, call, failed, error)
+            if self.post_cache is not None:
+                self._invalidate_cached(method, data, nid)
+
+    def request_stream(self, method, data=None, nid=None, nid_key='nid',
+                       api_type="logic", path=("result",), err_msg=None):
+        """Like :meth:`request`, but yield the elements of the array at
+        ``path`` in the response as they are received
+
+        The response is decoded incrementally, so only about one element is
+        held in memory at a time no matter how large the response is.
+
+        :type  path: tuple of str
+        :param path: Keys leading to the array in the response body, e.g.
+            ``("result", "feed")``
+        :type  err_msg: str|None
+        :param err_msg: Message of the :class:`RequestError` raised if
+            Piazza reports an error
+        :rtype: generator
+        :raises RequestError: If Piazza reports an error or the response is
+            not valid JSON; elements received before are still yielded
+        """
+        self._check_authenticated()
+
+        # The span is only active while sending: the generator may be
+        # suspended in between in a different context
+        call = self._begin(method, data, nid, activate=False)
+        failed, error = True, None
+        siblings = {}
+        try:
+            with self._activated(call):
+                response = self._send(method, data, nid, nid_key, api_type,
+                                      return_response=True, stream=True)
+            try:
+                chunks = response.iter_content(chunk_size=_STREAM_CHUNK_SIZE)
+                if self.metrics is not None:
+                    chunks = self._count_received(method, chunks)
+                for item in iter_json_array(chunks, path, siblings):
+                    yield item
+            except ValueError as e:
+                raise RequestError(
+                    "Could not decode response to {} (HTTP {}): {}".format(
+                        method, response.status_code, e))
+            finally:
+                response.close()
+            failed = _is_error(siblings)
+        except GeneratorExit:
+            # Closed early by the caller
+            failed = False
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if call is not None:
+                self._end(method, call, failed, error)
+        self._handle_error(siblings, err_msg or "Could not {}.".format(method))
+
+    ###################
+    # Private Methods #
+    ###################
+
+    def _send(self, method, data, nid, nid_key, api_type, return_response,
+              stream=False):
+        """Send a request, waiting for the rate limiter and retrying
+        according to the retry policy
+
+        :param stream: Passed on to :meth:`requests.Session.post`; only
+            makes sense with ``return_response``
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            endpoint, body, headers = self._prepare_request(
+                method, data, nid, nid_key, api_type, self._csrf_token())
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(method)
+            try:
+                response = self.session.post(endpoint, data=body,
+                                             headers=headers, stream=stream)
+            except _TRANSIENT_ERRORS:
+                if not self.retry_policy.should_retry(method, attempt):
+                    raise
+                self._wait_for_retry(method, attempt)
+                continue
+            if self.rate_limiter is not None:
+                self.rate_limiter.update(method, response.status_code,
+                                         response.headers.get("Retry-After"))
+            if self.metrics is not None:
+                self.metrics.transferred(
+                    method, len(body),
+                    0 if stream else len(response.content))
+            if self.tracer is not None:
+                self.tracer.annotate(status=response.status_code,
+                                     attempts=attempt)
+
+            if (self.retry_policy.is_transient(response.status_code) and
+                    self.retry_policy.should_retry(method, attempt)):
+                response.close()
+                self._wait_for_retry(method, attempt)
+                continue
+            if return_response:
+                return response
+            try:
+                return self._loads(response.content)
+            except ValueError:
+                if not self.retry_policy.should_retry(method, attempt):
+                    raise RequestError(
+                        "Could not decode response to {} (HTTP {})".format(
+                            method, response.status_code))
+                self._wait_for_retry(method, attempt)
+
+    def _check_authenticated(self):
+        """Check that we're logged in and raise an exception if not.
+
+        :raises: NotAuthenticatedError
+        """
+        if not self.session.cookies:
+            raise NotAuthenticatedError("You must authenticate before "
+                                        "making any other requests.")
+
+    def _invalidate_cached(self, method, data, nid):
+        """Evict the posts touched by write ``method`` from the post cache"""
+        if not method.startswith("content.") or method == "content.get":
+            return
+        nid = nid if nid else self._nid
+        for key in _CID_PARAMS:
+            if data and data.get(key) is not None:
+                self.post_cache.invalidate(nid, data[key])
+
+    def _begin(self, method, data, nid, activate=True):
+        """Start measuring a call of ``method`` for :attr:`metrics` and
+        :attr:`tracer`
+
+        :returns: A handle to pass to :meth:`_end`, or ``None`` if there is
+            nothing to measure
+        """
+        if self.metrics is None and self.tracer is None:
+            return None
+        span = None
+        if self.tracer is not None:
+            attributes = {"method": method, "nid": nid if nid else self._nid}
+            for key in _CID_PARAMS:
+                if data and data.get(key) is not None:
+                    attributes[key] = data[key]
+            span = self.tracer.start_span("piazza.request", attributes,
+                                          activate=activate)
+        return time.monotonic(), span
+
+    def _end(self, method, call, failed, error=None):
+        """Record the call started by :meth:`_begin`"""
+        started, span = call
+        if self.metrics is not None:
+            self.metrics.observe(method, time.monotonic() - started, failed)
+        if span is not None:
+            span.attributes["failed"] = failed
+            self.tracer.end_span(span, error)
+
+    def _activated(self, call):
+        """Context manager making the span of ``call`` the active one"""
+        if call is None or call[1] is None:
+            return contextlib.nullcontext()
+        return self.tracer.activate(call[1])
+
+    def _loads(self, content):
+        """Decode the response body ``content``, timing it when tracing"""
+        if self.tracer is None:
+            return self.json_backend.loads(content)
+        started = time.monotonic()
+        try:
+            return self.json_backend.loads(content)
+        finally:
+            self.tracer.annotate(decode_seconds=time.monotonic() - started,
+                                 response_bytes=len(content))
+
+    def _count_received(self, method, chunks):
+        """Pass ``chunks`` of a streamed response through, recording their
+        size in :attr:`metrics`
+        """
+        for chunk in chunks:
+            self.metrics.transferred(method, 0, len(chunk))
+            yield chunk
+
+    _single_flight_cls = SingleFlight
+
+    def _single_flight(self, single_flight):
+        """Resolve the ``single_flight`` argument of the constructor"""
+        if single_flight is None:
+            return self._single_flight_cls()
+        return None if single_flight is False else single_flight
+
+    def _coalesces(self, method, return_response):
+        """Whether a request for ``method`` may share another's response"""
+        return (self.single_flight is not None and not return_response and
+                method in READ_METHODS)
+
+    def _flight_key(self, method, data, nid, nid_key, api_type):
+        """Key under which identical requests are coalesced
+
+        The session cookie is part of it so that requests made on behalf
+        of different users are never shared.
+        """
+        params = json.dumps(data, sort_keys=True, separators=(",", ":"),
+                            default=str)
+        return (method, nid if nid else self._nid, nid_key, api_type, params,
+                self._csrf_token())
+
+    def _wait_for_retry(self, method, attempt):
+        """Count a retry of ``method`` and sleep for the backoff delay"""
+        self.retry_policy.record(method)
+        if self.metrics is not None:
+            self.metrics.retried(method)
+        time.sleep(self.retry_policy.delay(attempt))
+
+    def _csrf_token(self):
+        """Return the CSRF token for the current session, if logged in"""
+        return self.session.cookies.get("session_id")
+
+    def _cookie_domain(self):
+        """Domain of the cookies of :attr:`base_url`"""
+        return six.moves.urllib.parse.urlparse(self.base_url).hostname
+
+    def _prepare_request(self, method, data, nid, nid_key, api_type,
+                         csrf_token):
+        """Build the endpoint, body and headers for an API request
+
+        This is shared by every client flavour so that the nonce and CSRF
+        handling stay in one place.
+
+        :returns: Tuple of ``(endpoint, body, headers)``
+        """
         nid = nid if nid else self._nid
         if data is None:
             data = {}
 
         headers = {}
-        if "session_id" in self.session.cookies:
-            headers["CSRF-Token"] = self.session.cookies["session_id"]
+        if csrf_token is not None:
+            headers["CSRF-Token"] = csrf_token
 
         # Adding a nonce to the request
         endpoint = self.base_api_urls[api_type]
@@ -538,28 +919,52 @@ class PiazzaRPC(object):
                 _piazza_nonce()
             )
 
-        response = self.session.post(
-            endpoint,
-            data=json.dumps({
-                "method": method,
-                "params": dict({nid_key: nid}, **data)
-            }),
-            headers=headers
-        )
-        return response if return_response else response.json()
+        body = self.json_backend.dumps({
+            "method": method,
+            "params": dict({nid_key: nid}, **data)
+        })
+        return endpoint, body, headers
 
-    ###################
-    # Private Methods #
-    ###################
+    @staticmethod
+    def _parse_csrf_token(text):
+        """Parse the CSRF token out of the ``/main/csrf_token`` response
 
-    def _check_authenticated(self):
-        """Check that we're logged in and raise an exception if not.
+        :raises AuthenticationError: If no CSRF token was retrieved
+        """
+        # Make sure a CSRF token was retrieved, otherwise bail
+        if text.upper().find('CSRF_TOKEN') == -1:
+            raise AuthenticationError("Could not get CSRF token")
 
-        :raises: NotAuthenticatedError
+        # Remove double quotes and semicolon (ASCI 34 & 59) from response string.
+        # Then split the string on "=" to parse out the actual CSRF token
+        return text.translate({34: None, 59: None}).split("=")[1]
+
+    @staticmethod
+    def _login_data(email, password, csrf_token):
+        """Form body for the login POST to ``/class``"""
+        return (f'from=%2Fsignup&email={email}&password={password}'
+                f'&remember=on&csrf_token={csrf_token}')
+
+    @staticmethod
+    def _check_login_response(status_code, text):
+        """Check the response of the login POST for errors
+
+        :raises AuthenticationError: If authentication failed
         """
-        if not self.session.cookies:
-            raise NotAuthenticatedError("You must authenticate before "
-                                        "making any other requests.")
+        # If non-successful http response, bail
+        if status_code != 200:
+            raise AuthenticationError(f"Could not authenticate.\n{text}")
+
+        # Piazza might give a successful http response even if there is some other
+        # kind of authentication problem. Need to parse the response html for error message
+        pos = text.upper().find('VAR ERROR_MSG')
+        errorMsg = None
+        if pos != -1:
+            end = text[pos:].find(';')
+            errorMsg = text[pos:pos+end].translate({34: None}).split('=')[1].strip()
+
+        if errorMsg is not None:
+            raise AuthenticationError(f"Could not authenticate.\n{errorMsg}")
 
     def _handle_error(self, result, err_msg):
         """Check result for error
@@ -573,9 +978,12 @@ class PiazzaRPC(object):
         :raises RequestError: If result has error
         """
         if result.get(u'error'):
-            raise RequestError("{}\nResponse: {}".format(
-                err_msg,
-                json.dumps(result, indent=2)
-            ))
+            # The response is only formatted if the message is read
+            raise RequestError(err_msg, response=result)
         else:
             return result.get(u'result')
+
+
+def _is_error(result):
+    """Whether ``result`` is a response body in which Piazza reports an error"""
+    return isinstance(result, dict) and bool(result.get("error"))
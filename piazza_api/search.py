@@ -0,0 +1,224 @@
+"""Local full-text search over fetched posts
+
+:class:`SearchIndex` ranks posts with BM25 without asking Piazza, so a
+tool running many queries against the same class neither waits for
+``network.search`` nor uses up rate-limit slots.
+
+Example:
+    >>> index = SearchIndex()
+    >>> index.add_all(network.iter_all_posts())
+    >>> index.search("segfault linked list", folders=["hw3"])
+    [SearchHit(id='...', nr=412, score=7.91, subject='...'), ...]
+    >>> # Later, keep it current from Network.sync
+    >>> result = network.sync(state)
+    >>> index.apply_sync(result)
+"""
+import collections
+import heapq
+import html
+import math
+import re
+import threading
+
+SearchHit = collections.namedtuple('SearchHit',
+                                   ['id', 'nr', 'score', 'subject'])
+SearchHit.__doc__ = """A result of :meth:`SearchIndex.search`
+
+:ivar id: ``id`` of the post
+:ivar nr: ``nr`` of the post
+:ivar score: BM25 score; higher is more relevant
+:ivar subject: Subject of the newest revision of the post
+"""
+
+_TAGS = re.compile(r"<[^>]*>")
+_WORDS = re.compile(r"\w+")
+
+#: Words too common to help ranking; they are not indexed
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have i if in is it its of "
+    "on or so that the this to was were will with".split())
+
+
+def strip_html(text):
+    """``text`` without HTML tags and with entities decoded"""
+    return html.unescape(_TAGS.sub(" ", text or ""))
+
+
+def tokenize(text):
+    """Lower-cased words of ``text``, HTML and stop words left out"""
+    return [word for word in _WORDS.findall(strip_html(text).lower())
+            if word not in STOP_WORDS]
+
+
+def post_text(post):
+    """Searchable text of ``post``: the subject and content of its newest
+    revision, and the text of its follow-ups, answers and replies
+    """
+    parts = []
+    history = post.get("history")
+    if history:
+        parts.append(history[0].get("subject") or "")
+        parts.append(history[0].get("content") or "")
+    stack = list(post.get("children") or ())
+    while stack:
+        child = stack.pop()
+        child_history = child.get("history")
+        if child_history:
+            parts.append(child_history[0].get("content") or "")
+        else:
+            parts.append(child.get("subject") or "")
+        stack.extend(child.get("children") or ())
+    return " ".join(parts)
+
+
+class _Doc(object):
+    __slots__ = ('nr', 'subject', 'folders', 'tags', 'terms', 'length')
+
+    def __init__(self, nr, subject, folders, tags, terms):
+        self.nr = nr
+        self.subject = subject
+        self.folders = folders
+        self.tags = tags
+        self.terms = terms
+        self.length = sum(terms.values())
+
+
+class SearchIndex(object):
+    """In-memory inverted index of posts ranked with BM25
+
+    Posts are indexed by ``id``; adding a post that is already indexed
+    replaces it, so the index can be kept current by re-adding the posts
+    that changed. An index may be searched and updated from several
+    threads.
+
+    :type k1: float
+    :param k1: BM25 term frequency saturation
+    :type b: float
+    :param b: BM25 document length normalization, from 0 (none) to 1
+    """
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> {post id: term frequency}
+        self._postings = collections.defaultdict(dict)
+        self._docs = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, cid):
+        return cid in self._docs
+
+    def add(self, post):
+        """Index ``post`` (a dict or :class:`Post`), replacing any previous
+        version of it
+        """
+        history = post.get("history") or [{}]
+        subject = " ".join(strip_html(history[0].get("subject")).split())
+        doc = _Doc(post.get("nr"), subject,
+                   frozenset(post.get("folders") or ()),
+                   frozenset(post.get("tags") or ()),
+                   collections.Counter(tokenize(post_text(post))))
+        cid = post["id"]
+        with self._lock:
+            self._remove(cid)
+            self._docs[cid] = doc
+            self._total_length += doc.length
+            for term, count in doc.terms.items():
+                self._postings[term][cid] = count
+
+    def add_all(self, posts):
+        """Index every post of ``posts``
+
+        :returns: Number of posts indexed
+        """
+        count = 0
+        for post in posts:
+            self.add(post)
+            count += 1
+        return count
+
+    def remove(self, cid):
+        """Remove the post with ``id`` ``cid``, if indexed"""
+        with self._lock:
+            self._remove(cid)
+
+    def apply_sync(self, result):
+        """Apply a :class:`SyncResult` of :meth:`Network.sync`: index the
+        changed posts and remove the deleted ones
+        """
+        for post in result.changed:
+            self.add(post)
+        for cid in result.deleted:
+            self.remove(cid)
+
+    def search(self, query, limit=10, folders=None, tags=None):
+        """Return the posts most relevant to ``query``, best first
+
+        :type query: str
+        :param query: Words to look for; posts matching any of them are
+            ranked
+        :type limit: int|None
+        :param limit: Maximum number of results; ``None`` for all
+        :type folders: iterable of str|None
+        :param folders: Only posts in at least one of these folders
+        :type tags: iterable of str|None
+        :param tags: Only posts with at least one of these tags
+        :rtype: list of :class:`SearchHit`
+        """
+        terms = set(tokenize(query))
+        folders = frozenset(folders) if folders is not None else None
+        tags = frozenset(tags) if tags is not None else None
+        with self._lock:
+            n = len(self._docs)
+            if not n or not terms:
+                return []
+            docs = self._docs
+            # BM25's length normalization k1 * (1 - b + b * length / avg),
+            # computed per scored post so that updates stay O(terms)
+            average = float(self._total_length) / n or 1.0
+            base = self.k1 * (1 - self.b)
+            per_length = self.k1 * self.b / average
+            scores = collections.defaultdict(float)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) /
+                               (len(postings) + 0.5))
+                weight = idf * (self.k1 + 1)
+                for cid, tf in postings.items():
+                    scores[cid] += weight * tf / (
+                        tf + base + per_length * docs[cid].length)
+            if folders is not None or tags is not None:
+                scores = {cid: score for cid, score in scores.items()
+                          if self._matches(self._docs[cid], folders, tags)}
+            if limit is None:
+                best = sorted(scores.items(), key=lambda x: -x[1])
+            else:
+                best = heapq.nlargest(limit, scores.items(),
+                                      key=lambda x: x[1])
+            return [SearchHit(cid, self._docs[cid].nr, score,
+                              self._docs[cid].subject)
+                    for cid, score in best]
+
+    @staticmethod
+    def _matches(doc, folders, tags):
+        if folders is not None and not folders & doc.folders:
+            return False
+        if tags is not None and not tags & doc.tags:
+            return False
+        return True
+
+    def _remove(self, cid):
+        doc = self._docs.pop(cid, None)
+        if doc is None:
+            return
+        self._total_length -= doc.length
+        for term in doc.terms:
+            postings = self._postings[term]
+            postings.pop(cid, None)
+            if not postings:
+                del self._postings[term]
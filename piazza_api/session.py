@@ -0,0 +1,172 @@
+"""HTTP session and connection pool setup"""
+import socket
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.cookies import RequestsCookieJar
+from urllib3.connection import HTTPConnection
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """:class:`requests.adapters.HTTPAdapter` that enables TCP keep-alive
+
+    Idle pooled connections to Piazza are kept open by the OS so that they
+    can be reused without a new TCP and TLS handshake.
+
+    :type keep_alive: int|None
+    :param keep_alive: Seconds a connection may be idle before keep-alive
+        probes are sent; ``None`` leaves the OS defaults untouched
+    :param kwargs: Passed on to :class:`requests.adapters.HTTPAdapter`, e.g.
+        ``pool_connections``, ``pool_maxsize`` and ``pool_block``
+    """
+    __attrs__ = HTTPAdapter.__attrs__ + ['_socket_options']
+
+    def __init__(self, keep_alive=60, **kwargs):
+        self._socket_options = _keep_alive_options(keep_alive)
+        super(KeepAliveAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self._socket_options:
+            kwargs.setdefault('socket_options', self._socket_options)
+        super(KeepAliveAdapter, self).init_poolmanager(*args, **kwargs)
+
+
+def make_session(pool_connections=10, pool_maxsize=10, pool_block=False,
+                 keep_alive=60, adapter=None):
+    """Create a :class:`requests.Session` with a tuned connection pool
+
+    ``pool_maxsize`` should be at least the number of threads that make
+    requests at the same time, otherwise connections beyond it are
+    discarded after use and have to be re-established.
+
+    :type pool_connections: int
+    :param pool_connections: Number of per-host pools to keep
+    :type pool_maxsize: int
+    :param pool_maxsize: Maximum number of connections kept per host
+    :type pool_block: bool
+    :param pool_block: Block when all ``pool_maxsize`` connections are
+        in use instead of opening an extra one
+    :type keep_alive: int|None
+    :param keep_alive: See :class:`KeepAliveAdapter`
+    :type adapter: :class:`requests.adapters.HTTPAdapter`|None
+    :param adapter: Adapter to mount instead of building one from the
+        other arguments
+    :rtype: requests.Session
+    """
+    if adapter is None:
+        adapter = KeepAliveAdapter(keep_alive=keep_alive,
+                                   pool_connections=pool_connections,
+                                   pool_maxsize=pool_maxsize,
+                                   pool_block=pool_block)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class LockedCookieJar(RequestsCookieJar):
+    """:class:`requests.cookies.RequestsCookieJar` safe to share between
+    threads
+
+    :class:`http.cookiejar.CookieJar` only locks some of its methods; the
+    dict-like accessors added by ``requests`` iterate over the cookies
+    without a lock and can fail or miss a cookie while another thread
+    stores the ones of a response. Here every access holds the jar's lock
+    and iteration works on a snapshot.
+    """
+    def __iter__(self):
+        with self._cookies_lock:
+            return iter(list(super(LockedCookieJar, self).__iter__()))
+
+    def copy(self):
+        with self._cookies_lock:
+            new_cj = LockedCookieJar()
+            new_cj.set_policy(self.get_policy())
+            new_cj.update(self)
+            return new_cj
+
+
+def _locked(name):
+    method = getattr(RequestsCookieJar, name)
+
+    def locked(self, *args, **kwargs):
+        with self._cookies_lock:
+            return method(self, *args, **kwargs)
+    locked.__name__ = name
+    locked.__doc__ = method.__doc__
+    return locked
+
+
+for _name in ('get', 'set', 'get_dict', 'update', '__contains__',
+              '__getitem__', '__setitem__', '__delitem__', '__len__'):
+    setattr(LockedCookieJar, _name, _locked(_name))
+del _name
+
+
+class ThreadLocalSessions(object):
+    """One :class:`requests.Session` per thread, sharing cookies and pool
+
+    ``requests`` does not guarantee that a session can be used by several
+    threads at once. The thread that creates this object keeps using
+    ``session`` itself; every other thread gets its own session that
+    shares ``session``'s cookie jar (made thread-safe with
+    :class:`LockedCookieJar`) and its adapters, and so its connection
+    pool. Other settings (headers, proxies, ...) are copied when a thread
+    first asks for its session.
+
+    :type session: requests.Session
+    :param session: Session whose cookies and connections are shared
+    """
+    def __init__(self, session):
+        if not isinstance(session.cookies, LockedCookieJar):
+            jar = LockedCookieJar()
+            jar.set_policy(session.cookies.get_policy())
+            jar.update(session.cookies)
+            session.cookies = jar
+        self.shared = session
+        self._local = threading.local()
+        self._local.session = session
+
+    def get(self):
+        """Return the session of the calling thread
+
+        :rtype: requests.Session
+        """
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = _clone(self.shared)
+        return session
+
+
+def _clone(session):
+    """A new session sharing the cookies and adapters of ``session``"""
+    clone = requests.Session()
+    clone.cookies = session.cookies
+    clone.adapters = session.adapters
+    clone.headers = session.headers.copy()
+    clone.auth = session.auth
+    clone.proxies = dict(session.proxies)
+    clone.hooks = {event: list(hooks)
+                   for event, hooks in session.hooks.items()}
+    clone.params = dict(session.params)
+    clone.verify = session.verify
+    clone.cert = session.cert
+    clone.stream = session.stream
+    clone.trust_env = session.trust_env
+    clone.max_redirects = session.max_redirects
+    return clone
+
+
+def _keep_alive_options(idle):
+    if idle is None:
+        return None
+    options = list(HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    # These are not available on every platform (e.g. macOS, Windows)
+    for name, value in (('TCP_KEEPIDLE', idle),
+                        ('TCP_KEEPINTVL', max(1, idle // 4)),
+                        ('TCP_KEEPCNT', 4)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
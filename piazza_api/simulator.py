@@ -0,0 +1,844 @@
+"""Local stand-in for piazza.com, for load and fault-injection testing
+
+:class:`Simulator` serves synthetic classes (see :mod:`piazza_api.synthetic`)
+over HTTP. It speaks the same login flow and JSON-RPC protocol as
+piazza.com, so the whole client can be exercised without touching the real
+site, and it can slow down or fail requests on purpose (see
+:class:`Faults`).
+
+Example:
+    >>> faults = Faults(latency=lognormal(0.05, 0.5), error_rate=0.02)
+    >>> with Simulator(SyntheticClass("nsim", num_posts=5000),
+    ...                faults=faults) as sim:
+    ...     p = Piazza(base_url=sim.url)
+    ...     p.user_login("student@example.edu", "password")
+    ...     posts = list(p.network("nsim").iter_all_posts())
+
+It can also be run on its own; see ``python -m piazza_api.simulator -h``.
+"""
+from __future__ import print_function
+
+import argparse
+import collections
+import copy
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from six.moves.urllib.parse import parse_qs, urlparse
+
+from piazza_api.synthetic import (feed_item, make_post, make_users,
+                                  post_id)
+
+#: Id of the user every session is logged in as; a TA of every class
+UID = "u000000"
+
+_ERROR_PAGE = ("<!DOCTYPE html><html><body><h1>{} {}</h1>"
+               "</body></html>")
+
+
+#########################
+# Latency distributions #
+#########################
+
+def fixed(seconds):
+    """Latency of always ``seconds``"""
+    return lambda rng: seconds
+
+
+def uniform(low, high):
+    """Latency uniformly distributed between ``low`` and ``high`` seconds"""
+    return lambda rng: rng.uniform(low, high)
+
+
+def lognormal(median, sigma):
+    """Log-normally distributed latency, the usual shape of real ones
+
+    :param median: Median latency in seconds
+    :param sigma: Standard deviation of the latency's logarithm; the
+        larger, the longer the tail
+    """
+    mu = math.log(median)
+    return lambda rng: rng.lognormvariate(mu, sigma)
+
+
+def exponential(mean):
+    """Exponentially distributed latency averaging ``mean`` seconds"""
+    return lambda rng: rng.expovariate(1.0 / mean)
+
+
+class Faults(object):
+    """What a :class:`Simulator` does to API requests
+
+    Login requests are never slowed down or failed.
+
+    :type latency: float|callable
+    :param latency: Seconds to wait before answering each API request, or
+        a function of a :class:`random.Random` returning them, such as
+        :func:`lognormal`
+    :type error_rate: float
+    :param error_rate: Fraction of API requests answered with an HTTP
+        error instead
+    :type error_statuses: iterable of int
+    :param error_statuses: HTTP statuses the errors are drawn from; 429
+        responses carry a ``Retry-After`` header
+    :type retry_after: int
+    :param retry_after: Seconds in the ``Retry-After`` header
+    :type bytes_per_second: int|None
+    :param bytes_per_second: If given, response bodies are sent no faster
+        than this
+    :type methods: iterable of str|None
+    :param methods: Only apply faults to these API methods; all of them by
+        default
+    """
+    def __init__(self, latency=0, error_rate=0.0,
+                 error_statuses=(429, 500, 502, 503), retry_after=1,
+                 bytes_per_second=None, methods=None):
+        self.latency = latency if callable(latency) else fixed(latency)
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.retry_after = retry_after
+        self.bytes_per_second = bytes_per_second
+        self.methods = frozenset(methods) if methods is not None else None
+
+    def applies_to(self, method):
+        return self.methods is None or method in self.methods
+
+
+class _APIError(Exception):
+    """Error reported in the ``error`` field of an API response"""
+
+
+###################
+# Synthetic class #
+###################
+
+class SyntheticClass(object):
+    """A class (network) served by :class:`Simulator`
+
+    Posts are generated from ``seed`` when first needed and only kept once
+    changed, so big classes cost little memory. Posts are numbered from 1
+    and their ids are those of :func:`piazza_api.synthetic.post_id`.
+
+    :type nid: str
+    :param nid: ID of the network
+    :type num_posts: int
+    :param num_posts: Number of posts to start with
+    :type num_users: int
+    :param num_users: Number of enrolled users
+    :type seed: int
+    :param seed: Seed of the generated posts and users
+    :type name: str|None
+    :param name: Name of the class
+    """
+    def __init__(self, nid, num_posts=1000, num_users=200, seed=0,
+                 name=None):
+        self.nid = nid
+        self.name = name or "Simulated class {}".format(nid)
+        self.num_users = num_users
+        self.seed = seed
+        self._last_nr = num_posts
+        self._changed = {}
+        # Numbers of the changed posts, least recently changed first
+        self._recent = collections.OrderedDict()
+        self._deleted = set()
+        self._items = None
+        self._users = None
+        self._lock = threading.RLock()
+
+    @property
+    def num_posts(self):
+        """Number of posts that were not deleted"""
+        with self._lock:
+            return self._last_nr - len(self._deleted)
+
+    def post(self, cid):
+        """Return post ``cid`` (an id or a post number)
+
+        :raises _APIError: If there is no such post
+        """
+        nr = self._nr(cid)
+        with self._lock:
+            post = self._changed.get(nr)
+        return post if post is not None else make_post(nr, self.seed,
+                                                        self.num_users)
+
+    def feed(self):
+        """Return the feed items of every post, most recently changed
+        first as on piazza.com
+        """
+        with self._lock:
+            if self._items is None:
+                self._items = {}
+                for nr in range(1, self._last_nr + 1):
+                    if nr not in self._deleted:
+                        self._items[nr] = feed_item(self.post(nr))
+            order = itertools.chain(
+                reversed(self._recent),
+                (nr for nr in range(self._last_nr, 0, -1)
+                 if nr not in self._recent))
+            return [self._items[nr] for nr in order if nr in self._items]
+
+    def changed_feed(self):
+        """Return the feed items of the posts changed since the start"""
+        with self._lock:
+            return [feed_item(self._changed[nr])
+                    for nr in sorted(self._changed, reverse=True)
+                    if nr not in self._deleted]
+
+    def users(self):
+        """Return the enrolled users"""
+        with self._lock:
+            if self._users is None:
+                self._users = make_users(self.num_users, self.seed)
+            return list(self._users)
+
+    def add_users(self, emails):
+        with self._lock:
+            users = self.users()
+            next_id = 1 + max([int(user["id"][1:]) for user in users] or [0])
+            for i, email in enumerate(emails):
+                users.append({
+                    "id": "u{:06d}".format(next_id + i),
+                    "name": email.split("@")[0],
+                    "email": email,
+                    "role": "student",
+                    "admin": False,
+                    "days": 0, "posts": 0, "asks": 0, "answers": 0,
+                    "views": 0,
+                    "class_sections": [],
+                })
+            self._users = users
+
+    def remove_users(self, user_ids):
+        user_ids = set(user_ids)
+        with self._lock:
+            self._users = [user for user in self.users()
+                           if user["id"] not in user_ids]
+
+    def create(self, params):
+        """Create a post, or a follow-up or reply if ``params`` has a
+        ``cid``; returns what was created
+        """
+        now = _now()
+        if params.get("cid"):
+            child = _child(params.get("cid"), params.get("type", "followup"),
+                           params.get("subject", ""), now,
+                           params.get("anonymous", "no"))
+
+            def add(post):
+                parent = _find(post, params["cid"])
+                child["id"] = "{}c{}".format(post["id"], _count(post))
+                parent.setdefault("children", []).append(child)
+                return child
+            return self._change(params["cid"], add)
+
+        with self._lock:
+            self._last_nr += 1
+            nr = self._last_nr
+            post = {
+                "id": post_id(nr),
+                "nr": nr,
+                "type": params.get("type", "question"),
+                "folders": _folders(params.get("folders")),
+                "tags": _folders(params.get("folders")),
+                "created": now,
+                "status": "active",
+                "history": [_revision(params.get("subject", ""),
+                                      params.get("content", ""), now,
+                                      params.get("anonymous", "no"))],
+                "history_size": 1,
+                "children": [],
+                "change_log": [],
+                "tag_good": [],
+                "tag_good_arr": [],
+                "unique_views": 0,
+                "no_answer_followup": 0,
+                "bucket_order": 3,
+                "bucket_name": "Today",
+                "num_favorites": 0,
+                "bookmarked": 2,
+                "config": params.get("config", {}),
+                "data": {"embed_links": []},
+                "t": int(time.time() * 1000),
+            }
+            self._store(post)
+        return post
+
+    def update(self, params):
+        """Add a revision to post ``params["cid"]``"""
+        def revise(post):
+            latest = post["history"][0]
+            post["history"].insert(0, _revision(
+                params.get("subject", latest["subject"]),
+                params.get("content", latest["content"]), _now(),
+                params.get("anonymous", "no")))
+            post["history_size"] = len(post["history"])
+            return post
+        return self._change(params["cid"], revise)
+
+    def answer(self, params):
+        """Create or revise the instructors' or students' answer"""
+        kind = params.get("type", "i_answer")
+
+        def answer(post):
+            now = _now()
+            for child in post["children"]:
+                if child["type"] == kind:
+                    child.setdefault("history", []).insert(
+                        0, _revision("", params.get("content", ""), now,
+                                     params.get("anonymous", "no")))
+                    return child
+            child = _child(post["id"], kind, "", now,
+                           params.get("anonymous", "no"))
+            child["id"] = "{}c{}".format(post["id"], _count(post))
+            child["history"] = [_revision("", params.get("content", ""),
+                                          now, params.get("anonymous", "no"))]
+            post["children"].append(child)
+            return child
+        return self._change(params["cid"], answer)
+
+    def mark_duplicate(self, params):
+        """Fold post ``cid_dupe`` into ``cid_to`` as a follow-up"""
+        dupe = self.post(params["cid_dupe"])
+
+        def merge(post):
+            child = _child(post["id"], "dupe", params.get("msg", ""),
+                           _now(), "no")
+            child["id"] = dupe["id"]
+            post["children"].append(child)
+            return post
+        result = self._change(params["cid_to"], merge)
+        self.delete(dupe["id"])
+        return result
+
+    def set_fields(self, cid, **fields):
+        """Set top-level fields of post ``cid``"""
+        def set_fields(post):
+            post.update(fields)
+            return post
+        return self._change(cid, set_fields)
+
+    def tag_good(self, cid, good):
+        """Add or remove the user's "good note/question" tag"""
+        def tag(post):
+            tags = [t for t in post["tag_good"] if t.get("id") != UID]
+            if good:
+                tags.append({"id": UID, "role": "ta", "name": "Simulator"})
+            post["tag_good"] = tags
+            post["tag_good_arr"] = [t["id"] for t in tags]
+            post["is_tag_good"] = good
+            return post
+        return self._change(cid, tag)
+
+    def delete(self, cid):
+        nr = self._nr(cid)
+        with self._lock:
+            self._deleted.add(nr)
+            if self._items is not None:
+                self._items.pop(nr, None)
+        return {}
+
+    def _nr(self, cid):
+        """Number of post ``cid``, or of the post follow-up ``cid`` is on"""
+        cid = str(cid)
+        digits = cid[1:9] if cid.startswith("p") else cid
+        try:
+            nr = int(digits)
+        except ValueError:
+            raise _APIError("The post you are looking for cannot be found")
+        with self._lock:
+            if not 0 < nr <= self._last_nr or nr in self._deleted:
+                raise _APIError(
+                    "The post you are looking for cannot be found")
+        return nr
+
+    def _change(self, cid, change):
+        """Apply ``change`` to a copy of post ``cid`` and keep the copy
+
+        Posts are never changed in place, so one can be encoded by a
+        thread while another changes it.
+        """
+        with self._lock:
+            old = self.post(cid)
+            post = copy.deepcopy(old)
+            result = change(post)
+            # Only changes that show in the feed move the post to its head
+            self._store(post, moved=feed_item(post) != feed_item(old))
+        return result
+
+    def _store(self, post, moved=True):
+        self._changed[post["nr"]] = post
+        if moved:
+            self._recent[post["nr"]] = None
+            self._recent.move_to_end(post["nr"])
+        if self._items is not None:
+            self._items[post["nr"]] = feed_item(post)
+
+
+def _now():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def _folders(folders):
+    if not folders:
+        return []
+    if isinstance(folders, str):
+        return [f for f in folders.split(",") if f]
+    return list(folders)
+
+
+def _revision(subject, content, created, anonymous):
+    return {"anon": anonymous, "uid": UID, "subject": subject,
+            "content": content, "created": created}
+
+
+def _child(cid, kind, subject, created, anonymous):
+    return {"id": None, "type": kind, "subject": subject,
+            "created": created, "uid": UID, "anon": anonymous,
+            "no_upvotes": 0, "folders": [], "data": {"embed_links": []},
+            "config": {}, "tag_good": [], "tag_good_arr": [],
+            "bucket_order": 3, "bucket_name": "Today", "children": []}
+
+
+def _find(post, cid):
+    """The post or follow-up of ``post`` with id ``cid``"""
+    if str(cid) in (post["id"], str(post["nr"])):
+        return post
+    for child in post["children"]:
+        if child["id"] == cid:
+            return child
+    raise _APIError("The post you are looking for cannot be found")
+
+
+def _count(post):
+    """Number of follow-ups and replies of ``post``, for new ids"""
+    return sum(1 + len(child.get("children", ()))
+               for child in post["children"])
+
+
+#############
+# Simulator #
+#############
+
+class Simulator(object):
+    """HTTP server imitating piazza.com, run on a background thread
+
+    Point a client at it with the ``base_url`` argument of
+    :class:`Piazza` or :class:`PiazzaRPC`. Any email and password log in,
+    unless ``accounts`` says otherwise, as the user :data:`UID`, who is a
+    TA of every class. Posts, follow-ups, answers and users can be
+    created, changed and deleted; the changes last until the simulator is
+    stopped.
+
+    :type classes: :class:`SyntheticClass`
+    :param classes: Classes to serve; defaults to a single class
+        ``"nsimulator"`` of 1000 posts
+    :type faults: :class:`Faults`|None
+    :param faults: How to slow down or fail API requests
+    :type accounts: dict|None
+    :param accounts: If given, only these ``{email: password}`` can log in
+    :type host: str
+    :param host: Address to listen on
+    :type port: int
+    :param port: Port to listen on; 0 picks a free one
+    :type seed: int|None
+    :param seed: Seed of the random faults
+    """
+    def __init__(self, *classes, faults=None, accounts=None,
+                 host="127.0.0.1", port=0, seed=None):
+        if not classes:
+            classes = (SyntheticClass("nsimulator"),)
+        self.classes = collections.OrderedDict((c.nid, c) for c in classes)
+        self.faults = faults or Faults()
+        self.accounts = accounts
+        self.host = host
+        self.port = port
+        #: Number of API requests received, by method
+        self.requests = collections.Counter()
+        #: Number of requests failed on purpose, by method
+        self.errors = collections.Counter()
+        self._rng = random.Random(seed)
+        self._csrf_tokens = set()
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL of the running simulator"""
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        """Start serving on a background thread
+
+        The feeds of the classes are generated first, so that the first
+        requests are not slower than the others.
+        """
+        for cls in self.classes.values():
+            cls.feed()
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.simulator = self
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="piazza-simulator")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the listening socket"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    ############
+    # Requests #
+    ############
+
+    def _handle(self, handler):
+        url = urlparse(handler.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+
+        if url.path in ("/logic/api", "/main/api") and \
+                handler.command == "POST":
+            self._api(handler, query, body, url.path == "/logic/api")
+        elif url.path == "/main/csrf_token":
+            token = uuid.uuid4().hex
+            with self._lock:
+                self._csrf_tokens.add(token)
+            _respond(handler, 200, 'CSRF_TOKEN="{}";'.format(token),
+                     "text/javascript")
+        elif url.path == "/class" and handler.command == "POST":
+            self._login(handler, body)
+        elif url.path == "/demo_login":
+            if query.get("nid") in self.classes and query.get("auth"):
+                self._login_ok(handler)
+            else:
+                _respond(handler, 404, _ERROR_PAGE.format(404, "Not Found"),
+                         "text/html")
+        else:
+            _respond(handler, 404, _ERROR_PAGE.format(404, "Not Found"),
+                     "text/html")
+
+    def _login(self, handler, body):
+        form = {k: v[0] for k, v in
+                parse_qs(body.decode("utf-8")).items()}
+        with self._lock:
+            csrf_ok = form.get("csrf_token") in self._csrf_tokens
+        if not csrf_ok:
+            error = "Your session has expired, please reload the page"
+        elif self.accounts is not None and \
+                self.accounts.get(form.get("email")) != form.get("password"):
+            error = "Email or password incorrect"
+        else:
+            return self._login_ok(handler)
+        _respond(handler, 200,
+                 '<script>var ERROR_MSG = "{}";</script>'.format(error),
+                 "text/html")
+
+    def _login_ok(self, handler):
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._sessions.add(session_id)
+        _respond(handler, 200, "<html><body>Welcome</body></html>",
+                 "text/html",
+                 {"Set-Cookie": "session_id={}; Path=/".format(session_id)})
+
+    def _api(self, handler, query, body, logic):
+        try:
+            request = json.loads(body.decode("utf-8"))
+            params = request.get("params") or {}
+            method = query["method"] if logic else request["method"]
+        except (ValueError, KeyError, AttributeError):
+            return _respond(handler, 400, _ERROR_PAGE.format(
+                400, "Bad Request"), "text/html")
+        if logic and "aid" not in query:
+            return _respond(handler, 400, _ERROR_PAGE.format(
+                400, "Bad Request"), "text/html")
+
+        with self._lock:
+            self.requests[method] += 1
+        faults = self.faults if self.faults.applies_to(method) else None
+        if faults is not None:
+            delay = faults.latency(self._rng)
+            if delay > 0:
+                time.sleep(delay)
+            if faults.error_statuses and \
+                    self._rng.random() < faults.error_rate:
+                with self._lock:
+                    self.errors[method] += 1
+                status = self._rng.choice(faults.error_statuses)
+                headers = {}
+                if status == 429:
+                    headers["Retry-After"] = str(faults.retry_after)
+                return _respond(handler, status, _ERROR_PAGE.format(
+                    status, handler.responses.get(status, ("",))[0]),
+                    "text/html", headers)
+
+        try:
+            self._check_session(handler)
+            result = self._call(method, params)
+            response = {"result": result, "error": None}
+        except _APIError as e:
+            response = {"result": None, "error": str(e)}
+        except (KeyError, TypeError, ValueError) as e:
+            response = {"result": None,
+                        "error": "Invalid parameters: {}".format(e)}
+        _respond(handler, 200,
+                 json.dumps(response, separators=(",", ":")),
+                 "application/json", throttle=faults and
+                 faults.bytes_per_second)
+
+    def _check_session(self, handler):
+        cookies = {}
+        for part in (handler.headers.get("Cookie") or "").split(";"):
+            name, _, value = part.strip().partition("=")
+            cookies[name] = value
+        session_id = cookies.get("session_id")
+        with self._lock:
+            logged_in = session_id in self._sessions
+        if not logged_in:
+            raise _APIError("Not logged in")
+        if handler.headers.get("CSRF-Token") != session_id:
+            raise _APIError("Invalid CSRF token")
+
+    def _class(self, params, key="nid"):
+        try:
+            return self.classes[params[key]]
+        except KeyError:
+            raise _APIError("Network not found")
+
+    def _call(self, method, params):
+        """Run API ``method`` and return its result"""
+        if method == "user.status":
+            return self._status()
+        if method == "user_profile.get_profile":
+            return {
+                "user_id": UID,
+                "email": "simulator@example.edu",
+                "name": "Simulator",
+                "all_classes": {nid: {"name": cls.name, "num": nid}
+                                for nid, cls in self.classes.items()},
+            }
+        if method == "network.update":
+            cls = self._class(params, "id")
+            if "add_students" in params:
+                cls.add_users(params["add_students"])
+            if "remove_users" in params:
+                cls.remove_users(params["remove_users"])
+            return cls.users()
+
+        cls = self._class(params)
+        if method == "content.get":
+            return cls.post(params["cid"])
+        if method == "network.get_my_feed":
+            offset = int(params.get("offset", 0))
+            limit = int(params.get("limit", 100))
+            feed = cls.feed()
+            return {"feed": feed[offset:offset + limit],
+                    "more": offset + limit < len(feed),
+                    "sort": params.get("sort", "updated")}
+        if method == "network.filter_feed":
+            if params.get("folder"):
+                feed = [item for item in cls.feed()
+                        if params.get("filter_folder") in item["folders"]]
+            else:
+                feed = cls.changed_feed()
+            return {"feed": feed, "more": False,
+                    "sort": params.get("sort", "updated")}
+        if method == "network.search":
+            words = params["query"].lower().split()
+            return [item for item in cls.feed()
+                    if all(word in (item["subject"] + " " +
+                                    item["snippet"]).lower()
+                           for word in words)]
+        if method == "network.get_all_users":
+            return cls.users()
+        if method == "network.get_users":
+            ids = set(params["ids"])
+            return [user for user in cls.users() if user["id"] in ids]
+        if method == "network.get_stats":
+            feed = cls.feed()
+            return {
+                "total_posts": len(feed),
+                "total_contributions": sum(
+                    1 + item["num_followups"] for item in feed),
+                "total_users": len(cls.users()),
+                "unanswered": sum(1 for item in feed
+                                  if item["type"] == "question" and
+                                  not item["num_followups"]),
+            }
+        if method == "content.create":
+            return cls.create(params)
+        if method == "content.update":
+            return cls.update(params)
+        if method == "content.answer":
+            return cls.answer(params)
+        if method == "content.duplicate":
+            return cls.mark_duplicate(params)
+        if method == "content.mark_resolved":
+            return cls.set_fields(params["cid"], no_answer_followup=0,
+                                  resolved=params.get("resolved") == "true")
+        if method in ("content.pin", "content.unpin"):
+            return cls.set_fields(params["cid"],
+                                  pin=int(method == "content.pin"))
+        if method == "content.delete":
+            return cls.delete(params["cid"])
+        if method in ("content.add_feedback", "content.remove_feedback"):
+            cls.tag_good(params["cid"], method == "content.add_feedback")
+            return "OK"
+        raise _APIError("Unknown method {}".format(method))
+
+    def _status(self):
+        return {
+            "id": UID,
+            "name": "Simulator",
+            "networks": [{
+                "id": nid,
+                "name": cls.name,
+                "term": "Fall 2020",
+                "course_number": nid,
+                "prof_hash": {UID: {}},
+                "status": "active",
+            } for nid, cls in self.classes.items()],
+        }
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep connections alive, as piazza.com does
+    protocol_version = "HTTP/1.1"
+    server_version = "PiazzaSimulator"
+    # Headers and body are written separately; don't let the body wait for
+    # the ACK of the headers
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.server.simulator._handle(self)
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _respond(handler, status, body, content_type, headers=None,
+             throttle=None):
+    """Send a response, at most ``throttle`` bytes per second if given"""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    handler.send_response(status)
+    handler.send_header("Content-Type", content_type)
+    handler.send_header("Content-Length", str(len(body)))
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
+    handler.end_headers()
+    if not throttle:
+        handler.wfile.write(body)
+        return
+    # Send in slices of a tenth of a second's worth
+    size = max(1, int(throttle) // 10)
+    for i in range(0, len(body), size):
+        handler.wfile.write(body[i:i + size])
+        handler.wfile.flush()
+        time.sleep(float(len(body[i:i + size])) / throttle)
+
+
+#######
+# CLI #
+#######
+
+_DISTRIBUTIONS = {
+    "fixed": fixed,
+    "uniform": uniform,
+    "lognormal": lognormal,
+    "exponential": exponential,
+}
+
+
+def _latency(spec):
+    """Parse ``SECONDS`` or ``DISTRIBUTION:ARG[,ARG]``"""
+    name, _, args = spec.partition(":")
+    if not args:
+        return fixed(float(name))
+    try:
+        distribution = _DISTRIBUTIONS[name]
+    except KeyError:
+        raise argparse.ArgumentTypeError(
+            "unknown distribution {!r}".format(name))
+    return distribution(*(float(arg) for arg in args.split(",")))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--nid", nargs="+", default=["nsimulator"],
+                        help="IDs of the classes to serve")
+    parser.add_argument("--posts", type=int, default=1000,
+                        help="Posts per class")
+    parser.add_argument("--users", type=int, default=200,
+                        help="Users per class")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=_latency, default=0,
+                        metavar="SPEC",
+                        help="Seconds, or e.g. lognormal:0.05,0.5, "
+                             "uniform:0.01,0.1 or exponential:0.05")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-statuses", default="429,500,502,503",
+                        help="Comma-separated HTTP statuses")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--bytes-per-second", type=int)
+    parser.add_argument("--fault-methods", nargs="+", metavar="METHOD",
+                        help="Only apply faults to these API methods")
+    args = parser.parse_args(argv)
+
+    faults = Faults(
+        latency=args.latency, error_rate=args.error_rate,
+        error_statuses=[int(s) for s in args.error_statuses.split(",")],
+        retry_after=args.retry_after,
+        bytes_per_second=args.bytes_per_second,
+        methods=args.fault_methods)
+    classes = [SyntheticClass(nid, args.posts, args.users, args.seed + i)
+               for i, nid in enumerate(args.nid)]
+    simulator = Simulator(*classes, faults=faults, host=args.host,
+                          port=args.port, seed=args.seed)
+    with simulator:
+        print("Serving {} at {} (Ctrl-C to stop)".format(
+            ", ".join(args.nid), simulator.url))
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        print()
+        for method, count in sorted(simulator.requests.items()):
+            print("{:<28} {:>8} requests {:>6} failed".format(
+                method, count, simulator.errors[method]))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
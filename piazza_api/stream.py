@@ -0,0 +1,212 @@
+"""Incremental decoding of large JSON responses
+
+Piazza wraps every response in an object like
+``{"result": {"feed": [...]}, "error": null}``. The classes here decode
+the elements of one array inside such a document as the bytes come in,
+so that only about one element has to be held in memory at a time.
+"""
+import codecs
+import json
+
+# Sent by the parser when it has run out of input
+_NEED_DATA = object()
+
+_WHITESPACE = " \t\r\n"
+_DELIMITERS = _WHITESPACE + ",:]}"
+
+
+class JSONArrayStream(object):
+    """Push parser yielding the elements of the array at ``path``
+
+    Feed it chunks of the document as they arrive; each call returns the
+    elements completed by that chunk. Values of other top-level keys
+    (e.g. ``error``) are collected in :attr:`siblings`.
+
+    Example:
+        >>> stream = JSONArrayStream(("result", "feed"))
+        >>> stream.feed(b'{"result": {"feed": [{"id": 1}, {"i')
+        [{'id': 1}]
+        >>> stream.feed(b'd": 2}]}, "error": null}')
+        [{'id': 2}]
+        >>> stream.close()
+        []
+        >>> stream.siblings
+        {'error': None}
+
+    :type path: tuple of str
+    :param path: Keys leading from the top-level object to the array
+    """
+    def __init__(self, path):
+        #: Values of top-level keys other than ``path[0]``
+        self.siblings = {}
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._parser = _Parser(tuple(path), self.siblings).run()
+        self._done = False
+        next(self._parser)
+
+    def feed(self, chunk):
+        """Parse ``chunk`` (bytes or str)
+
+        :returns: Elements of the array completed by ``chunk``
+        :rtype: list
+        :raises ValueError: If the document is not valid JSON
+        """
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk)
+        if not chunk:
+            return []
+        return self._send(chunk)
+
+    def close(self):
+        """Signal the end of the document
+
+        :returns: Elements of the array completed by the end of input
+        :rtype: list
+        :raises ValueError: If the document is incomplete
+        """
+        items = self.feed(self._decoder.decode(b"", final=True))
+        return items + self._send("")
+
+    def _send(self, text):
+        items = []
+        if self._done:
+            return items
+        try:
+            out = self._parser.send(text)
+            while out is not _NEED_DATA:
+                items.append(out)
+                out = next(self._parser)
+        except StopIteration:
+            self._done = True
+        return items
+
+
+def iter_json_array(chunks, path, siblings=None):
+    """Yield the elements of the array at ``path`` from ``chunks``
+
+    :type chunks: iterable of bytes|str
+    :param chunks: Pieces of the JSON document, in order
+    :type path: tuple of str
+    :param path: Keys leading from the top-level object to the array
+    :type siblings: dict|None
+    :param siblings: If given, updated with the values of the other
+        top-level keys once the document has been read
+    :rtype: generator
+    """
+    stream = JSONArrayStream(path)
+    for chunk in chunks:
+        for item in stream.feed(chunk):
+            yield item
+    for item in stream.close():
+        yield item
+    if siblings is not None:
+        siblings.update(stream.siblings)
+
+
+class _Parser(object):
+    """Pull parser driven by :class:`JSONArrayStream`
+
+    Every method is a generator that yields ``_NEED_DATA`` when it runs
+    out of input (and is sent more text, or ``""`` at the end) and yields
+    the elements of the target array as they are decoded.
+    """
+    def __init__(self, path, siblings):
+        self.path = path
+        self.siblings = siblings
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def run(self):
+        yield from self._object(0)
+
+    def _more(self):
+        if self.eof:
+            raise ValueError("Unexpected end of JSON document")
+        # Drop what has been consumed so the buffer stays about one
+        # element long
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        data = yield _NEED_DATA
+        if data:
+            self.buf += data
+        else:
+            self.eof = True
+
+    def _peek(self):
+        while True:
+            while (self.pos < len(self.buf) and
+                   self.buf[self.pos] in _WHITESPACE):
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            yield from self._more()
+
+    def _expect(self, char):
+        found = yield from self._peek()
+        if found != char:
+            raise ValueError("Expected {!r} but found {!r} in JSON document"
+                             .format(char, found))
+        self.pos += 1
+
+    def _value(self):
+        yield from self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+            else:
+                # A number may have been cut short ("1" of "1.5"), so only
+                # trust it once the character after it has arrived
+                if (self.eof or end < len(self.buf) and
+                        self.buf[end] in _DELIMITERS):
+                    self.pos = end
+                    return value
+            yield from self._more()
+
+    def _object(self, depth):
+        yield from self._expect("{")
+        if (yield from self._peek()) == "}":
+            self.pos += 1
+            return
+        while True:
+            key = yield from self._value()
+            yield from self._expect(":")
+            if depth < len(self.path) and key == self.path[depth]:
+                found = yield from self._peek()
+                if depth + 1 == len(self.path) and found == "[":
+                    yield from self._array()
+                elif depth + 1 < len(self.path) and found == "{":
+                    yield from self._object(depth + 1)
+                else:
+                    # Not what we were looking for, e.g. a null result
+                    yield from self._value()
+            else:
+                value = yield from self._value()
+                if depth == 0:
+                    self.siblings[key] = value
+            found = yield from self._peek()
+            self.pos += 1
+            if found == "}":
+                return
+            if found != ",":
+                raise ValueError("Expected ',' or '}}' but found {!r} in "
+                                 "JSON document".format(found))
+
+    def _array(self):
+        yield from self._expect("[")
+        if (yield from self._peek()) == "]":
+            self.pos += 1
+            return
+        while True:
+            yield (yield from self._value())
+            found = yield from self._peek()
+            self.pos += 1
+            if found == "]":
+                return
+            if found != ",":
+                raise ValueError("Expected ',' or ']' but found {!r} in "
+                                 "JSON document".format(found))
@@ -0,0 +1,196 @@
+"""Synthetic Piazza data sized like a real class
+
+Everything is generated from a seed, so the same seed always gives exactly
+the same data. The shapes follow
+``data_descriptions/Piazza_API_Post_Data_Dictionary.md``. Used by the
+benchmarks and by :class:`piazza_api.simulator.Simulator`.
+"""
+import random
+
+NUM_POSTS = 10000
+NUM_USERS = 5000
+NUM_NETWORKS = 40
+
+_WORDS = ("the of and to in is for on that with as this by be are from "
+          "homework lecture midterm final exam question answer problem set "
+          "solution recursion pointer array list tree graph runtime memory "
+          "assignment deadline extension office hours grading rubric test "
+          "case compile error segfault python java loop function class "
+          "variable").split()
+_FOLDERS = ("hw1", "hw2", "hw3", "hw4", "lecture", "exam", "logistics",
+            "other")
+
+
+def _text(rng, n):
+    return " ".join(rng.choice(_WORDS) for _ in range(n))
+
+
+def _timestamp(rng):
+    return "2020-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}Z".format(
+        rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 23),
+        rng.randint(0, 59), rng.randint(0, 59))
+
+
+def _uid(rng, num_users=NUM_USERS):
+    return "u{:06d}".format(rng.randrange(num_users))
+
+
+def post_id(nr):
+    """The ``id`` of the synthetic post number ``nr``"""
+    return "p{:08d}".format(nr)
+
+
+def make_post(nr, seed=0, num_users=NUM_USERS):
+    """The full post ``nr`` (``content.get`` result)"""
+    rng = random.Random(seed * 1000003 + nr)
+    pid = post_id(nr)
+    created = _timestamp(rng)
+    history = [{
+        "anon": "no",
+        "uid": _uid(rng, num_users),
+        "subject": _text(rng, rng.randint(3, 10)),
+        "content": "<p>{}</p>".format(_text(rng, rng.randint(20, 200))),
+        "created": created,
+    } for _ in range(rng.choice((1, 1, 1, 2, 3)))]
+    children = []
+    for j in range(rng.randint(0, 6)):
+        children.append({
+            "id": "{}f{}".format(pid, j),
+            "type": rng.choice(("followup", "i_answer", "s_answer")),
+            "subject": "<p>{}</p>".format(_text(rng, rng.randint(10, 80))),
+            "created": created,
+            "uid": _uid(rng, num_users),
+            "anon": "no",
+            "no_upvotes": 0,
+            "folders": [],
+            "data": {"embed_links": []},
+            "config": {},
+            "tag_good": [],
+            "tag_good_arr": [],
+            "bucket_order": 3,
+            "bucket_name": "Today",
+            "children": [{
+                "id": "{}f{}r{}".format(pid, j, k),
+                "type": "feedback",
+                "subject": _text(rng, rng.randint(5, 30)),
+                "created": created,
+                "uid": _uid(rng, num_users),
+                "anon": "no",
+                "children": [],
+            } for k in range(rng.randint(0, 2))],
+        })
+    folders = [rng.choice(_FOLDERS)]
+    return {
+        "id": pid,
+        "nr": nr,
+        "type": rng.choice(("question", "note")),
+        "folders": folders,
+        "tags": folders + ["student"],
+        "created": created,
+        "status": "active",
+        "history": history,
+        "history_size": len(history),
+        "children": children,
+        "change_log": [{
+            "anon": "no",
+            "uid": _uid(rng, num_users),
+            "type": "create" if i == 0 else "followup",
+            "when": created,
+            "v": "all",
+            "data": "{}c{}".format(pid, i),
+        } for i in range(1 + len(children))],
+        "tag_good": [],
+        "tag_good_arr": [],
+        "unique_views": rng.randint(1, 400),
+        "no_answer_followup": 0,
+        "bucket_order": 3,
+        "bucket_name": "Today",
+        "num_favorites": 0,
+        "my_favorite": False,
+        "is_bookmarked": False,
+        "bookmarked": 2,
+        "is_tag_good": False,
+        "request_instructor": 0,
+        "request_instructor_me": False,
+        "default_anonymity": "no",
+        "config": {},
+        "data": {"embed_links": []},
+        "drafts": {},
+        "t": 1577836800000 + nr,
+    }
+
+
+def feed_item(post):
+    """The feed entry of ``post`` (an element of ``get_my_feed``'s feed)"""
+    latest = post["history"][0]
+    return {
+        "id": post["id"],
+        "nr": post["nr"],
+        "type": post["type"],
+        "subject": latest["subject"],
+        "snippet": latest["content"][:120],
+        "folders": post["folders"],
+        "tags": post["tags"],
+        "updated": latest["created"],
+        "modified": latest["created"],
+        "status": post["status"],
+        "main_version": post["history_size"],
+        "no_answer_followup": post["no_answer_followup"],
+        "num_followups": len(post["children"]),
+        "unique_views": post["unique_views"],
+        "is_new": False,
+        "bookmarked": post["bookmarked"],
+        "num_favorites": post["num_favorites"],
+        "request_instructor": 0,
+        "tag_good_arr": [],
+    }
+
+
+def make_feed(num_posts=NUM_POSTS, seed=0, num_users=NUM_USERS):
+    """A ``get_my_feed`` result with ``num_posts`` items, newest first"""
+    return {
+        "feed": [feed_item(make_post(nr, seed, num_users))
+                 for nr in range(num_posts, 0, -1)],
+        "more": False,
+        "sort": "updated",
+    }
+
+
+def make_users(num_users=NUM_USERS, seed=0):
+    """A ``get_all_users`` result"""
+    rng = random.Random(seed)
+    return [{
+        "id": "u{:06d}".format(i),
+        "name": _text(rng, 2).title(),
+        "email": "student{}@example.edu".format(i),
+        "role": "student" if i % 50 else "ta",
+        "admin": i % 50 == 0,
+        "photo": None,
+        "us": False,
+        "facebook_id": None,
+        "days": rng.randint(0, 120),
+        "posts": rng.randint(0, 40),
+        "asks": rng.randint(0, 20),
+        "answers": rng.randint(0, 20),
+        "views": rng.randint(0, 2000),
+        "class_sections": [],
+    } for i in range(num_users)]
+
+
+def make_status(num_networks=NUM_NETWORKS, seed=0):
+    """A ``user.status`` result for a user enrolled in ``num_networks``"""
+    rng = random.Random(seed)
+    uid = "u000000"
+    return {
+        "id": uid,
+        "name": "Benchmark User",
+        "networks": [{
+            "id": "n{:08d}".format(i),
+            "name": _text(rng, 4).title(),
+            "term": rng.choice(("Fall 2020", "Winter 2021", "Summer 2021")),
+            "course_number": "CS {}".format(100 + i),
+            "prof_hash": {("u{:06d}".format(j) if j else uid): {}
+                          for j in range(i % 3, 5)},
+            "status": "active",
+        } for i in range(num_networks)],
+    }
@@ -0,0 +1,338 @@
+"""Tracing of requests and of the operations that make them
+
+Pass a :class:`Tracer` to :class:`Piazza` to get a :class:`Span` for every
+API request and for the :class:`Network` operations around them; spans
+nest, so e.g. the requests made by :meth:`Network.iter_all_posts`, even
+from its worker threads, are children of its span. Finished spans are
+handed to callbacks; :class:`OpenTelemetryTracer` also reports them to
+OpenTelemetry.
+"""
+import contextlib
+import contextvars
+import functools
+import inspect
+import itertools
+import threading
+import time
+
+_current = contextvars.ContextVar("piazza_api_span", default=None)
+
+_ids = itertools.count(1)
+_ids_lock = threading.Lock()
+
+
+def _next_id():
+    with _ids_lock:
+        return next(_ids)
+
+
+def current_span():
+    """Return the active :class:`Span` of the calling thread or task
+
+    :rtype: :class:`Span`|None
+    """
+    return _current.get()
+
+
+class Span(object):
+    """A timed operation
+
+    :ivar name: e.g. ``"piazza.request"`` or ``"Network.iter_all_posts"``
+    :ivar attributes: dict of details such as ``method``, ``nid``, ``cid``
+        and ``status``
+    :ivar parent: Enclosing :class:`Span`, or ``None``
+    :ivar span_id: Number identifying the span within the process
+    :ivar trace_id: ``span_id`` of the outermost enclosing span
+    :ivar start: Start time, from :func:`time.time`
+    :ivar duration: Seconds taken, or ``None`` while running
+    :ivar error: Exception that ended the span, if any
+    """
+    __slots__ = ('name', 'attributes', 'parent', 'span_id', 'trace_id',
+                 'start', 'duration', 'error', '_started', '_token',
+                 '_native')
+
+    def __init__(self, name, attributes, parent):
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        self.span_id = _next_id()
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+        self._started = time.monotonic()
+        self._token = None
+        self._native = None
+
+    def set_attributes(self, **attributes):
+        """Add or update attributes of the span"""
+        self.attributes.update(attributes)
+
+    def __repr__(self):
+        return "Span({!r}, {!r}, duration={!r})".format(
+            self.name, self.attributes, self.duration)
+
+
+class Tracer(object):
+    """Creates spans and passes each finished one to ``callbacks``
+
+    Example:
+        >>> def log(span):
+        ...     print(span.name, span.attributes, span.duration)
+        >>> p = Piazza(tracer=Tracer(log))
+
+    :type callbacks: callable
+    :param callbacks: Functions called with each finished :class:`Span`;
+        they run on the thread that finished the span and must be quick
+    """
+    def __init__(self, *callbacks):
+        self.callbacks = list(callbacks)
+
+    def start_span(self, name, attributes=None, activate=True):
+        """Start a span as a child of the active span
+
+        :type activate: bool
+        :param activate: Make the new span the active one until it ends
+        :rtype: :class:`Span`
+        """
+        span = Span(name, dict(attributes or ()), _current.get())
+        if activate:
+            span._token = _current.set(span)
+        return span
+
+    def end_span(self, span, error=None):
+        """End ``span``, which must be the active span if it was activated
+
+        :type error: BaseException|None
+        :param error: Exception that ended the span
+        """
+        span.duration = time.monotonic() - span._started
+        span.error = error
+        if span._token is not None:
+            _current.reset(span._token)
+            span._token = None
+        for callback in self.callbacks:
+            callback(span)
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        """Context manager running its block in a new active span"""
+        span = self.start_span(name, attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, e)
+            raise
+        self.end_span(span)
+
+    @contextlib.contextmanager
+    def activate(self, span):
+        """Context manager making ``span`` the active span for its block"""
+        token = _current.set(span)
+        try:
+            yield span
+        finally:
+            _current.reset(token)
+
+    def annotate(self, **attributes):
+        """Add attributes to the active span, if any"""
+        span = _current.get()
+        if span is not None:
+            span.attributes.update(attributes)
+
+
+class OpenTelemetryTracer(Tracer):
+    """:class:`Tracer` that also reports every span to OpenTelemetry
+
+    Requires ``opentelemetry-api`` (``pip install piazza-api[otel]``);
+    spans become children of the OpenTelemetry span active when the
+    outermost one starts.
+
+    :type callbacks: callable
+    :param callbacks: See :class:`Tracer`
+    :param tracer: OpenTelemetry tracer to use; defaults to
+        ``opentelemetry.trace.get_tracer("piazza_api")``
+    """
+    def __init__(self, *callbacks, tracer=None):
+        from opentelemetry import trace
+        super(OpenTelemetryTracer, self).__init__(*callbacks)
+        self._trace = trace
+        self._tracer = tracer or trace.get_tracer("piazza_api")
+
+    def start_span(self, name, attributes=None, activate=True):
+        span = super(OpenTelemetryTracer, self).start_span(
+            name, attributes, activate)
+        context = None
+        if span.parent is not None and span.parent._native is not None:
+            context = self._trace.set_span_in_context(span.parent._native)
+        span._native = self._tracer.start_span(name, context=context)
+        return span
+
+    def end_span(self, span, error=None):
+        native = span._native
+        if native is not None:
+            for key, value in span.attributes.items():
+                if value is not None:
+                    native.set_attribute("piazza." + key, _otel_value(value))
+            if error is not None:
+                native.record_exception(error)
+                native.set_status(self._trace.Status(
+                    self._trace.StatusCode.ERROR, str(error)))
+            native.end()
+        super(OpenTelemetryTracer, self).end_span(span, error)
+
+
+def _otel_value(value):
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def traced(*arg_names):
+    """Decorate a :class:`Network` method to run in a span of its own
+
+    The span is named after the method and carries the network's ``nid``
+    and the arguments named in ``arg_names``. Generators and asynchronous
+    generators are supported; their span covers the whole iteration and
+    records in ``busy_seconds`` the time spent inside the generator, as
+    opposed to in the caller's loop body.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def tracer_of(self):
+            return getattr(self._rpc, 'tracer', None)
+
+        def attributes_of(self, args, kwargs):
+            attributes = {"nid": self._nid}
+            if arg_names:
+                bound = signature.bind(self, *args, **kwargs)
+                for arg in arg_names:
+                    if arg in bound.arguments:
+                        attributes[arg] = _attribute(bound.arguments[arg])
+            return attributes
+
+        name = "Network." + func.__name__
+
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def wrapper(self, *args, **kwargs):
+                tracer = tracer_of(self)
+                items = func(self, *args, **kwargs)
+                if tracer is None:
+                    try:
+                        async for item in items:
+                            yield item
+                    finally:
+                        await items.aclose()
+                    return
+                span = tracer.start_span(name,
+                                         attributes_of(self, args, kwargs),
+                                         activate=False)
+                busy = 0.0
+                error = None
+                try:
+                    while True:
+                        started = time.monotonic()
+                        with tracer.activate(span):
+                            try:
+                                item = await items.__anext__()
+                            except StopAsyncIteration:
+                                break
+                            finally:
+                                busy += time.monotonic() - started
+                        yield item
+                except BaseException as e:
+                    error = None if isinstance(e, GeneratorExit) else e
+                    raise
+                finally:
+                    with tracer.activate(span):
+                        await items.aclose()
+                    span.attributes["busy_seconds"] = busy
+                    tracer.end_span(span, error)
+        elif inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def wrapper(self, *args, **kwargs):
+                tracer = tracer_of(self)
+                if tracer is None:
+                    yield from func(self, *args, **kwargs)
+                    return
+                span = tracer.start_span(name,
+                                         attributes_of(self, args, kwargs),
+                                         activate=False)
+                busy = 0.0
+                error = None
+                items = func(self, *args, **kwargs)
+                try:
+                    while True:
+                        started = time.monotonic()
+                        with tracer.activate(span):
+                            try:
+                                item = next(items)
+                            except StopIteration:
+                                break
+                            finally:
+                                busy += time.monotonic() - started
+                        yield item
+                except BaseException as e:
+                    error = None if isinstance(e, GeneratorExit) else e
+                    raise
+                finally:
+                    with tracer.activate(span):
+                        items.close()
+                    span.attributes["busy_seconds"] = busy
+                    tracer.end_span(span, error)
+        elif inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(self, *args, **kwargs):
+                tracer = tracer_of(self)
+                if tracer is None:
+                    return await func(self, *args, **kwargs)
+                with tracer.span(name,
+                                 **attributes_of(self, args, kwargs)):
+                    return await func(self, *args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(self, *args, **kwargs):
+                tracer = tracer_of(self)
+                if tracer is None:
+                    return func(self, *args, **kwargs)
+                span = tracer.start_span(name,
+                                         attributes_of(self, args, kwargs))
+                try:
+                    result = func(self, *args, **kwargs)
+                except BaseException as e:
+                    tracer.end_span(span, e)
+                    raise
+                if inspect.isawaitable(result):
+                    # Inherited by an asyncio flavour: the work happens
+                    # when the result is awaited
+                    _current.reset(span._token)
+                    span._token = None
+                    return _finish(tracer, span, result)
+                tracer.end_span(span)
+                return result
+        return wrapper
+    return decorator
+
+
+async def _finish(tracer, span, awaitable):
+    """Await ``awaitable`` with ``span`` active, then end ``span``"""
+    try:
+        with tracer.activate(span):
+            result = await awaitable
+    except BaseException as e:
+        tracer.end_span(span, e)
+        raise
+    tracer.end_span(span)
+    return result
+
+
+def _attribute(value):
+    """Reduce a post argument (a dict or model) to its ``id``"""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    try:
+        return value["id"]
+    except (KeyError, TypeError, IndexError):
+        return str(value)
@@ -27,6 +27,11 @@ setup(
     license='MIT License',
     author='Hamza Faran',
     install_requires=install_requires,
+    extras_require={
+        'async': ['aiohttp'],
+        'fast': ['orjson'],
+        'otel': ['opentelemetry-api'],
+    },
     description="Unofficial Client for Piazza's Internal API",
     long_description=long_description,
     long_description_content_type='text/markdown',
@@ -0,0 +1,63 @@
+"""Fixtures shared by the tests
+
+Most tests run the client against a :class:`Simulator` serving one class,
+:data:`NID`. The class and the simulator are configured with the
+``simulator`` mark, on a test or on a whole module::
+
+    pytestmark = pytest.mark.simulator(num_posts=50,
+                                       faults=Faults(latency=0.01))
+
+``num_posts``, ``num_users`` and ``name`` go to :class:`SyntheticClass`,
+anything else to :class:`Simulator`.
+"""
+import pytest
+
+from piazza_api import Piazza
+from piazza_api.simulator import Simulator, SyntheticClass
+
+NID = "nsim"
+EMAIL = "student@example.edu"
+PASSWORD = "password"
+
+_CLASS_ARGS = ("num_posts", "num_users", "name")
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "simulator(**kwargs): configure the sim fixture")
+
+
+@pytest.fixture
+def nid():
+    """ID of the class served by ``sim``"""
+    return NID
+
+
+@pytest.fixture
+def sim(request):
+    """A running :class:`Simulator`, stopped after the test"""
+    marker = request.node.get_closest_marker("simulator")
+    kwargs = dict(marker.kwargs) if marker else {}
+    class_args = {key: kwargs.pop(key) for key in _CLASS_ARGS
+                  if key in kwargs}
+    with Simulator(SyntheticClass(NID, **class_args), **kwargs) as sim:
+        yield sim
+
+
+@pytest.fixture
+def login(sim):
+    """Log a new client in to ``sim`` and return its :class:`Network`
+
+    Keyword arguments are passed on to :class:`Piazza`.
+    """
+    def login(**kwargs):
+        p = Piazza(base_url=sim.url, **kwargs)
+        p.user_login(EMAIL, PASSWORD)
+        return p.network(NID)
+    return login
+
+
+@pytest.fixture
+def network(login):
+    """:class:`Network` of a client logged in to ``sim``"""
+    return login()
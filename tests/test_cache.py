@@ -0,0 +1,172 @@
+import asyncio
+import threading
+
+import pytest
+
+from piazza_api import cache as cache_module
+from piazza_api.cache import PostCache
+
+NID = "ncache"
+
+
+class Clock(object):
+    """Stands in for the ``time`` module, advanced by hand"""
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return clock
+
+
+def post(nr, content="text"):
+    return {"id": "p{}".format(nr), "nr": nr,
+            "history": [{"subject": "s{}".format(nr), "content": content}],
+            "children": [{"id": "c{}".format(nr), "children": []}]}
+
+
+def test_lookup_by_id_nr_and_followup():
+    cache = PostCache()
+    cache.put(NID, 1, post(1))
+    assert cache.get(NID, "p1") == post(1)
+    assert cache.get(NID, 1) == post(1)
+    assert cache.get(NID, "c1") == post(1)
+    assert cache.get("other", 1) is None
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_hits_are_copies():
+    cache = PostCache()
+    original = post(1)
+    cache.put(NID, 1, original)
+    original["history"][0]["content"] = "changed after put"
+    hit = cache.get(NID, 1)
+    assert hit == post(1)
+    hit["history"].clear()
+    assert cache.get(NID, 1) == post(1)
+    assert cache.get(NID, 1) is not cache.get(NID, 1)
+
+
+def test_least_recently_used_are_evicted():
+    cache = PostCache(maxsize=3)
+    for nr in range(1, 4):
+        cache.put(NID, nr, post(nr))
+    cache.get(NID, 1)
+    cache.put(NID, 4, post(4))
+    assert len(cache) == 3
+    assert cache.get(NID, 2) is None
+    # Aliases of an evicted post go with it
+    assert cache.get(NID, "c2") is None
+    assert [cache.get(NID, nr)["nr"] for nr in (1, 3, 4)] == [1, 3, 4]
+
+
+def test_posts_expire_after_ttl(clock):
+    cache = PostCache(ttl=60)
+    cache.put(NID, 1, post(1))
+    clock.now += 59
+    assert cache.get(NID, 1) == post(1)
+    clock.now += 1
+    assert cache.get(NID, 1) is None
+    assert len(cache) == 0
+
+
+def test_no_ttl_keeps_posts(clock):
+    cache = PostCache(ttl=None)
+    cache.put(NID, 1, post(1))
+    clock.now += 10 ** 9
+    assert cache.get(NID, 1) == post(1)
+
+
+def test_invalidate_by_any_alias():
+    cache = PostCache()
+    cache.put(NID, 1, post(1))
+    cache.invalidate(NID, "c1")
+    assert cache.get(NID, 1) is None
+    assert cache.get(NID, "p1") is None
+
+
+def test_disk_tier_survives_a_restart(clock, tmp_path):
+    path = str(tmp_path / "posts.sqlite")
+    PostCache(ttl=60, path=path).put(NID, 1, post(1))
+
+    cache = PostCache(ttl=60, path=path)
+    assert len(cache) == 0
+    assert cache.get(NID, "c1") == post(1)
+    # Loaded into memory, and aged by its time on disk
+    assert len(cache) == 1
+    clock.now += 60
+    assert cache.get(NID, 1) is None
+    assert PostCache(ttl=60, path=path).get(NID, 1) is None
+
+
+def test_disk_tier_invalidate_and_clear(tmp_path):
+    path = str(tmp_path / "posts.sqlite")
+    cache = PostCache(path=path)
+    cache.put(NID, 1, post(1))
+    cache.put(NID, 2, post(2))
+    cache.invalidate(NID, "c1")
+    assert PostCache(path=path).get(NID, 1) is None
+    assert PostCache(path=path).get(NID, 2) == post(2)
+    cache.clear()
+    assert len(cache) == 0
+    assert PostCache(path=path).get(NID, 2) is None
+
+
+@pytest.mark.simulator(num_posts=10)
+def test_writes_invalidate_cached_posts(sim, login):
+    network = login(post_cache=PostCache())
+    post = network.get_post(3)
+    assert network.get_post(3) == post
+    assert sim.requests["content.get"] == 1
+
+    network.update_post(post, "edited")
+    assert network.get_post(3)["history"][0]["subject"] == "edited"
+    followup = network.create_followup(post, "a followup")
+    assert followup["id"] in [c["id"] for c in network.get_post(3)["children"]]
+    network.create_reply(followup, "a reply")
+    followups = network.get_post(3)["children"]
+    assert [c["subject"] for f in followups if f["id"] == followup["id"]
+            for c in f["children"]] == ["a reply"]
+    assert sim.requests["content.get"] == 4
+
+
+@pytest.mark.simulator(num_posts=10)
+def test_async_client_keeps_disk_io_off_the_event_loop(sim, nid, tmp_path,
+                                                       monkeypatch):
+    pytest.importorskip("aiohttp")
+    from piazza_api import AsyncPiazza
+
+    threads = []
+    for name in ("get", "put", "invalidate"):
+        def record(self, *args, _method=getattr(cache_module._DiskTier,
+                                                name)):
+            threads.append(threading.get_ident())
+            return _method(self, *args)
+        monkeypatch.setattr(cache_module._DiskTier, name, record)
+    cache = PostCache(path=str(tmp_path / "posts.sqlite"))
+
+    async def run():
+        async with AsyncPiazza(base_url=sim.url, post_cache=cache) as p:
+            await p.user_login("student@example.edu", "password")
+            network = p.network(nid)
+            post = await network.get_post(3)
+            assert await network.get_post(3) == post
+            await network.update_post(post, "edited")
+            post = await network.get_post(3)
+            assert post["history"][0]["subject"] == "edited"
+            return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert sim.requests["content.get"] == 2
+    # get, put, invalidate, then get and put again
+    assert len(threads) == 5
+    assert loop_thread not in threads
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from piazza_api.coalesce import AsyncSingleFlight, SingleFlight
+from piazza_api.simulator import Faults
+
+CALLERS = 8
+
+
+def test_followers_get_copies():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return {"history": [{"content": "<p>body</p>"}]}
+
+    results = []
+    leader = threading.Thread(
+        target=lambda: results.append(flight.do("key", fetch)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(
+        target=lambda: results.append(flight.do("key", fetch)))
+        for _ in range(CALLERS - 1)]
+    for thread in followers:
+        thread.start()
+    while flight.shared < CALLERS - 1:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(results) == CALLERS
+    assert len(set(map(id, results))) == CALLERS
+    results[0]["history"][0]["content"] = "cleaned"
+    assert all(r["history"][0]["content"] == "<p>body</p>"
+               for r in results[1:])
+
+
+def test_async_followers_get_copies():
+    async def run():
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"nr": 5, "children": []}
+
+        results = await asyncio.gather(
+            *[flight.do("key", fetch) for _ in range(CALLERS)])
+        return calls, flight.shared, results
+
+    calls, shared, results = asyncio.run(run())
+    assert len(calls) == 1
+    assert shared == CALLERS - 1
+    assert len(set(map(id, results))) == CALLERS
+    assert all(r == {"nr": 5, "children": []} for r in results)
+
+
+@pytest.mark.simulator(num_posts=10, faults=Faults(latency=0.2))
+def test_concurrent_get_post_returns_distinct_posts(sim, network):
+    posts = []
+    threads = [threading.Thread(
+        target=lambda: posts.append(network.get_post(5)))
+        for _ in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sim.requests["content.get"] < CALLERS
+    assert len(posts) == CALLERS
+    assert len(set(map(id, posts))) == CALLERS
+    assert all(post == posts[0] for post in posts)
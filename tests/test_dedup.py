@@ -0,0 +1,138 @@
+import copy
+import random
+
+import pytest
+
+from piazza_api.dedup import DuplicateDetector, DuplicatePair, shingles
+from piazza_api.synthetic import make_post
+
+NUM_POSTS = 2000
+NUM_DUPLICATES = 50
+
+
+def near_duplicate(rng, post, nr):
+    """Copy of ``post`` posted again as ``nr``, with one word changed"""
+    post = copy.deepcopy(post)
+    post["id"] = "p{:08d}".format(nr)
+    post["nr"] = nr
+    words = post["history"][0]["content"].split()
+    words[rng.randrange(len(words))] = "changed"
+    post["history"][0]["content"] = " ".join(words)
+    return post
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = random.Random(5)
+    posts = [make_post(nr) for nr in range(1, NUM_POSTS + 1)]
+    duplicates = {}
+    for _ in range(NUM_DUPLICATES):
+        source = posts[rng.randrange(NUM_POSTS)]
+        nr = len(posts) + 1
+        posts.append(near_duplicate(rng, source, nr))
+        duplicates[nr] = source["nr"]
+    return posts, duplicates
+
+
+class FakeNetwork(object):
+    def __init__(self):
+        self.marked = []
+
+    def mark_as_duplicate(self, duplicate, original, msg=""):
+        self.marked.append((duplicate, original, msg))
+
+
+def test_shingles():
+    post = {"history": [{"subject": "Linked list",
+                         "content": "<p>Why does my linked list crash</p>"}]}
+    assert shingles(post) == {"linked list why", "list why does",
+                              "why does my", "does my linked",
+                              "my linked list", "linked list crash"}
+    assert shingles({"history": [{"subject": "Hi"}]}) == {"hi"}
+    assert shingles({"history": [{}]}) == set()
+    assert shingles({"history": [{"subject": None,
+                                  "content": "Hi there"}]}) == {"hi there"}
+    assert shingles({"history": [{"subject": "Hi",
+                                  "content": None}]}) == {"hi"}
+    detector = DuplicateDetector()
+    assert detector.signature({"id": "x", "history": [
+        {"subject": None, "content": None}]}) is None
+
+
+def test_finds_near_duplicates(corpus):
+    posts, duplicates = corpus
+    detector = DuplicateDetector(threshold=0.7)
+    assert detector.add_all(posts) == len(posts)
+    pairs = detector.find_duplicates()
+    found = {(pair.original, pair.duplicate) for pair in pairs}
+    expected = {(original, nr) for nr, original in duplicates.items()}
+    # Estimates near the threshold may fall either way
+    assert len(found & expected) >= 0.9 * len(expected)
+    # Two copies of the same post are duplicates too
+    assert all(duplicates.get(a, a) == duplicates.get(b, b)
+               for a, b in found)
+    assert [pair.similarity for pair in pairs] == \
+        sorted((pair.similarity for pair in pairs), reverse=True)
+
+
+def test_identical_texts_have_equal_signatures(corpus):
+    posts, _ = corpus
+    detector = DuplicateDetector()
+    for post in posts[:100]:
+        copied = dict(post, id="x", nr=None)
+        assert detector.signature(copied) == detector.signature(post)
+    assert detector.signature({"id": "x", "history": [{}]}) is None
+
+
+def test_match_and_remove(corpus):
+    posts, _ = corpus
+    detector = DuplicateDetector()
+    detector.add_all(posts[:100])
+    new = dict(copy.deepcopy(posts[10]), id="pnew", nr=99999)
+    assert detector.match(new)[0] == \
+        DuplicatePair(posts[10]["nr"], 99999, 1.0)
+    assert new["id"] not in detector
+    detector.remove(posts[10]["id"])
+    assert posts[10]["id"] not in detector
+    assert all(pair.original != posts[10]["nr"]
+               for pair in detector.match(new))
+
+
+def test_mark_duplicates(corpus):
+    posts, _ = corpus
+    rng = random.Random(1)
+    oldest = copy.deepcopy(posts[0])
+    oldest["history"][0]["content"] = " ".join(
+        rng.choice(("list", "pointer", "lab", "exam", "why", "crash"))
+        for _ in range(100))
+    first = near_duplicate(rng, oldest, 5001)
+    second = near_duplicate(rng, first, 5002)
+    detector = DuplicateDetector()
+    detector.add_all([oldest] + posts[1:10] + [second, first])
+    network = FakeNetwork()
+
+    assert detector.mark_duplicates(network, dry_run=True)
+    assert network.marked == []
+    marked = detector.mark_duplicates(network, msg="same question")
+    # Both are moved onto the oldest post, the oldest duplicate first
+    assert [(pair.duplicate, pair.original) for pair in marked] == \
+        [(5001, 1), (5002, 1)]
+    assert network.marked == [(5001, 1, "same question"),
+                              (5002, 1, "same question")]
+    assert first["id"] not in detector and second["id"] not in detector
+    assert detector.mark_duplicates(network) == []
+
+
+@pytest.mark.simulator(num_posts=50)
+def test_mark_duplicates_against_simulator(sim, network):
+    original = network.get_post(7)
+    copied = network.create_post(
+        "question", original["folders"], original["history"][0]["subject"],
+        original["history"][0]["content"])
+
+    detector = DuplicateDetector(threshold=0.9)
+    detector.add_all(network.iter_all_posts())
+    marked = detector.mark_duplicates(network, msg="duplicate")
+    assert [(pair.original, pair.duplicate) for pair in marked] == \
+        [(7, copied["nr"])]
+    assert sim.requests["content.duplicate"] == 1
@@ -0,0 +1,112 @@
+import copy
+import json
+import random
+
+import pytest
+
+from piazza_api.history import (compact_history, diff, expand_history,
+                                is_compact, patch, revision)
+from piazza_api.synthetic import make_post
+
+WORDS = "the a lab due grade <p> </p> segfault pointer why\n  list".split(" ")
+
+
+def random_text(rng, n):
+    return "".join(rng.choice(WORDS) + rng.choice([" ", "", "\n"])
+                   for _ in range(n))
+
+
+def edit(rng, text):
+    words = text.split(" ")
+    for _ in range(rng.randint(1, 3)):
+        i = rng.randrange(len(words) + 1)
+        if rng.random() < 0.5 and i < len(words):
+            del words[i]
+        else:
+            words.insert(i, rng.choice(WORDS))
+    return " ".join(words)
+
+
+def random_field(rng, newer):
+    roll = rng.random()
+    if roll < 0.1:
+        return None
+    if roll < 0.15:
+        return 42
+    if isinstance(newer, str) and roll < 0.8:
+        return edit(rng, newer)
+    return random_text(rng, rng.randint(0, 30))
+
+
+def random_history(rng):
+    history = []
+    newer = {}
+    for i in range(rng.randint(1, 8)):
+        rev = {"uid": "u{}".format(i), "created": str(i)}
+        for field in ("subject", "content"):
+            if rng.random() < 0.1:
+                continue
+            if rng.random() < 0.3 and field in newer:
+                rev[field] = newer[field]
+            else:
+                rev[field] = random_field(rng, newer.get(field))
+        history.append(rev)
+        newer = rev
+    return history
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_diff_patch_round_trip(seed):
+    rng = random.Random(seed)
+    base = random_text(rng, rng.randint(0, 200))
+    text = edit(rng, base) if rng.random() < 0.8 else random_text(rng, 50)
+    assert patch(base, diff(base, text)) == text
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_compact_history_round_trip(seed):
+    rng = random.Random(seed)
+    post = {"id": "p{}".format(seed), "history": random_history(rng),
+            "children": [{"id": "c1", "history": random_history(rng)},
+                         {"id": "c2", "subject": "no history"}]}
+    original = copy.deepcopy(post)
+    compact = compact_history(post)
+    assert post == original
+    # Compacted posts survive being stored as JSON
+    compact = json.loads(json.dumps(compact))
+    assert expand_history(compact) == post
+    for n, rev in enumerate(post["history"]):
+        assert revision(compact, n) == rev
+    assert compact_history(compact) == compact
+
+
+def test_none_fields_round_trip():
+    post = {"id": "p1", "history": [
+        {"subject": "s", "content": None},
+        {"subject": None, "content": "text"},
+        {"content": None},
+        {},
+    ]}
+    compact = compact_history(post)
+    assert is_compact(compact["history"])
+    assert expand_history(compact) == post
+
+
+def test_edited_posts_shrink():
+    rng = random.Random(0)
+    post = make_post(1)
+    post["history"][0]["content"] = random_text(rng, 300)
+    for _ in range(10):
+        newest = dict(post["history"][0])
+        newest["content"] = edit(rng, newest["content"])
+        post["history"].insert(0, newest)
+    compact = compact_history(post)
+    assert expand_history(compact) == post
+    assert len(json.dumps(compact["history"])) * 3 < \
+        len(json.dumps(post["history"]))
+
+
+def test_revision_out_of_range():
+    post = compact_history(make_post(1))
+    with pytest.raises(IndexError):
+        revision(post, len(post["history"]))
@@ -0,0 +1,52 @@
+import pytest
+
+from piazza_api.cache import PostCache
+from piazza_api.exceptions import RequestError
+from piazza_api.mirror import NetworkMirror, _is_not_found
+from piazza_api.retry import RetryPolicy
+from piazza_api.simulator import Faults
+
+pytestmark = pytest.mark.simulator(num_posts=50, seed=1)
+
+
+def test_failed_fetches_stay_pending(sim, login, tmp_path):
+    network = login(retry_policy=RetryPolicy(max_attempts=2, backoff=0))
+    editor = login()
+    with NetworkMirror(network, str(tmp_path / "mirror.db")) as mirror:
+        mirror.sync(users=False)
+        assert mirror.count_posts() == 50
+        for nr in range(1, 51):
+            editor.update_post(network.get_post(nr), "edited {}".format(nr))
+
+        sim.faults = Faults(error_rate=0.5, error_statuses=(502,),
+                            methods=["content.get"])
+        with pytest.raises(RequestError):
+            mirror.sync(users=False)
+        assert mirror.count_posts() == 50
+        assert mirror.pending_count() > 0
+
+        sim.faults = Faults()
+        result = mirror.sync(users=False)
+        assert result.resumed
+        assert mirror.pending_count() == 0
+        assert mirror.count_posts() == 50
+        for nr in range(1, 51):
+            post = mirror.get_post(nr)
+            assert post["history"][0]["subject"] == "edited {}".format(nr)
+
+
+def test_missing_post_is_not_found(network):
+    with pytest.raises(RequestError) as info:
+        network.get_post(9999)
+    assert _is_not_found(info.value)
+    assert not _is_not_found(RequestError("Could not decode response"))
+
+
+def test_sync_bypasses_post_cache(login, tmp_path):
+    network = login(post_cache=PostCache())
+    with NetworkMirror(network, str(tmp_path / "mirror.db")) as mirror:
+        mirror.sync(users=False)
+        login().update_post(network.get_post(7), "edited elsewhere")
+        assert mirror.sync(users=False).fetched == [network.get_post(7)["id"]]
+        assert mirror.get_post(7)["history"][0]["subject"] == \
+            "edited elsewhere"
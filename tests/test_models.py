@@ -0,0 +1,98 @@
+import pytest
+
+from piazza_api import models
+from piazza_api.models import FeedItem, Followup, Post, User, _Encoded
+from piazza_api.synthetic import make_post
+
+
+@pytest.fixture
+def encodes(monkeypatch):
+    """Count the subtrees encoded and decoded"""
+    calls = {"dumps": 0, "loads": 0}
+    backend = models.get_backend()
+
+    class Counting(object):
+        def dumps(self, value):
+            calls["dumps"] += 1
+            return backend.dumps(value)
+
+        def loads(self, data):
+            calls["loads"] += 1
+            return backend.loads(data)
+
+    monkeypatch.setattr(models, "get_backend", Counting)
+    return calls
+
+
+def big_post():
+    post = make_post(1)
+    post["history"][0]["content"] = "<p>" + "long content " * 100 + "</p>"
+    post["drafts"] = {}
+    post["tag_good"] = [{"id": "u1", "name": "A"}]
+    return post
+
+
+def test_round_trip():
+    post = big_post()
+    typed = Post.from_dict(post)
+    assert typed.to_dict() == post
+    assert typed.id == post["id"] and typed["nr"] == post["nr"]
+    assert typed.subject == post["history"][0]["subject"]
+    assert typed.content == post["history"][0]["content"]
+    assert all(isinstance(c, Followup) for c in typed.children)
+    assert typed.children[0].to_dict() == post["children"][0]
+
+
+def test_heavy_subtrees_are_decoded_once_on_access(encodes):
+    post = big_post()
+    typed = Post.from_dict(post)
+    # Small subtrees (tag_good, drafts) are not encoded at all
+    assert encodes == {"dumps": 3, "loads": 0}
+    assert isinstance(typed._history, _Encoded)
+    assert typed._history.compressed
+    assert typed.tag_good == post["tag_good"]
+    assert typed.drafts == {}
+    assert encodes["loads"] == 0
+
+    assert typed.history == post["history"]
+    assert typed.history is typed.history
+    assert encodes["loads"] == 1
+    typed.children
+    typed.change_log
+    assert encodes["loads"] == 3
+    assert typed.to_dict() == post
+
+
+def test_missing_fields_are_none():
+    typed = Post.from_dict({"id": "p1"})
+    assert typed.nr is None
+    assert typed.history is None and typed.children is None
+    assert typed.subject is None
+    assert typed.to_dict() == {"id": "p1"}
+    with pytest.raises(AttributeError):
+        typed.not_a_field
+
+
+@pytest.mark.parametrize("cls, field, lazy_field", [
+    (Post, "status", "drafts"),
+    (Followup, "subject", "history"),
+    (FeedItem, "snippet", None),
+    (User, "email", None),
+])
+def test_dict_semantics(cls, field, lazy_field):
+    d = {"id": "x", field: None, "extra": None}
+    if lazy_field:
+        d[lazy_field] = None
+    typed = cls.from_dict(d)
+    for key, value in d.items():
+        assert key in typed
+        assert typed[key] == value
+        assert typed.get(key, "default") == value
+    assert typed.to_dict() == d
+
+    assert "nr" not in typed and "other" not in typed
+    assert typed.get("nr", "default") == "default"
+    assert typed.get("other") is None
+    for key in ("name" if cls is User else "type", "other"):
+        with pytest.raises(KeyError):
+            typed[key]
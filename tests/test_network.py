@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+import pytest
+
+from piazza_api.simulator import Faults
+
+pytestmark = pytest.mark.simulator(num_posts=200,
+                                   faults=Faults(latency=0.01))
+
+
+def settled_requests(sim, method):
+    """Number of ``method`` requests once no more arrive"""
+    count = -1
+    while count != sim.requests[method]:
+        count = sim.requests[method]
+        time.sleep(0.1)
+    return count
+
+
+@pytest.mark.parametrize("method, kwargs", [
+    ("iter_posts", {"fields": ("nr", "history"), "concurrency": 4}),
+    ("iter_all_posts", {"concurrency": 4}),
+])
+def test_closing_early_stops_fetching(sim, network, method, kwargs):
+    posts = getattr(network, method)(**kwargs)
+    for _ in range(3):
+        next(posts)
+    posts.close()
+    fetched = settled_requests(sim, "content.get")
+    # The three consumed and at most a window of prefetched ones
+    assert fetched <= 3 + 2 * kwargs["concurrency"]
+    assert sim.requests["network.get_my_feed"] == 1
+
+
+def test_iter_posts_from_feed_only(sim, network):
+    items = list(network.iter_posts(fields=("nr", "subject"), limit=150,
+                                    page_size=100))
+    assert len(items) == 150
+    assert sim.requests["content.get"] == 0
+    assert sim.requests["network.get_my_feed"] == 2
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_iter_feed_yields_posts_updated_while_paging(login, network,
+                                                     stream):
+    editor = login()
+    feed = network.iter_feed(page_size=50, stream=stream)
+    ids = [next(feed)["id"] for _ in range(60)]
+    # Moves a post not yielded yet to the head of the feed, ahead of the
+    # next page, and one already yielded past it
+    editor.update_post(editor.get_post(10), "edited")
+    editor.update_post(editor.get_post(200), "edited")
+    created = editor.create_post("question", ["hw1"], "new", "new")
+    ids.extend(item["id"] for item in feed)
+    assert len(ids) == len(set(ids)) == 201
+    assert ids[-2:] == [created["id"], editor.get_post(10)["id"]]
+
+
+def test_iter_feed_reads_one_more_page_when_unchanged(sim, network):
+    assert len(list(network.iter_feed(page_size=50))) == 200
+    # Four full pages, an empty one and the head again
+    assert sim.requests["network.get_my_feed"] == 6
+
+
+def test_async_iter_feed_yields_posts_updated_while_paging(sim, login, nid):
+    pytest.importorskip("aiohttp")
+    from piazza_api import AsyncPiazza
+    editor = login()
+
+    async def run():
+        async with AsyncPiazza(base_url=sim.url) as p:
+            await p.user_login("student@example.edu", "password")
+            feed = p.network(nid).iter_feed(page_size=50, stream=True)
+            ids = [(await feed.__anext__())["id"] for _ in range(60)]
+            editor.update_post(editor.get_post(10), "edited")
+            ids.extend([item["id"] async for item in feed])
+            return ids
+
+    ids = asyncio.run(run())
+    assert len(ids) == len(set(ids)) == 200
+    assert ids[-1] == editor.get_post(10)["id"]
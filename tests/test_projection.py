@@ -0,0 +1,84 @@
+import copy
+
+import pytest
+
+from piazza_api.projection import project
+from piazza_api.synthetic import make_post
+
+
+@pytest.fixture
+def post():
+    post = make_post(1)
+    post["history"] = [{"subject": "v{}".format(i)} for i in (3, 2, 1)]
+    return post
+
+
+def test_no_options_return_the_post(post):
+    assert project(post) is post
+
+
+def test_fields_keep_only_them_and_the_id(post):
+    assert project(post, fields=("nr", "history", "missing")) == \
+        {"id": post["id"], "nr": post["nr"], "history": post["history"]}
+    assert project(post, fields=()) == {"id": post["id"]}
+
+
+def test_exclude_drops_fields(post):
+    projected = project(post, exclude=("history", "change_log", "missing"))
+    assert set(projected) == set(post) - {"history", "change_log"}
+    assert project(post, fields=("nr", "history"), exclude=("history",)) \
+        == {"id": post["id"], "nr": post["nr"]}
+    # The id is only always kept by fields
+    assert "id" not in project(post, exclude=("id",))
+
+
+@pytest.mark.parametrize("max_history, subjects", [
+    (0, []), (1, ["v3"]), (2, ["v3", "v2"]), (5, ["v3", "v2", "v1"]),
+])
+def test_max_history_keeps_the_newest(post, max_history, subjects):
+    projected = project(post, max_history=max_history)
+    assert [r["subject"] for r in projected["history"]] == subjects
+    assert project({"id": "p1"}, max_history=1) == {"id": "p1"}
+
+
+def test_post_is_not_modified(post):
+    original = copy.deepcopy(post)
+    project(post, fields=("nr", "history"), max_history=1)
+    project(post, exclude=("history",))
+    assert post == original
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"fields": "history"}, {"exclude": "history"},
+])
+def test_single_string_is_rejected(post, kwargs):
+    with pytest.raises(TypeError):
+        project(post, **kwargs)
+
+
+def test_negative_max_history_is_rejected(post):
+    with pytest.raises(ValueError):
+        project(post, max_history=-1)
+
+
+@pytest.mark.simulator(num_posts=20)
+def test_network_projects_posts_and_feeds(sim, network):
+    post = network.get_post(1, fields=("nr", "history"), max_history=1)
+    assert set(post) == {"id", "nr", "history"}
+    assert len(post["history"]) == 1
+    assert "change_log" not in network.get_post(1, exclude=("change_log",))
+    assert "change_log" in network.get_post(1)
+
+    feed = network.get_feed(limit=5, fields=("subject",))["feed"]
+    assert [set(item) for item in feed] == [{"id", "subject"}] * 5
+
+    requests = sim.requests["content.get"]
+    # Feed items have these fields, so no post is fetched
+    items = list(network.iter_posts(fields=("nr", "subject"), limit=5))
+    assert [set(item) for item in items] == [{"id", "nr", "subject"}] * 5
+    assert sim.requests["content.get"] == requests
+    # Posts are fetched for their history, and get the snippet of their
+    # feed item
+    posts = list(network.iter_posts(fields=("history", "snippet"), limit=5))
+    assert [set(p) for p in posts] == [{"id", "history", "snippet"}] * 5
+    assert sim.requests["content.get"] == requests + 5
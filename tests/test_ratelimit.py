@@ -0,0 +1,144 @@
+import pytest
+
+from piazza_api import ratelimit
+from piazza_api.exceptions import RequestError
+from piazza_api.ratelimit import RateLimiter, TokenBucket
+from piazza_api.retry import RetryPolicy
+from piazza_api.simulator import Faults
+
+
+class Clock(object):
+    """Stands in for the ``time`` module; sleeping advances it"""
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return clock
+
+
+def test_bucket_refills_at_its_rate(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    # Going into debt queues callers behind each other
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+    clock.now += 1.0
+    assert bucket.reserve() == pytest.approx(0.5)
+    # Never more than the burst is saved up
+    clock.now += 60
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    assert bucket.reserve() == pytest.approx(0.5)
+
+
+def test_bucket_defaults_and_validation(clock):
+    assert TokenBucket(rate=0.2).capacity == 1
+    assert TokenBucket(rate=5).capacity == 5
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_acquire_sleeps_for_the_delay(clock):
+    bucket = TokenBucket(rate=4, burst=1)
+    bucket.acquire()
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == [pytest.approx(0.25), pytest.approx(0.25)]
+
+
+def test_set_rate_keeps_accrued_tokens(clock):
+    bucket = TokenBucket(rate=1, burst=10)
+    for _ in range(10):
+        bucket.reserve()
+    clock.now += 2
+    bucket.set_rate(0.5)
+    # 2 tokens were accrued at the old rate; the debt refills at the new one
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(2.0)
+
+
+def test_pause_holds_back_callers(clock):
+    bucket = TokenBucket(rate=10, burst=10)
+    bucket.pause(3)
+    bucket.pause(1)
+    assert bucket.reserve() == pytest.approx(3)
+    clock.now += 2
+    assert bucket.reserve() == pytest.approx(1)
+    clock.now += 1
+    assert bucket.reserve() == 0
+
+
+def test_rates_by_family_and_method(clock):
+    limiter = RateLimiter({"content.*": 2, "content.create": 0.5,
+                           "network": 1})
+    assert limiter.bucket("content.get").rate == 2
+    assert limiter.bucket("content.get") is limiter.bucket("content.edit")
+    assert limiter.bucket("content.create").rate == 0.5
+    assert limiter.bucket("network.get_my_feed").rate == 1
+    assert limiter.bucket("user.status") is None
+    assert limiter.reserve("user.status") == 0
+    assert RateLimiter(default=3).bucket("user.status").rate == 3
+
+
+def test_throttling_cuts_the_rate_and_successes_restore_it(clock):
+    limiter = RateLimiter({"content": 4}, min_rate=0.5, decrease=0.5,
+                          increase=0.25)
+    bucket = limiter.bucket("content.get")
+    limiter.update("content.get", 429)
+    assert bucket.rate == 2
+    limiter.update("content.get", 503)
+    assert bucket.rate == 1
+    limiter.update("content.get", 500)
+    limiter.update("content.get", 502)
+    assert bucket.rate == 0.5
+    # Statuses other than 429 and 5xx are not throttling
+    limiter.update("content.get", 404)
+    assert bucket.rate == 1.5
+    limiter.update("content.get", 200)
+    limiter.update("content.get", 200)
+    limiter.update("content.get", 200)
+    assert bucket.rate == bucket.max_rate == 4
+    # Unlimited methods are left alone
+    limiter.update("user.status", 429)
+    assert limiter.bucket("user.status") is None
+
+
+def test_retry_after_pauses_the_family(clock):
+    limiter = RateLimiter({"content": 100, "network": 100})
+    limiter.update("content.get", 429, "7")
+    assert limiter.reserve("content.create") == pytest.approx(7)
+    assert limiter.reserve("network.get_my_feed") == 0
+    clock.now += 7
+    # An HTTP date or a missing header only cuts the rate
+    limiter.update("content.get", 429, "Wed, 21 Oct 2026 07:28:00 GMT")
+    limiter.update("content.get", 503, None)
+    assert limiter.reserve("content.get") == 0
+    assert limiter.bucket("content.get").rate == 12.5
+
+
+@pytest.mark.simulator(num_posts=10,
+                       faults=Faults(error_rate=1.0, error_statuses=(429,),
+                                     retry_after=5, methods=["content.get"]))
+def test_client_honours_retry_after(sim, login, clock):
+    limiter = RateLimiter({"content": 10}, decrease=0.5)
+    network = login(rate_limiter=limiter,
+                    retry_policy=RetryPolicy(max_attempts=3, backoff=0))
+    assert len(network.get_feed(limit=10)["feed"]) == 10
+    with pytest.raises(RequestError):
+        network.get_post(1)
+    assert sim.errors == {"content.get": 3}
+    # Each retry waited for the Retry-After of the previous answer
+    assert clock.sleeps == [pytest.approx(5), pytest.approx(5)]
+    assert limiter.bucket("content.get").rate == 1.25
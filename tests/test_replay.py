@@ -0,0 +1,68 @@
+import pytest
+
+from piazza_api import Piazza
+from piazza_api.exceptions import NotRecordedError, RequestError
+from piazza_api.replay import ReplayAdapter, RecordingAdapter, read_log
+
+pytestmark = pytest.mark.simulator(num_posts=40)
+
+
+def crawl(network):
+    """Read a network in every way the replay has to reproduce"""
+    return {
+        "streamed": list(network.iter_feed(page_size=None, stream=True)),
+        "paged": list(network.iter_feed(page_size=15)),
+        "posts": list(network.iter_all_posts(concurrency=8)),
+        "users": network.get_all_users(),
+    }
+
+
+@pytest.fixture
+def recorded(sim, nid, tmp_path):
+    """Path of a log of a crawl of ``sim``, and the crawl's results"""
+    path = str(tmp_path / "crawl.log.gz")
+    recorder = RecordingAdapter(path)
+    p = Piazza(base_url=sim.url, adapter=recorder)
+    p.user_login("student@example.edu", "password")
+    results = crawl(p.network(nid))
+    recorder.close()
+    return path, results
+
+
+def replay(path, nid, **kwargs):
+    p = Piazza(adapter=ReplayAdapter(path, latency=0), **kwargs)
+    p.user_login("anyone@example.edu", "anything")
+    return p.network(nid)
+
+
+def test_record_and_replay(sim, nid, recorded):
+    path, results = recorded
+    records = list(read_log(path))
+    assert {record["method"] for record in records} == \
+        {"network.get_my_feed", "content.get", "network.get_all_users"}
+    assert all("aid=" not in record["url"] for record in records)
+    assert sum(record["method"] == "content.get" for record in records) == 40
+    assert len(ReplayAdapter(path)) == len(records)
+
+    requests = sim.requests.copy()
+    assert crawl(replay(path, nid)) == results
+    # Nothing was sent to the simulator
+    assert sim.requests == requests
+
+
+def test_unrecorded_requests_raise(recorded, nid):
+    path, results = recorded
+    network = replay(path, nid)
+    post = results["posts"][0]
+    assert network.get_post(post["id"]) == post
+    with pytest.raises(NotRecordedError) as info:
+        network.get_post(41)
+    assert isinstance(info.value, RequestError)
+    assert "content.get" in str(info.value)
+
+
+def test_read_log_rejects_other_files(tmp_path):
+    path = tmp_path / "other.log"
+    path.write_text('{"format": "something else"}\n')
+    with pytest.raises(ValueError):
+        list(read_log(str(path)))
@@ -0,0 +1,127 @@
+import math
+
+import pytest
+
+from piazza_api.network import SyncResult
+from piazza_api.search import SearchIndex, post_text, tokenize
+from piazza_api.synthetic import make_post
+
+
+def post(nr, subject, content="", folders=(), tags=(), children=()):
+    return {"id": "p{}".format(nr), "nr": nr, "folders": list(folders),
+            "tags": list(tags), "children": list(children),
+            "history": [{"subject": subject, "content": content}]}
+
+
+def bm25(posts, query, k1=1.2, b=0.75):
+    """Scores of ``posts`` for ``query``, computed from scratch"""
+    docs = {p["id"]: tokenize(post_text(p)) for p in posts}
+    average = sum(map(len, docs.values())) / len(docs)
+    scores = {}
+    for term in set(tokenize(query)):
+        having = [cid for cid, words in docs.items() if term in words]
+        idf = math.log(1 + (len(docs) - len(having) + 0.5) /
+                       (len(having) + 0.5))
+        for cid in having:
+            tf = docs[cid].count(term)
+            norm = k1 * (1 - b + b * len(docs[cid]) / average)
+            scores[cid] = scores.get(cid, 0) + \
+                idf * tf * (k1 + 1) / (tf + norm)
+    return scores
+
+
+def assert_scores(index, posts, query):
+    hits = index.search(query, limit=None)
+    expected = bm25(posts, query)
+    assert {hit.id for hit in hits} == set(expected)
+    for hit in hits:
+        assert hit.score == pytest.approx(expected[hit.id])
+    assert [hit.score for hit in hits] == \
+        sorted((hit.score for hit in hits), reverse=True)
+
+
+def test_tokenize():
+    assert tokenize("<p>Why is the <b>Linked</b>&nbsp;list slow?</p>") == \
+        ["why", "linked", "list", "slow"]
+    assert tokenize(None) == []
+
+
+def test_post_text_handles_none_fields():
+    assert post_text(post(1, None, None)) == " "
+    index = SearchIndex()
+    index.add(post(1, None, "linked list"))
+    index.add(post(2, "linked list", None,
+                   children=[{"subject": None},
+                             {"history": [{"content": None}]}]))
+    assert {hit.id: hit.subject for hit in index.search("list")} == \
+        {"p1": "", "p2": "linked list"}
+
+
+def test_ranking():
+    posts = [post(1, "linked list", "a list of lists, list list list"),
+             post(2, "linked list", "why does my list crash"),
+             post(3, "exam", "when is the exam"),
+             post(4, "pointer", "a very long question about a pointer "
+                  "that mentions list once " + "and more words " * 20)]
+    index = SearchIndex()
+    assert index.add_all(posts) == 4
+    hits = index.search("list")
+    # More occurrences first; long posts are penalized
+    assert [hit.nr for hit in hits] == [1, 2, 4]
+    assert hits[0].subject == "linked list"
+    assert [hit.nr for hit in index.search("list", limit=2)] == [1, 2]
+    assert index.search("nothing") == []
+    assert index.search("the of") == []
+    assert_scores(index, posts, "linked list exam pointer")
+
+
+def test_filters():
+    index = SearchIndex()
+    index.add_all([post(1, "list", folders=["hw1"], tags=["student"]),
+                   post(2, "list", folders=["hw2"], tags=["instructor"]),
+                   post(3, "list", folders=["hw1", "hw2"])])
+    assert {hit.nr for hit in index.search("list", folders=["hw1"])} == \
+        {1, 3}
+    assert {hit.nr for hit in index.search("list", tags=["student",
+                                                         "instructor"])} \
+        == {1, 2}
+    assert [hit.nr for hit in index.search("list", folders=["hw2"],
+                                           tags=["instructor"])] == [2]
+    assert index.search("list", folders=[]) == []
+
+
+def test_incremental_updates_match_a_fresh_index():
+    posts = [make_post(nr) for nr in range(1, 201)]
+    index = SearchIndex()
+    index.add_all(posts)
+    query = " ".join(tokenize(post_text(posts[0]))[:5])
+
+    # Replace some posts and remove others
+    for p in posts[:20]:
+        p["history"][0]["content"] += " segfault"
+        index.add(p)
+    for p in posts[180:]:
+        index.remove(p["id"])
+    index.remove("missing")
+    kept = posts[:180]
+    assert len(index) == 180
+    assert posts[0]["id"] in index and posts[190]["id"] not in index
+    assert_scores(index, kept, query)
+    assert_scores(index, kept, "segfault")
+
+    fresh = SearchIndex()
+    fresh.add_all(kept)
+    assert index.search(query, limit=None) == fresh.search(query,
+                                                           limit=None)
+
+
+def test_apply_sync():
+    index = SearchIndex()
+    index.add_all([post(1, "linked list"), post(2, "exam")])
+    index.apply_sync(SyncResult(changed=[post(1, "pointer"),
+                                         post(3, "linked list")],
+                                deleted=["p2"], state={}))
+    assert len(index) == 2
+    assert [hit.nr for hit in index.search("list")] == [3]
+    assert [hit.nr for hit in index.search("pointer")] == [1]
+    assert index.search("exam") == []
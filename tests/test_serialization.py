@@ -0,0 +1,74 @@
+import sys
+
+import pytest
+
+from piazza_api import serialization
+from piazza_api.serialization import JSONBackend, get_backend
+
+DOCUMENT = {"result": {"subject": "Café 中文", "nr": 1, "tags": [None]},
+            "error": None}
+
+
+@pytest.fixture
+def installed(monkeypatch):
+    """Pretend only the given backends are installed"""
+    monkeypatch.setattr(serialization, "_default", None)
+
+    def installed(*names):
+        for name in ("orjson", "ujson"):
+            if name not in names:
+                monkeypatch.setitem(sys.modules, name, None)
+    return installed
+
+
+@pytest.mark.parametrize("names, expected", [
+    (("orjson", "ujson"), "orjson"),
+    (("orjson",), "orjson"),
+    (("ujson",), "ujson"),
+    ((), "json"),
+])
+def test_fastest_installed_backend_is_the_default(installed, names,
+                                                  expected):
+    for name in names:
+        pytest.importorskip(name)
+    installed(*names)
+    backend = get_backend()
+    assert backend.name == expected
+    # Chosen once
+    assert get_backend() is backend
+
+
+@pytest.mark.parametrize("name", ["orjson", "ujson", "json"])
+def test_backends_round_trip(name):
+    pytest.importorskip(name)
+    backend = get_backend(name)
+    assert backend.name == name
+    assert backend.loads(backend.dumps(DOCUMENT)) == DOCUMENT
+    with pytest.raises(ValueError):
+        backend.loads(b'{"result": ')
+
+
+def test_named_and_custom_backends(installed):
+    installed()
+    with pytest.raises(ImportError):
+        get_backend("orjson")
+    with pytest.raises(ValueError) as info:
+        get_backend("simplejson")
+    assert "orjson, ujson, json" in str(info.value)
+    custom = JSONBackend("custom", repr, eval)
+    assert get_backend(custom) is custom
+    assert repr(custom) == "JSONBackend('custom')"
+
+
+@pytest.mark.simulator(num_posts=5)
+def test_clients_use_the_given_backend(login):
+    calls = []
+
+    def loads(data):
+        calls.append(len(data))
+        return get_backend("json").loads(data)
+
+    network = login(json_backend=JSONBackend("counting", get_backend(
+        "json").dumps, loads))
+    assert network.get_post(1)["nr"] == 1
+    assert calls
@@ -0,0 +1,114 @@
+"""Thread-safety stress tests of the shared session and cookie jar"""
+import copy
+import sys
+import threading
+
+import pytest
+import requests
+
+from piazza_api.session import LockedCookieJar, ThreadLocalSessions
+
+THREADS = 32
+REQUESTS = 50
+
+
+@pytest.fixture(autouse=True)
+def frequent_switches():
+    """Switch threads much more often, so that races show up"""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def run_threads(target, count, *args):
+    errors = []
+
+    def run(i):
+        try:
+            target(i, *args)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+class Churn(object):
+    """Keeps storing cookies in ``jar`` until stopped, as responses do"""
+    def __init__(self, jar):
+        self.jar = jar
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+
+    def run(self):
+        i = 0
+        originals = list(self.jar)
+        while not self.stop.is_set():
+            for cookie in originals:
+                # Stored again with the same value, as by a Set-Cookie
+                self.jar.set_cookie(copy.copy(cookie))
+            # Some come and go
+            name = "churn{}".format(i % 20)
+            self.jar.set(name, None if name in self.jar else str(i))
+            i += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop.set()
+        self.thread.join()
+
+
+def test_locked_cookie_jar_survives_concurrent_changes():
+    jar = LockedCookieJar()
+    jar.set("session_id", "token")
+
+    def read(i):
+        for _ in range(2000):
+            assert jar.get("session_id") == "token"
+            assert jar.get_dict()["session_id"] == "token"
+            assert "session_id" in jar
+            assert dict(jar.items())["session_id"] == "token"
+            jar.copy()
+
+    with Churn(jar):
+        errors = run_threads(read, 8)
+    assert errors == []
+
+
+def test_thread_local_sessions_share_cookies_and_pool():
+    shared = requests.Session()
+    sessions = ThreadLocalSessions(shared)
+    assert isinstance(shared.cookies, LockedCookieJar)
+    seen = []
+
+    def get(i):
+        seen.append(sessions.get())
+
+    assert run_threads(get, 8) == []
+    assert sessions.get() is shared
+    assert len(set(map(id, seen))) == 8
+    assert all(s.cookies is shared.cookies and
+               s.adapters is shared.adapters for s in seen)
+
+
+@pytest.mark.simulator(num_posts=THREADS * REQUESTS)
+def test_concurrent_requests_keep_csrf_tokens(sim, login):
+    network = login(pool_maxsize=THREADS)
+
+    def fetch(i):
+        for n in range(REQUESTS):
+            nr = i * REQUESTS + n + 1
+            assert network.get_post(nr)["nr"] == nr
+
+    with Churn(network._rpc.session.cookies):
+        errors = run_threads(fetch, THREADS)
+    assert errors == []
+    assert sim.requests["content.get"] == THREADS * REQUESTS
@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+import requests
+
+from piazza_api import Piazza
+from piazza_api.exceptions import AuthenticationError, RequestError
+from piazza_api.metrics import Metrics
+from piazza_api.retry import RetryPolicy
+from piazza_api.simulator import UID, Faults, lognormal
+
+pytestmark = pytest.mark.simulator(
+    num_posts=300, num_users=50,
+    accounts={"student@example.edu": "password"})
+
+
+def test_login_checks_accounts(sim, nid):
+    p = Piazza(base_url=sim.url)
+    with pytest.raises(AuthenticationError) as info:
+        p.user_login("student@example.edu", "wrong")
+    assert "Email or password incorrect" in str(info.value)
+    p.user_login("student@example.edu", "password")
+    assert [c["nid"] for c in p.get_user_classes()] == [nid]
+    assert p.get_user_profile()["user_id"] == UID
+
+
+def test_unknown_paths_are_not_found(sim):
+    assert requests.get(sim.url + "/nowhere").status_code == 404
+
+
+def test_reads(network):
+    posts = list(network.iter_all_posts(prefetch=8))
+    assert len(posts) == 300
+    assert len({post["id"] for post in posts}) == 300
+    assert network.get_post(posts[0]["nr"]) == posts[0]
+    assert len(network.get_all_users()) == 50
+    assert len(list(network.iter_all_users())) == 50
+    assert network.get_users(["u000001"])[0]["id"] == "u000001"
+    assert len(network.get_feed(limit=20)["feed"]) == 20
+    for item in network.search_feed("homework"):
+        assert "homework" in (item["subject"] + item["snippet"]).lower()
+    folder = network.get_filtered_feed(network.feed_filters.folder("hw1"))
+    assert all("hw1" in item["folders"] for item in folder["feed"])
+    assert network.get_statistics()["total_users"] == 50
+
+
+def test_write_paths(network):
+    created = network.create_post("question", ["hw1"], "Hello sim",
+                                  "<p>body</p>")
+    assert network.get_post(created["nr"])["id"] == created["id"]
+    followup = network.create_followup(created, "a followup")
+    network.create_reply(followup, "a reply")
+    network.update_post(created, "new content")
+    network.create_instructor_answer(created, "an answer", 0)
+    network.add_feedback(created)
+    network.resolve_post(created)
+    network.pin_post(created)
+
+    post = network.get_post(created["nr"])
+    assert post["history_size"] == 2
+    assert post["history"][0]["subject"] == "new content"
+    followups = [c for c in post["children"] if c["id"] == followup["id"]]
+    assert followups[0]["children"][0]["subject"] == "a reply"
+    assert post["pin"] == 1
+
+    network.mark_as_duplicate(5, created["nr"], "same question")
+    network.delete_post(created)
+    with pytest.raises(RequestError) as info:
+        network.get_post(created["nr"])
+    assert "cannot be found" in str(info.value)
+
+
+@pytest.mark.simulator(
+    num_posts=200, seed=1,
+    faults=Faults(latency=lognormal(0.002, 0.5), error_rate=0.2,
+                  retry_after=0, bytes_per_second=200000))
+def test_retries_recover_from_faults(sim, login):
+    metrics = Metrics()
+    network = login(metrics=metrics,
+                    retry_policy=RetryPolicy(max_attempts=10, backoff=0.001))
+    posts = list(network.iter_all_posts(prefetch=16))
+    assert len(posts) == 200
+    assert sim.errors["content.get"] > 0
+    assert metrics.snapshot()["content.get"]["retries"] == \
+        sim.errors["content.get"]
+
+
+@pytest.mark.simulator(num_posts=10,
+                       faults=Faults(error_rate=1.0, error_statuses=(503,),
+                                     methods=["content.get"]))
+def test_faults_only_apply_to_their_methods(sim, login):
+    network = login(retry_policy=RetryPolicy(max_attempts=2, backoff=0))
+    assert len(network.get_feed(limit=10)["feed"]) == 10
+    with pytest.raises(RequestError):
+        network.get_post(1)
+    assert sim.errors == {"content.get": 2}
+
+
+@pytest.mark.simulator(num_posts=100)
+def test_async_client(sim, nid):
+    pytest.importorskip("aiohttp")
+    from piazza_api import AsyncPiazza
+
+    async def run():
+        async with AsyncPiazza(base_url=sim.url) as p:
+            await p.user_login("student@example.edu", "password")
+            network = p.network(nid)
+            posts = [post async for post in
+                     network.iter_all_posts(prefetch=8)]
+            return posts, await network.get_all_users()
+
+    posts, users = asyncio.run(run())
+    assert len(posts) == 100
+    assert len(users) == 200
+
+
+@pytest.mark.simulator(num_posts=10)
+def test_async_client_session_options(sim, nid):
+    pytest.importorskip("aiohttp")
+    from piazza_api import AsyncPiazza
+
+    with pytest.raises(TypeError) as info:
+        AsyncPiazza(base_url=sim.url, pool_maxsize=4, adapter=None,
+                    pool_block=True)
+    assert "adapter, pool_block" in str(info.value)
+    with pytest.raises(TypeError):
+        Piazza(base_url=sim.url, pool_size=4)
+
+    async def run():
+        async with AsyncPiazza(base_url=sim.url, pool_maxsize=4,
+                               keep_alive=5) as p:
+            await p.user_login("student@example.edu", "password")
+            return await p.network(nid).get_post(1)
+
+    assert asyncio.run(run())["nr"] == 1
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from piazza_api.stream import JSONArrayStream, iter_json_array
+
+PATH = ("result", "feed")
+
+ITEMS = [
+    {"id": "p1", "subject": "Café 中文 \U0001f600",
+     "folders": ["hw1", "été"]},
+    {"id": "p2", "subject": 'A "quoted" \\ back\\slash\n\ttab  ',
+     "snippet": "</p>\u0000"},
+    {"id": "p3", "nr": -0, "score": 1.5e10, "ratio": -12.25,
+     "big": 12345678901234567890, "flags": [True, False, None]},
+    {"id": "p4", "children": [{"id": "c1", "children": [[], {}, [[1]]]}]},
+    "just a string",
+    12.5,
+    None,
+]
+
+DOCUMENTS = {
+    "feed": {"result": {"feed": ITEMS, "more": True}, "error": None},
+    "siblings first": {"error": None, "aid": "é",
+                       "result": {"sort": "updated", "feed": ITEMS}},
+    "empty feed": {"result": {"feed": []}, "error": None},
+    "null result": {"result": None, "error": "Café not found"},
+    "null feed": {"result": {"feed": None}, "error": None},
+    "no feed": {"result": {"drafts": {"feed": [1]}}, "error": None},
+    "empty": {},
+}
+
+
+def expected(document):
+    result = document.get("result")
+    feed = result.get("feed") if isinstance(result, dict) else None
+    siblings = {k: v for k, v in document.items() if k != "result"}
+    return feed if isinstance(feed, list) else [], siblings
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, None])
+@pytest.mark.parametrize("ensure_ascii", [False, True])
+@pytest.mark.parametrize("name", sorted(DOCUMENTS))
+def test_chunks_decode_like_json_loads(name, ensure_ascii, size):
+    text = json.dumps(DOCUMENTS[name], ensure_ascii=ensure_ascii, indent=1)
+    data = text.encode("utf-8")
+    siblings = {}
+    items = list(iter_json_array(chunked(data, size or len(data)), PATH,
+                                 siblings))
+    assert (items, siblings) == expected(json.loads(data))
+
+
+@pytest.mark.parametrize("size", [1, 3])
+def test_str_chunks(size):
+    text = json.dumps(DOCUMENTS["feed"], ensure_ascii=False)
+    assert list(iter_json_array(chunked(text, size), PATH)) == ITEMS
+
+
+def test_items_are_returned_as_soon_as_complete():
+    stream = JSONArrayStream(PATH)
+    assert stream.feed(b'{"result": {"feed": [{"id": 1}, {"i') == \
+        [{"id": 1}]
+    # A number is only complete once the next character has arrived
+    assert stream.feed(b'd": 2}, 1') == [{"id": 2}]
+    assert stream.feed(b'5') == []
+    assert stream.feed(b']}, "error": null}') == [15]
+    assert stream.close() == []
+    assert stream.siblings == {"error": None}
+
+
+@pytest.mark.parametrize("data", [
+    b'{"result": {"feed": [1, 2',
+    b'{"result": {"feed": [1 2]}}',
+    b'{"result": {"feed": [1, 2]}',
+    b'["not", "an", "object"]',
+    b'{"result": {"feed": [tru]}}',
+])
+def test_invalid_documents_raise(data):
+    with pytest.raises(ValueError):
+        list(iter_json_array(chunked(data, 2), PATH))
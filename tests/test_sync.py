@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from piazza_api.cache import PostCache
+
+pytestmark = pytest.mark.simulator(num_posts=20)
+
+
+def test_sync_reports_changed_posts(network, login):
+    result = network.sync()
+    assert len(result.changed) == 20
+    assert network.sync(result.state).changed == []
+
+    login().update_post(network.get_post(3), "edited")
+    result = network.sync(result.state, concurrency=4)
+    assert [post["nr"] for post in result.changed] == [3]
+
+
+@pytest.mark.parametrize("concurrency", [None, 4])
+def test_sync_bypasses_post_cache(login, concurrency):
+    network = login(post_cache=PostCache())
+    state = network.sync().state
+    post = network.get_post(3)
+
+    login().update_post(post, "edited elsewhere")
+    result = network.sync(state, concurrency=concurrency)
+    assert [p["history"][0]["subject"] for p in result.changed] == \
+        ["edited elsewhere"]
+    assert network.sync(result.state).changed == []
+    # The cache was refreshed too
+    assert network.get_post(3)["history"][0]["subject"] == \
+        "edited elsewhere"
+
+
+def test_async_sync_bypasses_post_cache(sim, nid, login):
+    pytest.importorskip("aiohttp")
+    from piazza_api import AsyncPiazza
+
+    async def run():
+        async with AsyncPiazza(base_url=sim.url,
+                               post_cache=PostCache()) as p:
+            await p.user_login("student@example.edu", "password")
+            network = p.network(nid)
+            state = (await network.sync()).state
+            post = await network.get_post(3)
+            login().update_post(post, "edited elsewhere")
+            return await network.sync(state, concurrency=4)
+
+    result = asyncio.run(run())
+    assert [p["history"][0]["subject"] for p in result.changed] == \
+        ["edited elsewhere"]
@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+
+from piazza_api.exceptions import RequestError
+from piazza_api.tracing import Tracer, current_span
+
+pytestmark = pytest.mark.simulator(num_posts=20)
+
+
+@pytest.fixture
+def spans():
+    """Finished spans, in the order they ended"""
+    return []
+
+
+@pytest.fixture
+def traced_network(login, spans):
+    return login(tracer=Tracer(spans.append))
+
+
+def named(spans, name):
+    return [span for span in spans if span.name == name]
+
+
+def assert_children(parent, spans):
+    """Check ``spans`` are children of ``parent`` in its trace"""
+    assert spans
+    for span in spans:
+        assert span.parent is parent
+        assert span.trace_id == parent.trace_id
+        assert span.span_id != parent.span_id
+        assert span.duration <= parent.duration
+
+
+def test_spans_nest(spans):
+    tracer = Tracer(spans.append)
+    with tracer.span("outer", a=1) as outer:
+        assert current_span() is outer
+        with tracer.span("inner") as inner:
+            tracer.annotate(b=2)
+            assert current_span() is inner
+        assert current_span() is outer
+    assert current_span() is None
+    assert [span.name for span in spans] == ["inner", "outer"]
+    assert inner.parent is outer and outer.parent is None
+    assert inner.trace_id == outer.trace_id == outer.span_id
+    assert (outer.attributes, inner.attributes) == ({"a": 1}, {"b": 2})
+    with pytest.raises(ValueError):
+        with tracer.span("failing"):
+            raise ValueError
+    assert isinstance(spans[-1].error, ValueError)
+
+
+def test_requests_are_children_of_operations(traced_network, spans, nid):
+    post = traced_network.get_post(3)
+    operation, = named(spans, "Network.get_post")
+    assert operation.parent is None
+    assert operation.attributes == {"nid": nid, "cid": 3}
+    request, = named(spans, "piazza.request")
+    assert_children(operation, [request])
+    assert request.attributes["method"] == "content.get"
+    assert request.attributes["status"] == 200
+
+    del spans[:]
+    traced_network.resolve_post(post)
+    traced_network.pin_post(post, unpin=True)
+    resolve, = named(spans, "Network.resolve_post")
+    pin, = named(spans, "Network.pin_post")
+    assert resolve.attributes == {"nid": nid, "post": post["id"]}
+    assert pin.attributes == {"nid": nid, "post": post["id"],
+                              "unpin": True}
+    requests = named(spans, "piazza.request")
+    assert [r.parent for r in requests] == [resolve, pin]
+
+
+def test_nested_operations(traced_network, spans):
+    traced_network.mark_as_duplicate(5, 6)
+    duplicate, = named(spans, "Network.mark_as_duplicate")
+    gets = named(spans, "Network.get_post")
+    assert_children(duplicate, gets)
+    for get in gets:
+        request, = [s for s in spans if s.parent is get]
+        assert request.trace_id == duplicate.span_id
+
+
+def test_generator_spans_cover_worker_threads(traced_network, spans):
+    posts = traced_network.iter_all_posts(concurrency=4)
+    assert len(list(posts)) == 20
+    operation, = named(spans, "Network.iter_all_posts")
+    feeds = named(spans, "Network.iter_feed")
+    assert_children(operation, feeds)
+    requests = named(spans, "piazza.request")
+    assert len(requests) > 20
+    for request in requests:
+        assert request.parent is not None
+        assert request.trace_id == operation.span_id
+    gets = named(spans, "Network.get_post")
+    assert len(gets) == 20
+    assert_children(operation, gets)
+    assert 0 < operation.attributes["busy_seconds"] <= operation.duration
+    assert current_span() is None
+
+
+def test_errors_end_their_spans(traced_network, spans):
+    with pytest.raises(RequestError):
+        traced_network.get_post(999)
+    operation, = named(spans, "Network.get_post")
+    request, = named(spans, "piazza.request")
+    assert isinstance(operation.error, RequestError)
+    assert request.parent is operation
+    assert current_span() is None
+
+
+def test_async_spans_nest(sim, nid, spans):
+    pytest.importorskip("aiohttp")
+    from piazza_api import AsyncPiazza
+
+    async def run():
+        async with AsyncPiazza(base_url=sim.url,
+                               tracer=Tracer(spans.append)) as p:
+            await p.user_login("student@example.edu", "password")
+            network = p.network(nid)
+            del spans[:]
+            posts = [post async for post in
+                     network.iter_all_posts(concurrency=4)]
+            post, _ = await asyncio.gather(network.get_post(1),
+                                           network.resolve_post(posts[0]))
+            assert current_span() is None
+            return posts
+
+    assert len(asyncio.run(run())) == 20
+    operation, = named(spans, "Network.iter_all_posts")
+    for request in named(spans, "piazza.request"):
+        assert request.parent is not None
+        assert request.parent.trace_id == request.trace_id
+    posts_requests = [s for s in spans if s.trace_id == operation.span_id
+                      and s.name == "piazza.request"]
+    assert len(posts_requests) > 20
+    # Concurrent operations get separate traces
+    get, = [s for s in named(spans, "Network.get_post")
+            if s.parent is None]
+    resolve, = named(spans, "Network.resolve_post")
+    for span in (get, resolve):
+        assert span.parent is None
+        assert_children(span, [s for s in spans if s.parent is span])